@@ -6,12 +6,9 @@ import jwt
 import json
 from datetime import datetime
 from fastapi import Request
+from globals import denied_log
 
 
-# Denied Log
-with open("denied.json") as fd:
-    denied = json.load(fd)
-
 def set_up():
     """Sets up configuration for the app"""
 
@@ -26,7 +23,7 @@ def log_denied_request(request: Request, endpoint_name: str):
     print("Hello from `log_denied_request`")
     # Log who sends the request
     ip = request.client.host
-    denied.append(
+    denied_log.write(
         {
             "Request": endpoint_name,
             "ip": ip,
@@ -37,10 +34,6 @@ def log_denied_request(request: Request, endpoint_name: str):
             "cookies": request.cookies
         }
 )
-    with open("denied.json", "a") as json_file:
-        json.dump(denied, json_file, indent=4, separators=(",", ": "))
-
-    print("Wrote to denied.json")
 
 class VerifyToken:
     """Does all the token verification using PyJWT"""
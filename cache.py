@@ -0,0 +1,302 @@
+import asyncio, redis, threading, time, os, uuid
+import simplejson as json
+from collections import OrderedDict
+
+
+class LocalCache:
+    """Bounded in-process LRU cache sitting in front of Redis\n
+    Entries expire after `ttl` seconds and the least recently used ones are evicted once the
+    cached keys and values take more than `max_bytes`"""
+
+    def __init__(self, max_bytes: int, ttl: float):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+
+        self._entries = OrderedDict()  # key -> (expires, value)
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+        self._stats = {
+            "hits": 0,
+            "misses": 0,
+            "expired": 0,
+            "evicted": 0,
+            "invalidated": 0,
+        }
+
+    @staticmethod
+    def _size(key: str, value: bytes):
+        return len(key) + len(value)
+
+    def _drop(self, key: str):
+        """Removes `key`, the lock has to be held"""
+        expires, value = self._entries.pop(key)
+        self._bytes -= self._size(key, value)
+
+    def get(self, key: str):
+        """Returns the cached value or `None` if it is missing or expired"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._stats["misses"] += 1
+                return None
+
+            if entry[0] <= time.monotonic():
+                self._drop(key)
+                self._stats["expired"] += 1
+                self._stats["misses"] += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self._stats["hits"] += 1
+            return entry[1]
+
+    def set(self, key: str, value: bytes, ttl: float = None):
+        """Caches `value` for `ttl` seconds (defaults to the cache `ttl`)\n
+        Values larger than the whole cache are not stored"""
+        size = self._size(key, value)
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            if size > self.max_bytes:
+                return
+
+            self._entries[key] = (time.monotonic() + (ttl or self.ttl), value)
+            self._bytes += size
+
+            while self._bytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+                self._stats["evicted"] += 1
+
+    def delete(self, key: str):
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+                self._stats["invalidated"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._stats["invalidated"] += len(self._entries)
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        """Snapshot of the cache usage for monitoring"""
+        with self._lock:
+            return {
+                "keys": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "ttl": self.ttl,
+                **self._stats,
+            }
+
+
+class PubSubChannel:
+    """Base for messages shared by every worker through Redis pub/sub\n
+    `send` publishes a payload to the other workers and `handle` is called with every payload received from them,
+    the listener thread is started lazily by the first `ensure_listening` call in each worker process
+    """
+
+    def __init__(self, client: redis.Redis, channel: str):
+        self.client = client
+        self.channel = channel
+        self.sender = uuid.uuid4().hex
+
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def ensure_listening(self):
+        """Starts the listener thread once per process (workers may be forked after import)"""
+        if self._pid == os.getpid():
+            return
+
+        with self._lock:
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                self.sender = uuid.uuid4().hex
+                threading.Thread(
+                    target=self._listen, name=f"pubsub-{self.channel}", daemon=True
+                ).start()
+
+    def send(self, payload: dict):
+        try:
+            self.client.publish(
+                self.channel, json.dumps({"sender": self.sender, **payload})
+            )
+        except redis.RedisError as err:
+            print(f"[PubSub] Could not publish to '{self.channel}': {err}")
+
+    def handle(self, payload: dict):
+        raise NotImplementedError
+
+    def disconnected(self):
+        """Called when the listener lost its connection, messages may have been missed"""
+
+    def _receive(self, message):
+        payload = json.loads(message["data"])
+        if payload["sender"] != self.sender:
+            self.handle(payload)
+
+    def _listen(self):
+        while True:
+            try:
+                pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.channel)
+                for message in pubsub.listen():
+                    self._receive(message)
+            except redis.RedisError as err:
+                print(f"[PubSub] Listener of '{self.channel}' disconnected: {err}")
+                self.disconnected()
+                time.sleep(1)
+
+
+class Invalidator(PubSubChannel):
+    """Keeps the `LocalCache` of every worker in sync through Redis pub/sub\n
+    `publish` drops keys locally and tells the other workers to drop them as well"""
+
+    CLEAR = "*"
+
+    def __init__(self, client: redis.Redis, local: LocalCache, channel: str):
+        super().__init__(client, channel)
+        self.local = local
+
+    def _drop(self, keys):
+        for key in keys:
+            if key == self.CLEAR:
+                self.local.clear()
+            else:
+                self.local.delete(key)
+
+    def publish(self, *keys: str):
+        """Drops `keys` from the local cache and from every other worker's with a single message"""
+        self._drop(keys)
+        self.send({"keys": keys})
+
+    def handle(self, payload: dict):
+        self._drop(payload["keys"])
+
+    def disconnected(self):
+        # Invalidations may have been missed while disconnected
+        self.local.clear()
+
+
+class SingleFlight:
+    """Lets a single request compute a missing cache key while the identical requests wait for its result\n
+    Requests of the same worker wait for the same future. Across workers the computing one holds a short Redis lock
+    (`lock:<key>`), the others poll the cache until the key is written or the lock is gone, then compute it themselves
+    if it is still missing"""
+
+    # Deletes the lock only if it is still the one taken by this request
+    _release_script = """
+    if redis.call('GET', KEYS[1]) == ARGV[1] then
+        return redis.call('DEL', KEYS[1])
+    end
+    return 0
+    """
+
+    def __init__(self, client: redis.Redis, lock_timeout: float, poll_interval: float):
+        self.client = client
+        self.lock_timeout = lock_timeout
+        self.poll_interval = poll_interval
+
+        self._flights = {}  # key -> future of the request computing it
+        self._release = (
+            None if client is None else client.register_script(self._release_script)
+        )
+
+        self._stats = {
+            "computed": 0,
+            "coalesced": 0,
+            "waited": 0,
+            "timeouts": 0,
+        }
+
+    def running(self, key: str):
+        """Whether a request of this worker is computing `key`"""
+        return key in self._flights
+
+    async def do(self, key: str, compute, lookup):
+        """Result of `await compute()` for `key`, computed once for all the concurrent requests\n
+        `lookup()` returns the cached result written by another worker, `None` while it is missing
+        """
+        while True:
+            flight = self._flights.get(key)
+            if flight is None:
+                break
+
+            self._stats["coalesced"] += 1
+            try:
+                return await asyncio.shield(flight)
+            except asyncio.CancelledError:
+                # The computing request went away, take over unless this request was cancelled itself
+                if not flight.cancelled():
+                    raise
+
+        flight = asyncio.get_running_loop().create_future()
+        self._flights[key] = flight
+        try:
+            result = await self._locked(key, compute, lookup)
+        except asyncio.CancelledError:
+            flight.cancel()
+            raise
+        except Exception as err:
+            flight.set_exception(err)
+            # Waiting requests get the error as well, there may be none to retrieve it
+            flight.exception()
+            raise
+        else:
+            flight.set_result(result)
+            return result
+        finally:
+            del self._flights[key]
+
+    async def _locked(self, key: str, compute, lookup):
+        if self.client is None:
+            self._stats["computed"] += 1
+            return await compute()
+
+        lock = f"lock:{key}"
+        token = uuid.uuid4().hex
+        deadline = time.monotonic() + self.lock_timeout
+        try:
+            while not self.client.set(
+                lock, token, nx=True, px=int(self.lock_timeout * 1000)
+            ):
+                self._stats["waited"] += 1
+                await asyncio.sleep(self.poll_interval)
+                result = lookup()
+                if result is not None:
+                    return result
+                if time.monotonic() >= deadline:
+                    # Computed without the lock rather than waiting on a stuck request
+                    self._stats["timeouts"] += 1
+                    token = None
+                    break
+        except redis.RedisError as err:
+            print(f"[SingleFlight] Could not lock '{key}': {err}")
+            token = None
+
+        try:
+            if token is not None:
+                # Another worker may have written it between the cache miss and the lock
+                result = lookup()
+                if result is not None:
+                    return result
+
+            self._stats["computed"] += 1
+            return await compute()
+        finally:
+            if token is not None:
+                try:
+                    self._release(keys=[lock], args=[token])
+                except redis.RedisError as err:
+                    print(f"[SingleFlight] Could not unlock '{key}': {err}")
+
+    def stats(self):
+        """Snapshot of the coalescing for monitoring"""
+        return {
+            "in_flight": len(self._flights),
+            "lock_timeout": self.lock_timeout,
+            **self._stats,
+        }
@@ -1,9 +1,11 @@
-import redis, time
+import asyncio, functools, inspect, redis, time, zlib
 import simplejson as json
 from decimal import Decimal
 from fastapi.security import HTTPBearer
-from fastapi import Request
+from fastapi import Request, Response
 from datetime import datetime
+from cache import LocalCache, Invalidator, SingleFlight
+from request_log import JsonlWriter
 
 
 token_auth_scheme = HTTPBearer()
@@ -12,13 +14,22 @@ token_auth_scheme = HTTPBearer()
 with open("config.json", "r") as f:
     config = json.load(f)
 
-# Requests Log
-with open("requests.json") as fp:
-    log = json.load(fp)
+# Requests and Denied Logs, written as JSON lines by a background thread
+log_config = config.get("LOGGING", {})
 
-# Denied Log
-with open("denied.json") as fd:
-    denied = json.load(fd)
+
+def _log_writer(filename: str):
+    return JsonlWriter(
+        path=f'{log_config.get("DIRECTORY", "logs")}/{filename}',
+        max_bytes=log_config.get("MAX_BYTES", 10 * 1024 * 1024),
+        backups=log_config.get("BACKUPS", 5),
+        queue_size=log_config.get("QUEUE_SIZE", 10000),
+        flush_interval=log_config.get("FLUSH_INTERVAL", 1),
+    )
+
+
+request_log = _log_writer("requests.jsonl")
+denied_log = _log_writer("denied.jsonl")
 
 
 # Initiate Redis connection
@@ -28,6 +39,41 @@ redis_client = redis.Redis(
     password=config["REDIS"]["PASSWORD"],
 )
 
+# Keys cached with `tags` are invalidated by the write endpoints, so they can be kept much longer
+tagged_expiry = config["REDIS"].get("TAGGED_EXPIRY", config["REDIS"]["EXPIRY"])
+
+# Keys cached with `stale_after` are still served `REDIS.STALE_EXPIRY` seconds past it while they are refreshed
+stale_expiry = config["REDIS"].get("STALE_EXPIRY", 0)
+
+# Per endpoint overrides of the settings above, by cache key prefix (see `cache_policy`)
+cache_policies = config["REDIS"].get("CACHE_POLICIES", {})
+
+# Start of the values compressed by a `COMPRESS` policy, JSON never starts with it
+COMPRESSED = b"\x00zlib:"
+
+# In-process cache in front of Redis, kept in sync between workers with pub/sub
+l1_config = config["REDIS"].get("L1", {})
+local_cache = None
+invalidator = None
+if l1_config.get("ENABLED", 0) == 1:
+    local_cache = LocalCache(
+        max_bytes=l1_config.get("MAX_BYTES", 16 * 1024 * 1024),
+        ttl=l1_config.get("EXPIRY", 5),
+    )
+    invalidator = Invalidator(
+        redis_client,
+        local_cache,
+        channel=l1_config.get("CHANNEL", "surftimer:invalidate"),
+    )
+
+# Identical concurrent cache misses are computed once, in this worker and across workers with a short Redis lock
+singleflight_config = config["REDIS"].get("SINGLEFLIGHT", {})
+flights = SingleFlight(
+    redis_client if config["REDIS"]["ENABLED"] == 1 else None,
+    lock_timeout=singleflight_config.get("LOCK_TIMEOUT", 5),
+    poll_interval=singleflight_config.get("POLL_INTERVAL", 0.025),
+)
+
 tags_metadata = [
     {
         "name": "ck_bonus",
@@ -93,6 +139,10 @@ tags_metadata = [
         "name": "Refactored",
         "description": "Queries that have been refactored or merged together",
     },
+    {
+        "name": "Monitoring",
+        "description": "Internal stats of the API",
+    },
 ]
 
 # Whitelisted IPs
@@ -113,8 +163,9 @@ all_styles = [
 
 
 def append_request_log(request: Request):
-    """Logs some general info about the request recieved in `requests.json`"""
-    log.append(
+    """Logs some general info about the request recieved in `requests.jsonl`\n
+    Only queues the entry, it is written by a background thread"""
+    request_log.write(
         {
             "url": str(request.url),
             "ip": request.client.host,
@@ -123,13 +174,12 @@ def append_request_log(request: Request):
             "time": str(datetime.now()),
         }
     )
-    with open("requests.json", "w") as json_file:
-        json.dump(log, json_file, indent=4, separators=(",", ": "))
 
 
 def append_denied_log(request: Request):
-    """Logs some general info about the denied request recieved in `denied.json`"""
-    denied.append(
+    """Logs some general info about the denied request recieved in `denied.jsonl`\n
+    Only queues the entry, it is written by a background thread"""
+    denied_log.write(
         {
             "url": str(request.url),
             "ip": request.client.host,
@@ -139,41 +189,124 @@ def append_denied_log(request: Request):
             "time": str(datetime.now()),
         }
     )
-    with open("denied.json", "w") as json_file:
-        json.dump(denied, json_file, indent=4, separators=(",", ": "))
 
 
-def set_cache(cache_key: str, data):
-    """Cache the data in Redis\n
-    `Decimal` values are converted to `String`\n
-    ### Still returns `True` if Redis functionality is disabled"""
+def log_stats():
+    """Returns the stats of both log writers"""
+    return {"requests": request_log.stats(), "denied": denied_log.stats()}
+
+
+def encode_response(data):
+    """Encodes `data` to the JSON bytes that are cached and sent to the client\n
+    `Decimal` values are kept exact and `datetime` uses `custom_date_format`"""
+    return json.dumps(
+        data,
+        use_decimal=True,
+        encoding="utf-8",
+        ensure_ascii=False,
+        default=default_serializer,
+        allow_nan=True,
+    ).encode("utf-8")
+
+
+def cache_policy(cache_key: str):
+    """`REDIS.CACHE_POLICIES` entry of the endpoint caching `cache_key`, matched on the text before the first `:`\n
+    `EXPIRY` (seconds) replaces the expiry the endpoint uses unless it is cached with `stale_after`, `L1` set to `0`
+    keeps it out of the in-process cache, `COMPRESS` set to `1` stores it zlib compressed in Redis, `NEGATIVE_EXPIRY`
+    (seconds) caches empty results of `cached` endpoints and `TAGS` are added to the tags it is cached with"""
+    return cache_policies.get(cache_key.split(":", 1)[0], {})
+
+
+def _uses_l1(policy: dict):
+    return local_cache is not None and policy.get("L1", 1) == 1
+
+
+def _decompress(cached_data: bytes):
+    if cached_data and cached_data.startswith(COMPRESSED):
+        return zlib.decompress(cached_data[len(COMPRESSED) :])
+    return cached_data
+
+
+def set_cache(
+    cache_key: str,
+    data,
+    tags: list = None,
+    expiry: int = None,
+    stale_after: int = None,
+):
+    """Cache the data in Redis and the in-process cache\n
+    Returns the encoded bytes so they can be sent with `cached_response` without encoding `data` again\n
+    `tags` (`map:<mapname>`, `player:<steamid32>`, `style:<style>`, `table:<table>`) register the key for `invalidate_tags`,
+    tagged keys expire after `REDIS.TAGGED_EXPIRY` instead of `REDIS.EXPIRY` unless `expiry` is given\n
+    `stale_after` (seconds) keeps the key `REDIS.STALE_EXPIRY` seconds longer instead, `get_cache_stale` reports it
+    as stale once `stale_after` passed\n
+    The `cache_policy` of `cache_key` applies on top (its `EXPIRY` only without `stale_after`), `None` is cached as an
+    empty result for its `NEGATIVE_EXPIRY`\n
+    Other workers drop their in-process copy of `cache_key`\n
+    ### Still returns the encoded bytes if Redis functionality is disabled"""
+    cached_data = encode_response(data)
     if config["REDIS"]["ENABLED"] == 0:
-        return True
-
-    redis_client.set(
-        cache_key,
-        json.dumps(
-            data,
-            use_decimal=True,
-            encoding="utf-8",
-            ensure_ascii=False,
-            default=default_serializer,
-            allow_nan=True,
-        ),
-        ex=config["REDIS"]["EXPIRY"],
-    )
+        return cached_data
 
-    return True
+    policy = cache_policy(cache_key)
+    tags = [*(tags or []), *policy.get("TAGS", [])]
+    if data is None and "NEGATIVE_EXPIRY" in policy:
+        expiry = policy["NEGATIVE_EXPIRY"]
+    elif "EXPIRY" in policy:
+        expiry = policy["EXPIRY"]
+    if expiry is None:
+        expiry = tagged_expiry if tags else config["REDIS"]["EXPIRY"]
+
+    stored = cached_data
+    if policy.get("COMPRESS", 0) == 1:
+        stored = COMPRESSED + zlib.compress(cached_data)
+
+    pipe = redis_client.pipeline(transaction=False)
+    if stale_after is not None:
+        expiry = stale_after + stale_expiry
+        pipe.set(f"{cache_key}:fresh", 1, ex=stale_after)
+    pipe.set(cache_key, stored, ex=expiry)
+    # Tags are sorted sets scored by the expiry of each key, so expired keys can be trimmed
+    now = time.time()
+    for tag in tags:
+        pipe.zadd(f"tag:{tag}", {cache_key: now + expiry})
+        pipe.zremrangebyscore(f"tag:{tag}", "-inf", now)
+        pipe.expire(f"tag:{tag}", max(expiry, tagged_expiry))
+    pipe.execute()
+
+    if local_cache is not None:
+        invalidator.ensure_listening()
+        invalidator.publish(cache_key)
+        if _uses_l1(policy):
+            local_cache.set(cache_key, cached_data)
+
+    return cached_data
+
+
+def cached_response(cached_data: bytes, status_code: int = 200):
+    """Sends already encoded JSON bytes as they are, they are never decoded on a cache hit"""
+    return Response(
+        content=cached_data, status_code=status_code, media_type="application/json"
+    )
 
 
 def get_cache(cache_key: str):
-    """Try and get cached data from Redis\n
+    """Try and get cached data from the in-process cache, then from Redis\n
     ### Still returns `None` if Redis functionality is disabled"""
     if config["REDIS"]["ENABLED"] == 0:
         return None
 
-    cached_data = redis_client.get(cache_key)
+    policy = cache_policy(cache_key)
+    if _uses_l1(policy):
+        invalidator.ensure_listening()
+        cached_data = local_cache.get(cache_key)
+        if cached_data is not None:
+            return cached_data
+
+    cached_data = _decompress(redis_client.get(cache_key))
     if cached_data:
+        if _uses_l1(policy):
+            local_cache.set(cache_key, cached_data)
         # Return cached data
         # print(json.loads(cached_data))
         return cached_data
@@ -181,6 +314,211 @@ def get_cache(cache_key: str):
         return None
 
 
+def _get_redis_stale(cache_key: str):
+    pipe = redis_client.pipeline(transaction=False)
+    pipe.get(cache_key)
+    pipe.exists(f"{cache_key}:fresh")
+    cached_data, fresh = pipe.execute()
+    return _decompress(cached_data), fresh
+
+
+def get_cache_stale(cache_key: str):
+    """`get_cache` for keys cached with `stale_after`, returns the cached data and whether it is still fresh\n
+    Stale data can be sent right away while `revalidate` refreshes it\n
+    ### Still returns `None` if Redis functionality is disabled"""
+    if config["REDIS"]["ENABLED"] == 0:
+        return None, True
+
+    policy = cache_policy(cache_key)
+    if _uses_l1(policy):
+        invalidator.ensure_listening()
+        cached_data = local_cache.get(cache_key)
+        if cached_data is not None:
+            return cached_data, True
+
+    cached_data, fresh = _get_redis_stale(cache_key)
+    if not cached_data:
+        return None, True
+
+    # Stale data is not kept in-process, the next request checks again if it was refreshed
+    if _uses_l1(policy) and fresh:
+        local_cache.set(cache_key, cached_data)
+    return cached_data, bool(fresh)
+
+
+# Background refreshes of stale keys by cache key, referenced until they are done
+revalidations = {}
+
+
+def revalidate(cache_key: str, compute):
+    """Refreshes a stale `cache_key` in the background with `await compute()`\n
+    One request at a time refreshes it, across workers too (see `singleflight`)"""
+    if cache_key in revalidations or flights.running(cache_key):
+        return
+
+    def fresh():
+        # Read from Redis, the in-process copy may be older than the refresh of another worker
+        cached_data, fresh = _get_redis_stale(cache_key)
+        return cached_data if cached_data and fresh else None
+
+    def done(task):
+        revalidations.pop(cache_key, None)
+        if not task.cancelled() and task.exception() is not None:
+            print(f"[Redis] Could not refresh '{cache_key}': {task.exception()}")
+
+    task = asyncio.create_task(flights.do(cache_key, compute, fresh))
+    revalidations[cache_key] = task
+    task.add_done_callback(done)
+
+
+def invalidate_tags(*tags: str):
+    """Remove every key cached with one of `tags` from Redis and from the in-process cache of every worker\n
+    Called by the write endpoints with the tags their change affects"""
+    if config["REDIS"]["ENABLED"] == 0 or not tags:
+        return
+
+    # MULTI/EXEC so a key tagged in between is not lost
+    pipe = redis_client.pipeline()
+    for tag in tags:
+        pipe.zrange(f"tag:{tag}", 0, -1)
+        pipe.delete(f"tag:{tag}")
+    results = pipe.execute()
+
+    keys = {key.decode("utf-8") for members in results[::2] for key in members}
+    if not keys:
+        return
+
+    redis_client.delete(*keys)
+    if local_cache is not None:
+        invalidator.publish(*keys)
+
+
+def delete_cache(cache_key: str):
+    """Remove `cache_key` from Redis and from the in-process cache of every worker"""
+    if config["REDIS"]["ENABLED"] == 0:
+        return
+
+    redis_client.delete(cache_key)
+    if local_cache is not None:
+        invalidator.publish(cache_key)
+
+
+async def singleflight(cache_key: str, compute):
+    """Runs `await compute()` for a `cache_key` missing from the cache, once for all the identical concurrent
+    requests, which get its result instead of running the same queries\n
+    `compute` returns the bytes of `set_cache` (or `None` when nothing was cached), requests waiting on another worker
+    get the bytes from `get_cache` once it wrote them\n
+    ### Only coalesces within the worker if Redis functionality is disabled"""
+    if singleflight_config.get("ENABLED", 1) == 0:
+        return await compute()
+
+    return await flights.do(cache_key, compute, lambda: get_cache(cache_key))
+
+
+def singleflight_stats():
+    """Returns the request coalescing stats of this worker"""
+    return flights.stats()
+
+
+def _no_content(cached_data: bytes):
+    return cached_data is None or cached_data == b"null"
+
+
+def cached(key: str, tags: list = None, expiry: int = None, coalesce: bool = False):
+    """Read-through cache for a `GET` endpoint in place of its own `get_cache` and `set_cache` calls\n
+    The endpoint returns the data to send, `None` sends `204` and a `Response` is sent as it is\n
+    `key` and `tags` are formatted with the arguments of the endpoint (`"selectMapTier:{mapname}"`), `expiry` is
+    passed to `set_cache` and `coalesce` runs identical concurrent misses once (see `singleflight`)\n
+    ### The `REDIS.CACHE_POLICIES` entry of the key applies (see `cache_policy`)"""
+
+    def decorator(endpoint):
+        signature = inspect.signature(endpoint)
+
+        def keys(args, kwargs):
+            arguments = signature.bind(*args, **kwargs)
+            arguments.apply_defaults()
+            return key.format(**arguments.arguments), [
+                tag.format(**arguments.arguments) for tag in tags or []
+            ]
+
+        def store(cache_key: str, cache_tags: list, data):
+            if isinstance(data, Response):
+                return data
+
+            if data is None:
+                # Empty results are only cached with a `NEGATIVE_EXPIRY` policy
+                if cache_policy(cache_key).get("NEGATIVE_EXPIRY", 0) > 0:
+                    set_cache(cache_key, None, tags=cache_tags)
+                return None
+
+            return set_cache(cache_key, data, tags=cache_tags, expiry=expiry)
+
+        def respond(cached_data):
+            if isinstance(cached_data, Response):
+                return cached_data
+            if _no_content(cached_data):
+                return Response(
+                    status_code=204, headers={"content-type": "application/json"}
+                )
+            return cached_response(cached_data)
+
+        if inspect.iscoroutinefunction(endpoint):
+
+            @functools.wraps(endpoint)
+            async def wrapper(*args, **kwargs):
+                tic = time.perf_counter()
+
+                cache_key, cache_tags = keys(args, kwargs)
+                cached_data = get_cache(cache_key)
+                if cached_data is not None:
+                    print(
+                        f"[Redis] Loaded '{cache_key}' ({time.perf_counter() - tic:0.4f}s)"
+                    )
+                    return respond(cached_data)
+
+                async def compute():
+                    return store(cache_key, cache_tags, await endpoint(*args, **kwargs))
+
+                if coalesce:
+                    cached_data = await singleflight(cache_key, compute)
+                else:
+                    cached_data = await compute()
+
+                print(f"Execution time {time.perf_counter() - tic:0.4f}")
+                return respond(cached_data)
+
+        else:
+
+            @functools.wraps(endpoint)
+            def wrapper(*args, **kwargs):
+                tic = time.perf_counter()
+
+                cache_key, cache_tags = keys(args, kwargs)
+                cached_data = get_cache(cache_key)
+                if cached_data is not None:
+                    print(
+                        f"[Redis] Loaded '{cache_key}' ({time.perf_counter() - tic:0.4f}s)"
+                    )
+                    return respond(cached_data)
+
+                cached_data = store(cache_key, cache_tags, endpoint(*args, **kwargs))
+
+                print(f"Execution time {time.perf_counter() - tic:0.4f}")
+                return respond(cached_data)
+
+        return wrapper
+
+    return decorator
+
+
+def cache_stats():
+    """Returns the in-process cache stats, `None` when it is disabled"""
+    if local_cache is None:
+        return None
+
+    return local_cache.stats()
+
+
 def ordinal(n):
     suffix = ["th", "st", "nd", "rd", "th"][min(n % 10, 4)]
     if 11 <= (n % 100) <= 13:
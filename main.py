@@ -21,9 +21,16 @@ from globals import (
     WHITELISTED_IPS,
     append_request_log,
     append_denied_log,
+    cache_stats,
+    singleflight_stats,
+    log_stats,
+    cached_response,
+    encode_response,
 )
 
-from sql import selectQuery, insertQuery
+from sql import selectQueryAsync, pool_stats, async_stats
+from surftimer.map_catalog import map_catalog
+from surftimer.completion_index import unfinished_maps
 
 # Import all the endpoints for each table
 from surftimer.ck_latestrecords import router as ck_latestrecords_router
@@ -148,6 +155,35 @@ async def mapchooser(
 
     json_data = []
 
+    # sql_SelectMapList, sql_SelectMapListRange and sql_SelectMapListSpecific - Mapchooser/Nominations
+    # are filtered from the in-memory map catalog
+    if type in (1, 2, 3):
+        if type == 2 and (tier_min is None or tier_max is None):
+            return "Tier min and max values are required for query 2."
+
+        if type == 3 and tier is None:
+            return "Tier value is required for query 3."
+
+        if type == 1:
+            cached_data = await map_catalog.encoded()
+        elif type == 2:
+            cached_data = await map_catalog.encoded(tier_min, tier_max)
+        else:
+            cached_data = await map_catalog.encoded(tier, tier)
+
+        print(f"[Catalog] Q_Type: {type} ({time.perf_counter() - tic:0.6f}s)")
+        return cached_response(cached_data)
+
+    # sql_SelectIncompleteMapList - Nominations, from the in-memory completion index
+    if type == 4:
+        if steamid is None or style is None:
+            return "SteamID and Style values are required for query 4."
+
+        json_data = await unfinished_maps(steamid, style)
+
+        print(f"[Completions] Q_Type: {type} ({time.perf_counter() - tic:0.6f}s)")
+        return cached_response(encode_response(json_data))
+
     # Check if data is cached in Redis
     cache_key = f"mapchooser:{type}_{tier_min}_{tier_max}_{tier}_{steamid}_{style}"
     cached_data = redis_client.get(cache_key)
@@ -158,55 +194,9 @@ async def mapchooser(
         return JSONResponse(
             status_code=status.HTTP_200_OK, content=json.loads(cached_data)
         )
-    # This needs to be dynamic depending on tickrates
-    db = "surftimer_test"
+    db = config["DATABASE"]["DB"]
 
     switch_case = {
-        # sql_SelectMapList - Mapchooser/Nominations
-        1: f"""SELECT {db}.ck_zones.mapname, tier as maptier, count({db}.ck_zones.zonetype = 3) as stages, bonus as bonuses
-            FROM {db}.ck_zones 
-            INNER JOIN {db}.ck_maptier on {db}.ck_zones.mapname = {db}.ck_maptier.mapname 
-            LEFT JOIN (
-                SELECT mapname as map_2, MAX({db}.ck_zones.zonegroup) as bonus 
-                FROM {db}.ck_zones 
-                GROUP BY mapname
-            ) as a on {db}.ck_zones.mapname = a.map_2 
-            WHERE (zonegroup = 0 AND (zonetype = 1 or zonetype = 5 or zonetype = 3)) 
-            GROUP BY mapname, tier, bonus 
-            ORDER BY mapname ASC""",
-        # sql_SelectMapListRange - Mapchooser/Nominations
-        2: f"""SELECT {db}.ck_zones.mapname, tier as maptier, count({db}.ck_zones.zonetype = 3) as stages, bonus as bonuses
-            FROM {db}.ck_zones 
-            INNER JOIN {db}.ck_maptier on {db}.ck_zones.mapname = {db}.ck_maptier.mapname 
-            LEFT JOIN (
-                SELECT mapname as map_2, MAX({db}.ck_zones.zonegroup) as bonus 
-                FROM {db}.ck_zones 
-                GROUP BY mapname
-            ) as a on {db}.ck_zones.mapname = a.map_2 
-            WHERE (zonegroup = 0 AND (zonetype = 1 or zonetype = 5 or zonetype = 3)) 
-            AND tier >= {tier_min} AND tier <= {tier_max} 
-            GROUP BY mapname, tier, bonus 
-            ORDER BY mapname ASC""",
-        # sql_SelectMapListSpecific - Mapchooser/Nominations
-        3: f"""SELECT {db}.ck_zones.mapname, tier as maptier, count({db}.ck_zones.zonetype = 3) as stages, bonus as bonuses
-            FROM {db}.ck_zones 
-            INNER JOIN {db}.ck_maptier on {db}.ck_zones.mapname = {db}.ck_maptier.mapname 
-            LEFT JOIN (
-                SELECT mapname as map_2, MAX({db}.ck_zones.zonegroup) as bonus 
-                FROM {db}.ck_zones 
-                GROUP BY mapname
-            ) as a on {db}.ck_zones.mapname = a.map_2 
-            WHERE (zonegroup = 0 AND (zonetype = 1 or zonetype = 5 or zonetype = 3)) 
-            AND tier = {tier} 
-            GROUP BY mapname, tier, bonus 
-            ORDER BY mapname ASC""",
-        # sql_SelectIncompleteMapList - Nominations
-        4: f"""SELECT mapname 
-            FROM {db}.ck_maptier 
-            WHERE tier > 0 
-            AND mapname 
-            NOT IN (
-                SELECT mapname FROM {db}.ck_playertimes WHERE steamid = '{steamid}' AND style = {style}) ORDER BY tier ASC, mapname ASC""",
         # sql_SelectRank - Mapchooser/RockTheVote
         5: f"""SELECT COUNT(*) AS playerrank
             FROM {db}.ck_playerrank 
@@ -223,22 +213,13 @@ async def mapchooser(
     if query is None:
         return "Invalid query number."
 
-    if type == 2 and (tier_min is None or tier_max is None):
-        return "Tier min and max values are required for query 2."
-
-    if type == 3 and tier is None:
-        return "Tier value is required for query 3."
-
-    if type == 4 and (steamid is None or style is None):
-        return "SteamID and Style values are required for query 4."
-
     if type == 5 and (steamid is None):
         return "SteamID value is required for this query."
 
     if type == 6 and (steamid is None):
         return "SteamID value is required for this query."
 
-    xquery = selectQuery(query)
+    xquery = await selectQueryAsync(query)
 
     for result in xquery:
         json_data.append(result)
@@ -264,6 +245,54 @@ async def mapchooser(
     return json_data
 
 
+@app.get(
+    "/api/poolStats",
+    tags=["Monitoring"],
+    name="Database Connection Pool Stats",
+)
+async def poolStats():
+    """Usage of the shared MySQL connection pool:\n
+    `in_use`, `idle`, `waits` (checkouts that had to wait), `timeouts`, `created`, `recycled` and `failed_checks`\n
+    `async` shows the worker thread limiters used by the `async def` endpoints"""
+    return {**pool_stats(), "async": async_stats()}
+
+
+@app.get(
+    "/api/cacheStats",
+    tags=["Monitoring"],
+    name="In-process Cache Stats",
+)
+async def cacheStats():
+    """Usage of this worker's in-process cache in front of Redis:\n
+    `keys`, `bytes`, `hits`, `misses`, `expired`, `evicted` and `invalidated`\n
+    `null` when `REDIS.L1` is disabled"""
+    return cache_stats()
+
+
+@app.get(
+    "/api/singleflightStats",
+    tags=["Monitoring"],
+    name="Request Coalescing Stats",
+)
+async def singleflightStats():
+    """Cache misses of this worker computed once for identical concurrent requests:\n
+    `in_flight` keys being computed, `computed`, `coalesced` (requests that waited on the same worker),
+    `waited` (polls while another worker held the lock) and `timeouts`"""
+    return singleflight_stats()
+
+
+@app.get(
+    "/api/logStats",
+    tags=["Monitoring"],
+    name="Request Log Stats",
+)
+async def logStats():
+    """Background writers of `requests.jsonl` and `denied.jsonl`:\n
+    `queued` entries waiting to be written, `written`, `dropped` (queue was full),
+    `rotations` and `errors`"""
+    return log_stats()
+
+
 # new code 👇
 @app.get(
     "/api/private",
@@ -0,0 +1,113 @@
+import atexit, os, queue, threading, time
+import simplejson as json
+
+
+class JsonlWriter:
+    """Appends log entries as JSON lines from a background thread\n
+    `write` only puts the entry on a bounded queue and never blocks the request, entries are dropped
+    (and counted) when the queue is full. The writer thread flushes in batches every `flush_interval`
+    seconds or `batch_size` entries and rotates the file to `<path>.1` ... `<path>.<backups>` once it
+    grows over `max_bytes`"""
+
+    def __init__(
+        self,
+        path: str,
+        max_bytes: int,
+        backups: int,
+        queue_size: int,
+        flush_interval: float,
+        batch_size: int = 500,
+    ):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._pid = None
+        self._lock = threading.Lock()
+        self._stats = {"written": 0, "dropped": 0, "rotations": 0, "errors": 0}
+
+    def write(self, entry: dict):
+        """Queues `entry` for the writer thread"""
+        self._ensure_running()
+        try:
+            self._queue.put_nowait(entry)
+        except queue.Full:
+            self._stats["dropped"] += 1
+
+    def _ensure_running(self):
+        """Starts the writer thread once per process (workers may be forked after import)"""
+        if self._pid == os.getpid():
+            return
+
+        with self._lock:
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                directory = os.path.dirname(self.path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                threading.Thread(
+                    target=self._run, name=f"log-{self.path}", daemon=True
+                ).start()
+                atexit.register(self._drain)
+
+    def _next_batch(self, timeout: float):
+        batch = []
+        try:
+            batch.append(self._queue.get(timeout=timeout))
+            while len(batch) < self.batch_size:
+                batch.append(self._queue.get_nowait())
+        except queue.Empty:
+            pass
+        return batch
+
+    def _flush(self, batch):
+        lines = "".join(
+            json.dumps(entry, default=str, ensure_ascii=False) + "\n" for entry in batch
+        )
+        try:
+            with open(self.path, "a", encoding="utf-8") as log_file:
+                log_file.write(lines)
+                size = log_file.tell()
+            self._stats["written"] += len(batch)
+
+            if size > self.max_bytes:
+                self._rotate()
+        except OSError as err:
+            self._stats["errors"] += 1
+            print(f"[Log] Could not write {len(batch)} entries to '{self.path}': {err}")
+
+    def _rotate(self):
+        for index in range(self.backups - 1, 0, -1):
+            if os.path.exists(f"{self.path}.{index}"):
+                os.replace(f"{self.path}.{index}", f"{self.path}.{index + 1}")
+        if self.backups > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+        self._stats["rotations"] += 1
+
+    def _run(self):
+        while True:
+            deadline = time.monotonic() + self.flush_interval
+            batch = []
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                batch += self._next_batch(remaining)
+            if batch:
+                self._flush(batch)
+
+    def _drain(self):
+        """Writes whatever is still queued when the process exits"""
+        batch = self._next_batch(0)
+        while batch:
+            self._flush(batch)
+            batch = self._next_batch(0)
+
+    def stats(self):
+        """Snapshot of the writer usage for monitoring"""
+        return {"path": self.path, "queued": self._queue.qsize(), **self._stats}
@@ -1,81 +1,404 @@
 import mysql.connector
 import simplejson as json
+import anyio, re, threading, time
+from contextlib import contextmanager
+from functools import partial
 
 
 with open("config.json", "r") as f:
     config = json.load(f)
 
 
-def selectQuery(query):
+class PoolTimeout(Exception):
+    """Raised when no pooled connection became available within `POOL_TIMEOUT`"""
+
+
+class _PooledConnection:
+    """A `mysql.connector` connection plus the bookkeeping the pool needs"""
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.created = time.monotonic()
+        self.last_used = self.created
+        # Prepared cursors keyed by statement, they live and die with the connection
+        self.statements = {}
+
+
+class ConnectionPool:
+    """Bounded pool of MySQL connections shared by all `sql.py` functions\n
+    Connections are opened lazily up to `size` in `autocommit` mode, checked with a
+    ping when they have been idle for longer than `ping_interval` and replaced when
+    they are older than `recycle` seconds or fail the check.\n
+    Callers block for up to `timeout` seconds when every connection is in use"""
+
+    def __init__(
+        self,
+        size: int,
+        timeout: float,
+        ping_interval: float,
+        recycle: float,
+        **connect_args,
+    ):
+        self.size = size
+        self.timeout = timeout
+        self.ping_interval = ping_interval
+        self.recycle = recycle
+        self.connect_args = connect_args
+
+        self._idle = []
+        self._opened = 0
+        self._lock = threading.Condition()
+
+        self._stats = {
+            "checkouts": 0,
+            "waits": 0,
+            "timeouts": 0,
+            "created": 0,
+            "recycled": 0,
+            "failed_checks": 0,
+            "prepared": 0,
+        }
+
+    def _count(self, stat: str):
+        with self._lock:
+            self._stats[stat] += 1
+
+    def _connect(self):
+        connection = _PooledConnection(mysql.connector.connect(**self.connect_args))
+        self._count("created")
+        return connection
+
+    def _close(self, pooled):
+        try:
+            pooled.connection.close()
+        except mysql.connector.Error:
+            pass
+
+    def _healthy(self, pooled):
+        """Recycle old connections and ping ones that were idle for a while"""
+        now = time.monotonic()
+        if self.recycle and now - pooled.created > self.recycle:
+            self._count("recycled")
+            return False
+
+        if now - pooled.last_used < self.ping_interval:
+            return True
+
+        try:
+            pooled.connection.ping(reconnect=False)
+            return True
+        except mysql.connector.Error:
+            self._count("failed_checks")
+            return False
+
+    def acquire(self):
+        """Check out a healthy connection, opening a new one if the pool is not full yet"""
+        deadline = time.monotonic() + self.timeout
+
+        with self._lock:
+            waited = False
+            while not self._idle and self._opened >= self.size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats["timeouts"] += 1
+                    raise PoolTimeout(
+                        f"No MySQL connection available after {self.timeout}s ({self.size} in use)"
+                    )
+                if not waited:
+                    self._stats["waits"] += 1
+                    waited = True
+                self._lock.wait(remaining)
+
+            pooled = self._idle.pop() if self._idle else None
+            self._opened += 1 if pooled is None else 0
+            self._stats["checkouts"] += 1
+
+        # Network round trips happen outside of the lock
+        try:
+            if pooled is not None and not self._healthy(pooled):
+                self._close(pooled)
+                pooled = None
+            if pooled is None:
+                pooled = self._connect()
+        except Exception:
+            with self._lock:
+                self._opened -= 1
+                self._lock.notify()
+            raise
+
+        return pooled
+
+    def release(self, pooled, discard: bool = False):
+        """Return a connection to the pool, `discard` closes it instead"""
+        if not discard:
+            try:
+                # Drop any unfinished transaction so the next user starts clean
+                if pooled.connection.in_transaction:
+                    pooled.connection.rollback()
+                pooled.last_used = time.monotonic()
+            except mysql.connector.Error:
+                discard = True
+
+        if discard:
+            self._close(pooled)
+
+        with self._lock:
+            if discard:
+                self._opened -= 1
+            else:
+                self._idle.append(pooled)
+            self._lock.notify()
+
+    def stats(self):
+        """Snapshot of the pool usage for monitoring"""
+        with self._lock:
+            return {
+                "size": self.size,
+                "opened": self._opened,
+                "in_use": self._opened - len(self._idle),
+                "idle": len(self._idle),
+                **self._stats,
+            }
+
+
+db = config["DATABASE"]
+pool = ConnectionPool(
+    size=db.get("POOL_SIZE", 10),
+    timeout=db.get("POOL_TIMEOUT", 10),
+    ping_interval=db.get("POOL_PING_INTERVAL", 30),
+    recycle=db.get("POOL_RECYCLE", 3600),
+    host=db["HOST"],
+    user=db["USERNAME"],
+    password=db["PASSWORD"],
+    database=db["DB"],
+    autocommit=True,
+)
+
+
+@contextmanager
+def _checkout():
+    """Borrow a `_PooledConnection`, connections that raised a MySQL error are closed instead of being reused"""
+    pooled = pool.acquire()
+    try:
+        yield pooled
+    except mysql.connector.Error:
+        pool.release(pooled, discard=True)
+        raise
+    except BaseException:
+        pool.release(pooled)
+        raise
+    else:
+        pool.release(pooled)
+
+
+@contextmanager
+def connection():
+    """Borrow a connection from the pool for the duration of the `with` block\n
+    Connections that raised a MySQL error are closed instead of being reused"""
+    with _checkout() as pooled:
+        yield pooled.connection
+
+
+@contextmanager
+def transaction():
+    """Borrow a pooled connection and run the `with` block as a single transaction\n
+    Commits when the block completes and rolls back if it raised"""
+    with connection() as mydb:
+        mydb.start_transaction()
+        try:
+            yield mydb
+        except BaseException:
+            mydb.rollback()
+            raise
+        else:
+            mydb.commit()
+
+
+def pool_stats():
+    """Returns the connection pool stats (in use, waits, timeouts...)"""
+    return pool.stats()
+
+
+def selectQuery(query, params=None):
     """Executes `SELECT` query provided and returns the output in JSON\n
-    Connects to a predefined `Database` from `config.json`"""
+    `params` fill the `%s` placeholders of `query` when given\n
+    Uses a pooled connection to the predefined `Database` from `config.json`"""
     json_data = []
-    db = config["DATABASE"]
-    mydb = mysql.connector.connect(
-        host=db["HOST"],
-        user=db["USERNAME"],
-        password=db["PASSWORD"],
-        database=db["DB"],
-    )
-    mycursor = mydb.cursor(dictionary=True)
-    mycursor.execute(query)
-    res = mycursor.fetchall()
+    with connection() as mydb:
+        mycursor = mydb.cursor(dictionary=True)
+        mycursor.execute(query, params)
+        res = mycursor.fetchall()
+        mycursor.close()
+
     for result in res:
         json_data.append(dict(result))
 
-    mydb.close()
     return json_data
 
 
 def insertQuery(query):
     """Executes `INSERT` query provided and returns `mycursor.rowcount`\n
-    Connects to a predefined `Database` from `config.json`"""
-    db = config["DATABASE"]
-    mydb = mysql.connector.connect(
-        host=db["HOST"],
-        user=db["USERNAME"],
-        password=db["PASSWORD"],
-        database=db["DB"],
-    )
+    Uses a pooled connection to the predefined `Database` from `config.json`"""
+    with connection() as mydb:
+        mycursor = mydb.cursor()
+        mycursor.execute(query)
 
-    mycursor = mydb.cursor()
-    mycursor.execute(query)
+        rowcount = mycursor.rowcount
+        mycursor.close()
 
-    mydb.commit()
-
-    return mycursor.rowcount
+    return rowcount
 
 
 def insert_escaped_query(query):
     """Executes `INSERT` query `mycursor.execute("", (query))` provided and returns `mycursor.rowcount`\n
-    Connects to a predefined `Database` from `config.json`"""
-    db = config["DATABASE"]
-    mydb = mysql.connector.connect(
-        host=db["HOST"],
-        user=db["USERNAME"],
-        password=db["PASSWORD"],
-        database=db["DB"],
-    )
-
-    mycursor = mydb.cursor()
-    mycursor.execute("", (query))
+    Uses a pooled connection to the predefined `Database` from `config.json`"""
+    with connection() as mydb:
+        mycursor = mydb.cursor()
+        mycursor.execute("", (query))
 
-    mydb.commit()
+        rowcount = mycursor.rowcount
+        mycursor.close()
 
-    return mycursor.rowcount
+    return rowcount
 
 
 def syncQuery(query):
-    db = config["DATABASE"]
-    mydb = mysql.connector.connect(
-        host=db["HOST"],
-        user=db["USERNAME"],
-        password=db["PASSWORD"],
+    """Executes the query provided and returns `mycursor.rowcount`\n
+    Uses a pooled connection, tables outside of the predefined `Database` need to be fully qualified"""
+    with connection() as mydb:
+        mycursor = mydb.cursor()
+        mycursor.execute(query)
+
+        rowcount = mycursor.rowcount
+        mycursor.close()
+
+    return rowcount
+
+
+## Prepared statements
+class PreparedQuery:
+    """A query template executed as a server-side prepared statement\n
+    Parameters are written as `%(name)s` in `sql` and declared with their type as keyword arguments,
+    values are converted to that type and sent separately from the query so they are never formatted into it.\n
+    Each pooled connection prepares the statement once and reuses it for every following execution.\n
+    The binary protocol decodes FLOAT columns at single precision (`0.3` comes back as `0.30000001192092896`),
+    queries returning them stay on `selectQuery`"""
+
+    _placeholder = re.compile(r"%\((\w+)\)s")
+
+    def __init__(self, sql: str, **params: type):
+        self.sql = sql
+        self.params = params
+        self.order = self._placeholder.findall(sql)
+        # The cursors only reuse a prepared statement when given the very same string object
+        self.statement = self._placeholder.sub("?", sql)
+
+        undeclared = set(self.order) - set(params)
+        if undeclared:
+            raise ValueError(f"Parameters without a type: {', '.join(sorted(undeclared))}")
+
+    def bind(self, values: dict):
+        """Returns the positional parameters for the statement, converted to their declared types"""
+        missing = set(self.params) - set(values)
+        if missing:
+            raise TypeError(f"Missing query parameters: {', '.join(sorted(missing))}")
+
+        return tuple(self.params[name](values[name]) for name in self.order)
+
+
+def _prepared_cursor(pooled, query: PreparedQuery):
+    """Returns the prepared cursor for `query` on this connection, creating it on first use"""
+    cursor = pooled.statements.get(query.statement)
+    if cursor is None:
+        cursor = pooled.connection.cursor(prepared=True)
+        pooled.statements[query.statement] = cursor
+        pool._count("prepared")
+
+    return cursor
+
+
+def selectPrepared(query: PreparedQuery, **params):
+    """Executes the prepared `SELECT` query with `params` and returns the output in JSON\n
+    Uses a pooled connection to the predefined `Database` from `config.json`"""
+    with _checkout() as pooled:
+        mycursor = _prepared_cursor(pooled, query)
+        mycursor.execute(query.statement, query.bind(params))
+        columns = mycursor.column_names
+        res = mycursor.fetchall()
+
+    return [dict(zip(columns, result)) for result in res]
+
+
+def insertPrepared(query: PreparedQuery, **params):
+    """Executes the prepared `INSERT`/`UPDATE` query with `params` and returns `mycursor.rowcount`\n
+    Uses a pooled connection to the predefined `Database` from `config.json`"""
+    with _checkout() as pooled:
+        mycursor = _prepared_cursor(pooled, query)
+        mycursor.execute(query.statement, query.bind(params))
+
+        rowcount = mycursor.rowcount
+
+    return rowcount
+
+
+## Async data access
+# `async def` endpoints must never call the functions above directly, that would block the event loop
+# for the whole MySQL round trip. The `*Async` variants run them in worker threads instead, bounded by
+# capacity limiters sized to the pool. Reads are capped below the pool size so that a burst of slow
+# `SELECT`s always leaves `ASYNC_WRITE_RESERVE` connections for writes coming from the game servers.
+_limiters = {}
+
+
+def _limiter(write: bool):
+    """Lazily creates the limiters, they have to be created inside the running event loop"""
+    if write not in _limiters:
+        reserve = min(db.get("ASYNC_WRITE_RESERVE", 2), pool.size - 1)
+        tokens = pool.size if write else pool.size - reserve
+        _limiters[write] = anyio.CapacityLimiter(max(tokens, 1))
+
+    return _limiters[write]
+
+
+async def runAsync(func, *args, write: bool = False, **kwargs):
+    """Runs a blocking database function in a worker thread without blocking the event loop\n
+    `write` selects the limiter, use it for anything that modifies data"""
+    return await anyio.to_thread.run_sync(
+        partial(func, *args, **kwargs), limiter=_limiter(write)
     )
 
-    mycursor = mydb.cursor()
-    mycursor.execute(query)
 
-    mydb.commit()
+async def selectQueryAsync(query):
+    """`selectQuery` for `async def` endpoints"""
+    return await runAsync(selectQuery, query)
+
+
+async def insertQueryAsync(query):
+    """`insertQuery` for `async def` endpoints"""
+    return await runAsync(insertQuery, query, write=True)
+
+
+async def insert_escaped_query_async(query):
+    """`insert_escaped_query` for `async def` endpoints"""
+    return await runAsync(insert_escaped_query, query, write=True)
+
+
+async def selectPreparedAsync(query: PreparedQuery, **params):
+    """`selectPrepared` for `async def` endpoints"""
+    return await runAsync(selectPrepared, query, **params)
+
+
+async def insertPreparedAsync(query: PreparedQuery, **params):
+    """`insertPrepared` for `async def` endpoints"""
+    return await runAsync(insertPrepared, query, write=True, **params)
+
 
-    return mycursor.rowcount
+def async_stats():
+    """Returns how many threads are running/waiting on each limiter"""
+    return {
+        ("write" if write else "read"): {
+            "total": limiter.total_tokens,
+            "borrowed": limiter.borrowed_tokens,
+            "waiting": limiter.statistics().tasks_waiting,
+        }
+        for write, limiter in _limiters.items()
+    }
@@ -1,14 +1,20 @@
-from fastapi import APIRouter, Request, Response, status
+from fastapi import APIRouter, BackgroundTasks, Request, Response, status
 from fastapi.responses import JSONResponse
 from pydantic import BaseModel
 from decimal import Decimal
 import simplejson as json
-from sql import selectQuery, insertQuery
+from sql import selectQuery, insertQuery, selectPrepared
 from globals import (
     set_cache,
     get_cache,
+    cached,
+    cached_response,
+    invalidate_tags,
+    config,
 )
-import time, surftimer.queries
+from surftimer.leaderboard import leaderboards
+from surftimer.completion_index import completion_index
+import time, surftimer.queries, surftimer.ranking, surftimer.recalculation
 
 
 class NewBonus(BaseModel):
@@ -37,6 +43,7 @@ def insertBonus(
     request: Request,
     response: Response,
     data: NewBonus,
+    background_tasks: BackgroundTasks,
 ):
     """Inserts a new `Bonus` record to the table\n
     ```char sql_insertBonus[] = ....```"""
@@ -56,6 +63,12 @@ def insertBonus(
     # xquery = 0
     # time.sleep(3)
 
+    if xquery > 0:
+        leaderboards.update(
+            data.mapname, data.zonegroup, 0, [(data.steamid32, data.runtime, data.name)]
+        )
+        completion_index.finish(data.steamid32, 0, data.mapname, data.zonegroup)
+    invalidate_tags(f"player:{data.steamid32}", f"map:{data.mapname}")
     content_data = {"inserted": xquery, "xtime": time.perf_counter() - tic}
     if xquery < 1:
         # response.body = response.body = json.dumps(content_data).encode('utf-8')
@@ -63,6 +76,15 @@ def insertBonus(
         response.headers["content-type"] = "application/json"
         return response
 
+    # Ranks behind the new time moved, update the points of the affected players after responding
+    background_tasks.add_task(
+        surftimer.recalculation.recalculate_change,
+        data.mapname,
+        0,
+        zonegroup=data.zonegroup,
+        steamid32=data.steamid32,
+    )
+
     # Prepare the response
     toc = time.perf_counter()
     print(f"Execution time {toc - tic:0.4f}")
@@ -82,6 +104,7 @@ def updateBonus(
     request: Request,
     response: Response,
     data: NewBonus,
+    background_tasks: BackgroundTasks,
 ):
     """```char sql_updateBonus[] = ....```"""
     tic = time.perf_counter()
@@ -98,6 +121,12 @@ def updateBonus(
     )
     xquery = insertQuery(sql)
 
+    if xquery > 0:
+        leaderboards.update(
+            data.mapname, data.zonegroup, 0, [(data.steamid32, data.runtime, data.name)]
+        )
+        completion_index.finish(data.steamid32, 0, data.mapname, data.zonegroup)
+    invalidate_tags(f"player:{data.steamid32}", f"map:{data.mapname}")
     content_data = {"updated": xquery, "xtime": time.perf_counter() - tic}
     if xquery < 1:
         # response.body = json.dumps(content_data).encode('utf-8')
@@ -105,6 +134,15 @@ def updateBonus(
         response.status_code = status.HTTP_304_NOT_MODIFIED
         return response
 
+    # Ranks behind the new time moved, update the points of the affected players after responding
+    background_tasks.add_task(
+        surftimer.recalculation.recalculate_change,
+        data.mapname,
+        0,
+        zonegroup=data.zonegroup,
+        steamid32=data.steamid32,
+    )
+
     # Prepare the response
     toc = time.perf_counter()
     print(f"Execution time {toc - tic:0.4f}")
@@ -120,33 +158,14 @@ def updateBonus(
     name="Get Bonus Count",
     tags=["ck_bonus"],
 )
+@cached("selectBonusCount:{mapname}", tags=["map:{mapname}", "table:ck_bonus"])
 def selectBonusCount(request: Request, response: Response, mapname: str):
     """Retrieves all the bonuses for the map provided\n
     ```char sql_selectBonusCount[] = ....```"""
-    tic = time.perf_counter()
-
-    # Check if data is cached in Redis
-    cache_key = f"selectBonusCount:{mapname}"
-    cached_data = get_cache(cache_key)
-    if cached_data:
-        print(f"[Redis] Loaded '{cache_key}' ({time.perf_counter() - tic:0.4f}s)")
-        response.headers["content-type"] = "application/json"
-        response.status_code = status.HTTP_200_OK
-        response.body = json.loads(cached_data, use_decimal=True, parse_nan=True)
-        return response
-
     xquery = selectQuery(surftimer.queries.sql_selectBonusCount.format(mapname))
 
     if len(xquery) <= 0:
-        response.headers["content-type"] = "application/json"
-        response.status_code = status.HTTP_204_NO_CONTENT
-        return response
-
-    toc = time.perf_counter()
-    print(f"Execution time {toc - tic:0.4f}")
-
-    # Cache the data in Redis
-    set_cache(cache_key, xquery)
+        return None
 
     return xquery
 
@@ -156,37 +175,22 @@ def selectBonusCount(request: Request, response: Response, mapname: str):
     name="Get Personal Bonus Records",
     tags=["ck_bonus"],
 )
+@cached(
+    "selectPersonalBonusRecords:{steamid32}-{mapname}",
+    tags=["player:{steamid32}", "map:{mapname}", "table:ck_bonus"],
+)
 def selectPersonalBonusRecords(
     request: Request, response: Response, steamid32: str, mapname: str
 ):
     """```char sql_selectPersonalBonusRecords[] = ....```"""
-    tic = time.perf_counter()
-
-    # Check if data is cached in Redis
-    cache_key = f"selectPersonalBonusRecords:{steamid32}-{mapname}"
-    cached_data = get_cache(cache_key)
-
-    if cached_data is not None:
-        print(f"[Redis] Loaded '{cache_key}' ({time.perf_counter() - tic:0.4f}s)")
-        response.headers["content-type"] = "application/json"
-        response.status_code = status.HTTP_200_OK
-        response.body = json.loads(cached_data, use_decimal=True, parse_nan=True)
-        return response
-
-    xquery = selectQuery(
-        surftimer.queries.sql_selectPersonalBonusRecords.format(steamid32, mapname)
+    xquery = selectPrepared(
+        surftimer.queries.sql_selectPersonalBonusRecords,
+        steamid=steamid32,
+        mapname=mapname,
     )
 
     if len(xquery) <= 0:
-        response.headers["content-type"] = "application/json"
-        response.status_code = status.HTTP_204_NO_CONTENT
-        return response
-
-    toc = time.perf_counter()
-    print(f"Execution time {toc - tic:0.4f}")
-
-    # Cache the data in Redis
-    set_cache(cache_key, xquery)
+        return None
 
     return xquery
 
@@ -196,6 +200,10 @@ def selectPersonalBonusRecords(
     name="Get Player Bonus info for map",
     tags=["ck_bonus", "Refactored"],
 )
+@cached(
+    "selectPersonalBonusesMap:{steamid32}-{mapname}",
+    tags=["player:{steamid32}", "map:{mapname}", "table:ck_bonus"],
+)
 def selectPersonalBonusesMap(
     request: Request, response: Response, steamid32: str, mapname: str
 ):
@@ -203,46 +211,20 @@ def selectPersonalBonusesMap(
     and\n
     ```char sql_selectPlayerRankBonus[] = ....```\n
     and maybe more to output a single object with Bonus information for player"""
-    tic = time.perf_counter()
-
-    # Check if data is cached in Redis
-    cache_key = f"selectPersonalBonusesMap:{steamid32}-{mapname}"
-    cached_data = get_cache(cache_key)
-
-    if cached_data is not None:
-        print(f"[Redis] Loaded '{cache_key}' ({time.perf_counter() - tic:0.4f}s)")
-        response.headers["content-type"] = "application/json"
-        response.status_code = status.HTTP_200_OK
-        response.body = json.loads(cached_data, use_decimal=True, parse_nan=True)
-        return response
-
-    xquery = selectQuery(
-        surftimer.queries.sql_selectPersonalBonusRecords.format(steamid32, mapname)
+    xquery = selectPrepared(
+        surftimer.queries.sql_selectPersonalBonusRecords,
+        steamid=steamid32,
+        mapname=mapname,
     )
 
     if len(xquery) <= 0:
-        response.headers["content-type"] = "application/json"
-        response.status_code = status.HTTP_204_NO_CONTENT
-        return response
+        return None
 
     for completion in xquery:
-        zonegroup = completion["zonegroup"]
-        rank_query = selectQuery(
-            surftimer.queries.sql_selectPlayerRankBonusCount.format(
-                steamid32,
-                mapname,
-                zonegroup,
-                mapname,
-                zonegroup,
-            )
-        )
-        completion["rank"] = rank_query.pop()["COUNT(steamid)"]
-
-    toc = time.perf_counter()
-    print(f"Execution time {toc - tic:0.4f}")
-
-    # Cache the data in Redis
-    set_cache(cache_key, xquery)
+        # Ranks are the ones of the normal style, 0 when the player has no time in it
+        board = leaderboards.load(mapname, completion["zonegroup"], 0)
+        runtime = board.runtime(steamid32)
+        completion["rank"] = board.rank(steamid32) if runtime and runtime > 0 else 0
 
     return xquery
 
@@ -259,41 +241,23 @@ def selectPlayerRankBonus(
     mapname: str,
     zonegroup: int,
 ):
-    """```char sql_selectPlayerRankBonus[] = ....```"""
+    """```char sql_selectPlayerRankBonus[] = ....```\n
+    Read from the in-memory bonus leaderboard"""
     tic = time.perf_counter()
 
-    # # Check if data is cached in Redis
-    cache_key = f"selectPlayerRankBonus:{steamid32}-{mapname}-{zonegroup}"
-    cached_data = get_cache(cache_key)
+    board = leaderboards.load(mapname, zonegroup, 0)
+    runtime = board.runtime(steamid32)
 
-    if cached_data is not None:
-        print(f"[Redis] Loaded '{cache_key}' ({time.perf_counter() - tic:0.4f}s)")
-        response.headers["content-type"] = "application/json"
-        response.status_code = status.HTTP_200_OK
-        response.body = json.loads(cached_data, use_decimal=True, parse_nan=True)
-        return response
-
-    xquery = selectQuery(
-        surftimer.queries.sql_selectPlayerRankBonus.format(
-            steamid32,
-            mapname,
-            zonegroup,
-            mapname,
-            zonegroup,
-        )
-    )
-
-    if len(xquery) <= 0:
+    if not runtime or runtime <= 0:
         response.headers["content-type"] = "application/json"
         response.status_code = status.HTTP_204_NO_CONTENT
         return response
 
+    xquery = [{"name": entry["name"]} for entry in board.top(board.rank(steamid32))]
+
     toc = time.perf_counter()
     print(f"Execution time {toc - tic:0.4f}")
 
-    # Cache the data in Redis
-    set_cache(cache_key, xquery)
-
     return xquery
 
 
@@ -302,36 +266,17 @@ def selectPlayerRankBonus(
     name="Get Fastest Bonus",
     tags=["ck_bonus"],
 )
+@cached("selectFastestBonus:{mapname}", tags=["map:{mapname}", "table:ck_bonus"])
 def selectFastestBonus(
     request: Request,
     response: Response,
     mapname: str,
 ):
     """```char sql_selectFastestBonus[] = ....```"""
-    tic = time.perf_counter()
-
-    # Check if data is cached in Redis
-    cache_key = f"selectFastestBonus:{mapname}"
-    cached_data = get_cache(cache_key)
-    if cached_data is not None:
-        print(f"[Redis] Loaded '{cache_key}' ({time.perf_counter() - tic:0.4f}s)")
-        response.headers["content-type"] = "application/json"
-        response.status_code = status.HTTP_200_OK
-        response.body = json.loads(cached_data, use_decimal=True, parse_nan=True)
-        return response
-
     xquery = selectQuery(surftimer.queries.sql_selectFastestBonus.format(mapname))
 
     if len(xquery) <= 0:
-        response.headers["content-type"] = "application/json"
-        response.status_code = status.HTTP_204_NO_CONTENT
-        return response
-
-    toc = time.perf_counter()
-    print(f"Execution time {toc - tic:0.4f}")
-
-    # Cache the data in Redis
-    set_cache(cache_key, xquery)
+        return None
 
     return xquery
 
@@ -341,36 +286,17 @@ def selectFastestBonus(
     name="Get All Bonus Times For Map",
     tags=["ck_bonus"],
 )
+@cached("selectAllBonusTimesinMap:{mapname}", tags=["map:{mapname}", "table:ck_bonus"])
 def selectAllBonusTimesinMap(
     request: Request,
     response: Response,
     mapname: str,
 ):
     """```char sql_selectAllBonusTimesinMap[] = ....```"""
-    tic = time.perf_counter()
-
-    # Check if data is cached in Redis
-    cache_key = f"selectAllBonusTimesinMap:{mapname}"
-    cached_data = get_cache(cache_key)
-    if cached_data is not None:
-        print(f"[Redis] Loaded '{cache_key}' ({time.perf_counter() - tic:0.4f}s)")
-        response.headers["content-type"] = "application/json"
-        response.status_code = status.HTTP_200_OK
-        response.body = json.loads(cached_data, use_decimal=True, parse_nan=True)
-        return response
-
     xquery = selectQuery(surftimer.queries.sql_selectAllBonusTimesinMap.format(mapname))
 
     if len(xquery) <= 0:
-        response.headers["content-type"] = "application/json"
-        response.status_code = status.HTTP_204_NO_CONTENT
-        return response
-
-    toc = time.perf_counter()
-    print(f"Execution time {toc - tic:0.4f}")
-
-    # Cache the data in Redis
-    set_cache(cache_key, xquery)
+        return None
 
     return xquery
 
@@ -387,7 +313,8 @@ def selectTopBonusSurfers(
     style: int,
     zonegroup: int,
 ):
-    """```char sql_selectTopBonusSurfers[] = ....```"""
+    """```char sql_selectTopBonusSurfers[] = ....```\n
+    Read from the bonus leaderboard, names are the `ck_playerrank` ones of the style"""
     tic = time.perf_counter()
 
     # Check if data is cached in Redis
@@ -395,19 +322,42 @@ def selectTopBonusSurfers(
     cached_data = get_cache(cache_key)
     if cached_data is not None:
         print(f"[Redis] Loaded '{cache_key}' ({time.perf_counter() - tic:0.4f}s)")
-        response.headers["content-type"] = "application/json"
-        response.status_code = status.HTTP_200_OK
-        response.body = json.loads(cached_data, use_decimal=True, parse_nan=True)
-        return response
-
-    xquery = selectQuery(
-        surftimer.queries.sql_selectTopBonusSurfers.format(
-            mapname,
-            style,
-            style,
-            zonegroup,
-        )
-    )
+        return cached_response(cached_data)
+
+    board = leaderboards.load(mapname, zonegroup, style)
+    xquery = []
+    offset = 0
+    # Like the `runtime > -1.0` filter and the join of the query, players without a `ck_playerrank` row for the
+    # style are skipped and more are read until 100 are listed or the leaderboard runs out
+    while len(xquery) < 100:
+        top = []
+        while len(xquery) + len(top) < 100:
+            entry = board.at(offset, above=Decimal(-1))
+            if entry is None:
+                break
+            top.append(entry)
+            offset += 1
+        if not top:
+            break
+
+        placeholders = ", ".join(["%s"] * len(top))
+        names = {
+            row["steamid"]: row["name"]
+            for row in selectQuery(
+                surftimer.queries.sql_selectPlayersRankNames.format(placeholders),
+                [style, *[entry["steamid"] for entry in top]],
+            )
+        }
+        xquery += [
+            {
+                "steamid": entry["steamid"],
+                "name": names[entry["steamid"]],
+                "overall": entry["runtime"],
+                "mapname": mapname,
+            }
+            for entry in top
+            if entry["steamid"] in names
+        ]
 
     if len(xquery) <= 0:
         response.headers["content-type"] = "application/json"
@@ -418,9 +368,18 @@ def selectTopBonusSurfers(
     print(f"Execution time {toc - tic:0.4f}")
 
     # Cache the data in Redis
-    set_cache(cache_key, xquery)
+    cached_data = set_cache(
+        cache_key,
+        xquery,
+        tags=[
+            f"map:{mapname}",
+            *[f"player:{row['steamid']}" for row in xquery],
+            "table:ck_bonus",
+            "table:ck_playerrank",
+        ],
+    )
 
-    return xquery
+    return cached_response(cached_data)
 
 
 @router.delete(
@@ -438,6 +397,10 @@ def deleteBonus(
 
     xquery = insertQuery(surftimer.queries.sql_deleteBonus.format(mapname))
 
+    if xquery > 0:
+        leaderboards.reset(mapname)
+        completion_index.drop()
+    invalidate_tags(f"map:{mapname}")
     content_data = {"deleted": xquery, "xtime": time.perf_counter() - tic}
     if xquery < 1:
         # response.body = json.dumps(content_data).encode('utf-8')
@@ -460,6 +423,10 @@ def deleteBonus(
     name="Get Player Specific Bonus Data",
     tags=["ck_bonus", "strays"],
 )
+@cached(
+    "selectPlayerSpecificBonusData:{steamid32}-{mapname}-{zonegroup}",
+    tags=["player:{steamid32}", "map:{mapname}", "table:ck_bonus"],
+)
 def selectPlayerSpecificBonusData(
     request: Request,
     response: Response,
@@ -468,18 +435,6 @@ def selectPlayerSpecificBonusData(
     zonegroup: int,
 ):
     """```char sql_stray_selectPlayerSpecificBonusData[] = ....```"""
-    tic = time.perf_counter()
-
-    # Check if data is cached in Redis
-    cache_key = f"selectPlayerSpecificBonusData:{steamid32}-{mapname}-{zonegroup}"
-    cached_data = get_cache(cache_key)
-    if cached_data is not None:
-        print(f"[Redis] Loaded '{cache_key}' ({time.perf_counter() - tic:0.4f}s)")
-        response.headers["content-type"] = "application/json"
-        response.status_code = status.HTTP_200_OK
-        response.body = json.loads(cached_data, use_decimal=True, parse_nan=True)
-        return response
-
     xquery = selectQuery(
         surftimer.queries.sql_stray_selectPlayerSpecificBonusData.format(
             steamid32,
@@ -488,19 +443,7 @@ def selectPlayerSpecificBonusData(
         )
     )
 
-    if xquery:
-        xquery = xquery.pop()
-    else:
-        response.status_code = status.HTTP_204_NO_CONTENT
-        return response
-
-    toc = time.perf_counter()
-    print(f"Execution time {toc - tic:0.4f}")
-
-    # Cache the data in Redis
-    set_cache(cache_key, xquery)
-
-    return xquery
+    return xquery.pop() if xquery else None
 
 
 @router.get(
@@ -508,6 +451,10 @@ def selectPlayerSpecificBonusData(
     name="Get Count Bonus Finished",
     tags=["ck_bonus", "strays"],
 )
+@cached(
+    "selectTotalBonusCompletesCount:{mapname}-{zonegroup}",
+    tags=["map:{mapname}", "table:ck_bonus"],
+)
 def selectTotalBonusCompletesCount(
     request: Request,
     response: Response,
@@ -515,18 +462,6 @@ def selectTotalBonusCompletesCount(
     zonegroup: int,
 ):
     """```char sql_stray_selectTotalBonusCompletes[] = ....```"""
-    tic = time.perf_counter()
-
-    # Check if data is cached in Redis
-    cache_key = f"selectTotalBonusCompletesCount:{mapname}-{zonegroup}"
-    cached_data = get_cache(cache_key)
-    if cached_data is not None:
-        print(f"[Redis] Loaded '{cache_key}' ({time.perf_counter() - tic:0.4f}s)")
-        response.headers["content-type"] = "application/json"
-        response.status_code = status.HTTP_200_OK
-        response.body = json.loads(cached_data, use_decimal=True, parse_nan=True)
-        return response
-
     xquery = selectQuery(
         surftimer.queries.sql_stray_selectTotalBonusCompletes.format(
             mapname,
@@ -534,19 +469,7 @@ def selectTotalBonusCompletesCount(
         )
     )
 
-    if xquery:
-        xquery = xquery.pop()
-    else:
-        response.status_code = status.HTTP_204_NO_CONTENT
-        return response
-
-    toc = time.perf_counter()
-    print(f"Execution time {toc - tic:0.4f}")
-
-    # Cache the data in Redis
-    set_cache(cache_key, xquery)
-
-    return xquery
+    return xquery.pop() if xquery else None
 
 
 @router.get(
@@ -554,6 +477,10 @@ def selectTotalBonusCompletesCount(
     name="Get Player Bonus Rank",
     tags=["ck_bonus", "strays"],
 )
+@cached(
+    "selectPlayersBonusRank:{steamid32}-{mapname}-{zonegroup}",
+    tags=["player:{steamid32}", "map:{mapname}", "table:ck_bonus"],
+)
 def selectPlayersBonusRank(
     request: Request,
     response: Response,
@@ -562,37 +489,13 @@ def selectPlayersBonusRank(
     zonegroup: int,
 ):
     """```char sql_stray_selectPlayersBonusRank[] = ....```"""
-    tic = time.perf_counter()
-
-    # Check if data is cached in Redis
-    cache_key = f"selectPlayersBonusRank:{steamid32}-{mapname}-{zonegroup}"
-    cached_data = get_cache(cache_key)
-    if cached_data is not None:
-        print(f"[Redis] Loaded '{cache_key}' ({time.perf_counter() - tic:0.4f}s)")
-        response.headers["content-type"] = "application/json"
-        response.status_code = status.HTTP_200_OK
-        response.body = json.loads(cached_data, use_decimal=True, parse_nan=True)
-        return response
-
     xquery = selectQuery(
         surftimer.queries.sql_stray_selectPlayersBonusRank.format(
             steamid32, mapname, zonegroup, mapname, zonegroup
         )
     )
 
-    if xquery:
-        xquery = xquery.pop()
-    else:
-        response.status_code = status.HTTP_204_NO_CONTENT
-        return response
-
-    toc = time.perf_counter()
-    print(f"Execution time {toc - tic:0.4f}")
-
-    # Cache the data in Redis
-    set_cache(cache_key, xquery)
-
-    return xquery
+    return xquery.pop() if xquery else None
 
 
 @router.get(
@@ -610,37 +513,16 @@ def viewBonusRunRank(
 ):
     """```char sql_stray_viewBonusRunRank[] = ....```\n
     Returns the supposed rank for the data inputted\n
-    Get count of rows with time faster than `runtime`, to get exact player bonus rank"""
+    Get count of rows with time faster than `runtime`, to get exact player bonus rank\n
+    Read from the in-memory bonus leaderboard"""
     tic = time.perf_counter()
 
-    # Check if data is cached in Redis
-    cache_key = f"viewBonusRunRank:{mapname}-{zonegroup}-{runtime}-{style}"
-    cached_data = get_cache(cache_key)
-    if cached_data is not None:
-        print(f"[Redis] Loaded '{cache_key}' ({time.perf_counter() - tic:0.4f}s)")
-        response.headers["content-type"] = "application/json"
-        response.status_code = status.HTTP_200_OK
-        response.body = json.loads(cached_data, use_decimal=True, parse_nan=True)
-        return response
-
-    xquery = selectQuery(
-        surftimer.queries.sql_stray_viewBonusRunRank.format(
-            mapname, zonegroup, runtime, style
-        )
-    )
-
-    if xquery:
-        xquery = xquery.pop()
-    else:
-        response.status_code = status.HTTP_204_NO_CONTENT
-        return response
+    board = leaderboards.load(mapname, zonegroup, style)
+    xquery = {"count(runtime)+1": board.rank_for_time(runtime)}
 
     toc = time.perf_counter()
     print(f"Execution time {toc - tic:0.4f}")
 
-    # Cache the data in Redis
-    set_cache(cache_key, xquery)
-
     return xquery
 
 
@@ -662,6 +544,10 @@ def deleteSpecificBonus(
         surftimer.queries.sql_stray_deleteSpecificBonus.format(zonegroup, mapname)
     )
 
+    if xquery > 0:
+        leaderboards.reset(mapname, zonegroup)
+        completion_index.drop()
+    invalidate_tags(f"map:{mapname}")
     content_data = {"deleted": xquery, "xtime": time.perf_counter() - tic}
     if xquery < 1:
         # response.body = json.dumps(content_data).encode('utf-8')
@@ -683,6 +569,10 @@ def deleteSpecificBonus(
     name="Personal Bonus Prestrafe Speeds",
     tags=["ck_bonus", "strays"],
 )
+@cached(
+    "selectPersonalBonusPrestrafeSpeeds:{steamid32}-{mapname}",
+    tags=["player:{steamid32}", "map:{mapname}", "table:ck_bonus"],
+)
 def selectPersonalBonusPrestrafeSpeeds(
     request: Request,
     response: Response,
@@ -690,18 +580,6 @@ def selectPersonalBonusPrestrafeSpeeds(
     mapname: str,
 ):
     """```char sql_stray_selectPersonalBonusPrestrafeSpeeds[] = ....```"""
-    tic = time.perf_counter()
-
-    # Check if data is cached in Redis
-    cache_key = f"selectPersonalBonusPrestrafeSpeeds:{steamid32}-{mapname}"
-    cached_data = get_cache(cache_key)
-    if cached_data is not None:
-        print(f"[Redis] Loaded '{cache_key}' ({time.perf_counter() - tic:0.4f}s)")
-        response.headers["content-type"] = "application/json"
-        response.status_code = status.HTTP_200_OK
-        response.body = json.loads(cached_data, use_decimal=True, parse_nan=True)
-        return response
-
     xquery = selectQuery(
         surftimer.queries.sql_stray_selectPersonalBonusPrestrafeSpeeds.format(
             steamid32, mapname
@@ -709,14 +587,7 @@ def selectPersonalBonusPrestrafeSpeeds(
     )
 
     if len(xquery) <= 0:
-        response.status_code = status.HTTP_204_NO_CONTENT
-        return response
-
-    toc = time.perf_counter()
-    print(f"Execution time {toc - tic:0.4f}")
-
-    # Cache the data in Redis
-    set_cache(cache_key, xquery)
+        return None
 
     return xquery
 
@@ -726,6 +597,10 @@ def selectPersonalBonusPrestrafeSpeeds(
     name="Map Bonus Rank Style",
     tags=["ck_bonus", "strays"],
 )
+@cached(
+    "selectMapRankBonusStyle:{steamid32}-{mapname}-{style}-{zonegroup}",
+    tags=["player:{steamid32}", "map:{mapname}", "table:ck_bonus"],
+)
 def selectMapRankBonusStyle(
     request: Request,
     response: Response,
@@ -736,18 +611,6 @@ def selectMapRankBonusStyle(
 ):
     """```char sql_stray_selectMapRankBonusStyle[] = ....```\n
     Returns the name of the player for the given bonus and style if they have a PB"""
-    tic = time.perf_counter()
-
-    # Check if data is cached in Redis
-    cache_key = f"selectPersonalBonusPrestrafeSpeeds:{steamid32}-{mapname}"
-    cached_data = get_cache(cache_key)
-    if cached_data is not None:
-        print(f"[Redis] Loaded '{cache_key}' ({time.perf_counter() - tic:0.4f}s)")
-        response.headers["content-type"] = "application/json"
-        response.status_code = status.HTTP_200_OK
-        response.body = json.loads(cached_data, use_decimal=True, parse_nan=True)
-        return response
-
     xquery = selectQuery(
         surftimer.queries.sql_stray_selectMapRankBonusStyle.format(
             steamid32,
@@ -761,14 +624,7 @@ def selectMapRankBonusStyle(
     )
 
     if len(xquery) <= 0:
-        response.status_code = status.HTTP_204_NO_CONTENT
-        return response
-
-    toc = time.perf_counter()
-    print(f"Execution time {toc - tic:0.4f}")
-
-    # Cache the data in Redis
-    set_cache(cache_key, xquery)
+        return None
 
     return xquery
 
@@ -787,40 +643,16 @@ def viewBonusStyleRunRank(
     runtime: Decimal,
 ):
     """```char sql_stray_viewBonusStyleRunRank[] = ....```\n
-    Returns the name of the player for the given bonus and style if they have a PB"""
+    Returns the name of the player for the given bonus and style if they have a PB\n
+    Read from the in-memory bonus leaderboard"""
     tic = time.perf_counter()
 
-    # Check if data is cached in Redis
-    cache_key = f"viewBonusStyleRunRank:{mapname}-{style}-{zonegroup}-{runtime}"
-    cached_data = get_cache(cache_key)
-    if cached_data is not None:
-        print(f"[Redis] Loaded '{cache_key}' ({time.perf_counter() - tic:0.4f}s)")
-        response.headers["content-type"] = "application/json"
-        response.status_code = status.HTTP_200_OK
-        response.body = json.loads(cached_data, use_decimal=True, parse_nan=True)
-        return response
-
-    xquery = selectQuery(
-        surftimer.queries.sql_stray_viewBonusStyleRunRank.format(
-            mapname,
-            zonegroup,
-            style,
-            runtime,
-        )
-    )
-
-    if xquery:
-        xquery = xquery.pop()
-    else:
-        response.status_code = status.HTTP_204_NO_CONTENT
-        return response
+    board = leaderboards.load(mapname, zonegroup, style)
+    xquery = {"count(runtime)+1": board.rank_for_time(runtime)}
 
     toc = time.perf_counter()
     print(f"Execution time {toc - tic:0.4f}")
 
-    # Cache the data in Redis
-    set_cache(cache_key, xquery)
-
     return xquery
 
 
@@ -829,6 +661,10 @@ def viewBonusStyleRunRank(
     name="Select Style Player Bonus Records",
     tags=["ck_bonus", "strays"],
 )
+@cached(
+    "selectPersonalBonusStylesRecords:{steamid32}-{mapname}-{style}",
+    tags=["player:{steamid32}", "map:{mapname}", "table:ck_bonus"],
+)
 def selectPersonalBonusStylesRecords(
     request: Request,
     response: Response,
@@ -838,18 +674,6 @@ def selectPersonalBonusStylesRecords(
 ):
     """```char sql_stray_selectPersonalBonusStylesRecords[] = ....```\n
     Returns the name of the player for the given bonus and style if they have a PB"""
-    tic = time.perf_counter()
-
-    # Check if data is cached in Redis
-    cache_key = f"selectPersonalBonusStylesRecords:{steamid32}-{mapname}-{style}"
-    cached_data = get_cache(cache_key)
-    if cached_data is not None:
-        print(f"[Redis] Loaded '{cache_key}' ({time.perf_counter() - tic:0.4f}s)")
-        response.headers["content-type"] = "application/json"
-        response.status_code = status.HTTP_200_OK
-        response.body = json.loads(cached_data, use_decimal=True, parse_nan=True)
-        return response
-
     xquery = selectQuery(
         surftimer.queries.sql_stray_selectPersonalBonusStylesRecords.format(
             steamid32, mapname, style
@@ -857,14 +681,7 @@ def selectPersonalBonusStylesRecords(
     )
 
     if len(xquery) <= 0:
-        response.status_code = status.HTTP_204_NO_CONTENT
-        return response
-
-    toc = time.perf_counter()
-    print(f"Execution time {toc - tic:0.4f}")
-
-    # Cache the data in Redis
-    set_cache(cache_key, xquery)
+        return None
 
     return xquery
 
@@ -874,6 +691,10 @@ def selectPersonalBonusStylesRecords(
     name="Select Style Player Bonus Records",
     tags=["ck_bonus", "strays"],
 )
+@cached(
+    "viewPRinfoMapRankBonusCallback:{steamid32}-{mapname}-{zonegroup}",
+    tags=["player:{steamid32}", "map:{mapname}", "table:ck_bonus"],
+)
 def viewPRinfoMapRankBonusCallback(
     request: Request,
     response: Response,
@@ -882,37 +703,13 @@ def viewPRinfoMapRankBonusCallback(
     zonegroup: int,
 ):
     """```char sql_stray_viewPRinfoMapRankBonusCallback[] = ....```\n"""
-    tic = time.perf_counter()
-
-    # Check if data is cached in Redis
-    cache_key = f"viewPRinfoMapRankBonusCallback:{steamid32}-{mapname}-{zonegroup}"
-    cached_data = get_cache(cache_key)
-    if cached_data is not None:
-        print(f"[Redis] Loaded '{cache_key}' ({time.perf_counter() - tic:0.4f}s)")
-        response.headers["content-type"] = "application/json"
-        response.status_code = status.HTTP_200_OK
-        response.body = json.loads(cached_data, use_decimal=True, parse_nan=True)
-        return response
-
     xquery = selectQuery(
         surftimer.queries.sql_stray_viewPRinfoMapRankBonusCallback.format(
             steamid32, mapname, zonegroup, mapname, zonegroup
         )
     )
 
-    if xquery:
-        xquery = xquery.pop()
-    else:
-        response.status_code = status.HTTP_204_NO_CONTENT
-        return response
-
-    toc = time.perf_counter()
-    print(f"Execution time {toc - tic:0.4f}")
-
-    # Cache the data in Redis
-    set_cache(cache_key, xquery)
-
-    return xquery
+    return xquery.pop() if xquery else None
 
 
 @router.get(
@@ -920,6 +717,11 @@ def viewPRinfoMapRankBonusCallback(
     name="Select Style Player Bonus Records",
     tags=["ck_bonus", "strays"],
 )
+@cached(
+    "getRankSteamIdBonus:{mapname}-{zonegroup}-{limit}",
+    tags=["map:{mapname}", "table:ck_bonus"],
+    expiry=config["REDIS"]["EXPIRY"],
+)
 def getRankSteamIdBonus(
     request: Request,
     response: Response,
@@ -929,42 +731,16 @@ def getRankSteamIdBonus(
 ):
     """```char sql_stray_getRankSteamIdBonus[] = ....```\n
     Returns the name of the player for the given bonus and style if they have a PB"""
-    tic = time.perf_counter()
-
-    # Check if data is cached in Redis
-    cache_key = f"getRankSteamIdBonus:{mapname}-{zonegroup}-{limit}"
-    cached_data = get_cache(cache_key)
-    if cached_data is not None:
-        print(f"[Redis] Loaded '{cache_key}' ({time.perf_counter() - tic:0.4f}s)")
-        response.headers["content-type"] = "application/json"
-        response.status_code = status.HTTP_200_OK
-        response.body = json.loads(cached_data, use_decimal=True, parse_nan=True)
-        return response
-
     if zonegroup == 0:
         xquery = selectQuery(
             surftimer.queries.sql_stray_steamIdFromMapRank.format(mapname, limit)
         )
     else:
-        xquery = selectQuery(
-            surftimer.queries.sql_stray_getRankSteamIdBonus.format(
-                mapname, zonegroup, limit
-            )
-        )
+        # Bonus times come from the in-memory leaderboard, `ck_playertimes` is not written through the API
+        entry = leaderboards.load(mapname, zonegroup, 0).at(limit, above=Decimal(-1))
+        xquery = [{"steamid": entry["steamid"]}] if entry else []
 
-    if xquery:
-        xquery = xquery.pop()
-    else:
-        response.status_code = status.HTTP_204_NO_CONTENT
-        return response
-
-    toc = time.perf_counter()
-    print(f"Execution time {toc - tic:0.4f}")
-
-    # Cache the data in Redis
-    set_cache(cache_key, xquery)
-
-    return xquery
+    return xquery.pop() if xquery else None
 
 
 @router.delete(
@@ -985,6 +761,10 @@ def deleteWipePlayerBonus(
         surftimer.queries.sql_stray_deleteWipePlayerBonus.format(steamid32)
     )
 
+    if xquery > 0:
+        leaderboards.remove(steamid32)
+        completion_index.drop(steamid32)
+    invalidate_tags(f"player:{steamid32}", "table:ck_bonus")
     content_data = {"deleted": xquery, "xtime": time.perf_counter() - tic}
     if xquery < 1:
         # response.body = json.dumps(content_data).encode('utf-8')
@@ -1006,6 +786,10 @@ def deleteWipePlayerBonus(
     name="Select Player Bonus PR Info",
     tags=["ck_bonus", "strays"],
 )
+@cached(
+    "pr_bonusInfo:{steamid32}-{mapname}-{zonegroup}",
+    tags=["player:{steamid32}", "map:{mapname}", "table:ck_bonus"],
+)
 def pr_bonusInfo(
     request: Request,
     response: Response,
@@ -1014,35 +798,11 @@ def pr_bonusInfo(
     zonegroup: int,
 ):
     """```char sql_stray_pr_bonusInfo[] = ....```\n"""
-    tic = time.perf_counter()
-
-    # Check if data is cached in Redis
-    cache_key = f"pr_bonusInfo:{steamid32}-{mapname}-{zonegroup}"
-    cached_data = get_cache(cache_key)
-    if cached_data is not None:
-        print(f"[Redis] Loaded '{cache_key}' ({time.perf_counter() - tic:0.4f}s)")
-        response.headers["content-type"] = "application/json"
-        response.status_code = status.HTTP_200_OK
-        response.body = json.loads(cached_data, use_decimal=True, parse_nan=True)
-        return response
-
     xquery = selectQuery(
         surftimer.queries.sql_stray_pr_bonusInfo.format(steamid32, mapname, zonegroup)
     )
 
-    if xquery:
-        xquery = xquery.pop()
-    else:
-        response.status_code = status.HTTP_204_NO_CONTENT
-        return response
-
-    toc = time.perf_counter()
-    print(f"Execution time {toc - tic:0.4f}")
-
-    # Cache the data in Redis
-    set_cache(cache_key, xquery)
-
-    return xquery
+    return xquery.pop() if xquery else None
 
 
 @router.get(
@@ -1050,39 +810,56 @@ def pr_bonusInfo(
     name="Count Finished Player Finished Bonuses",
     tags=["ck_bonus", "strays", "Points Calculation"],
 )
+@cached(
+    "point_calc_countFinishedBonus:{style}-{steamid32}",
+    tags=["player:{steamid32}", "table:ck_bonus"],
+    expiry=config["REDIS"]["EXPIRY"],
+)
 def point_calc_countFinishedBonus(
     request: Request,
     response: Response,
     style: int,
     steamid32: str,
 ):
-    """```char sql_stray_point_calc_countFinishedBonus[] = ....```\n"""
-    tic = time.perf_counter()
+    """```char sql_stray_point_calc_countFinishedBonus[] = ....```\n
+    Ranked with window functions in `surftimer.ranking`"""
+    xquery = surftimer.ranking.select_finished_bonuses(steamid32, style)
 
-    # Check if data is cached in Redis
-    cache_key = f"point_calc_countFinishedBonus:{style}-{steamid32}"
-    cached_data = get_cache(cache_key)
-    if cached_data is not None:
-        print(f"[Redis] Loaded '{cache_key}' ({time.perf_counter() - tic:0.4f}s)")
-        response.headers["content-type"] = "application/json"
-        response.status_code = status.HTTP_200_OK
-        response.body = json.loads(cached_data, use_decimal=True, parse_nan=True)
-        return response
+    if len(xquery) <= 0:
+        return None
 
-    xquery = selectQuery(
-        surftimer.queries.sql_stray_point_calc_countFinishedBonus.format(
-            style, style, steamid32, style
-        )
-    )
+    return xquery
 
-    if len(xquery) <= 0:
-        response.status_code = status.HTTP_204_NO_CONTENT
-        return response
+
+@router.post(
+    "/surftimer/rebuildBonusLeaderboards",
+    name="Rebuild Bonus Leaderboards",
+    tags=["ck_bonus"],
+)
+def rebuildBonusLeaderboards(
+    request: Request,
+    response: Response,
+    mapname: str = None,
+    zonegroup: int = None,
+):
+    """Reads the bonus leaderboards of `mapname` (every map by default) or only its `zonegroup` again from
+    `ck_bonus`, for times changed without going through the API\n
+    With `REDIS.LEADERBOARD_BACKEND` set to `"redis"` the sorted sets are seeded again right away, otherwise every
+    worker reads them again on next use"""
+    tic = time.perf_counter()
+
+    rebuilt = leaderboards.rebuild(mapname, zonegroup)
+
+    if mapname is None:
+        invalidate_tags("table:ck_bonus")
+    else:
+        invalidate_tags(f"map:{mapname}")
+    content_data = {"rebuilt": rebuilt, "xtime": time.perf_counter() - tic}
 
     toc = time.perf_counter()
     print(f"Execution time {toc - tic:0.4f}")
 
-    # Cache the data in Redis
-    set_cache(cache_key, xquery)
-
-    return xquery
+    response.body = json.dumps(content_data).encode("utf-8")
+    response.headers["content-type"] = "application/json"
+    response.status_code = status.HTTP_200_OK
+    return response
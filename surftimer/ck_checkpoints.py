@@ -1,7 +1,14 @@
 from fastapi import APIRouter, Request, Response, status
 from fastapi.responses import JSONResponse
-from sql import selectQuery, insertQuery
-from globals import get_cache, set_cache
+from sql import (
+    selectQueryAsync,
+    insertQueryAsync,
+    selectPreparedAsync,
+    insertPreparedAsync,
+    runAsync,
+    transaction,
+)
+from globals import cached, invalidate_tags, config
 from pydantic import BaseModel
 from decimal import Decimal
 import simplejson as json
@@ -20,9 +27,80 @@ class PlayerCheckpoints(BaseModel):
     zonegroup: int
 
 
+class RunCheckpoint(BaseModel):
+    """Single **Checkpoint** of a run"""
+
+    cp: int
+    time: Decimal
+    stage_time: Decimal
+    stage_attempts: int
+
+
+class PlayerRunCheckpoints(BaseModel):
+    """Body for adding or updating all **Checkpoint** times of a run at once"""
+
+    steamid: str
+    mapname: str
+    zonegroup: int
+    checkpoints: list[RunCheckpoint]
+
+
 router = APIRouter()
 
 
+def upsertRunCheckpoints(data: PlayerRunCheckpoints):
+    """Writes all checkpoints of a run with one multi-row `INSERT ... ON DUPLICATE KEY UPDATE` in a single transaction\n
+    The existing rows are locked and compared first so every `cp` gets an `inserted`, `updated` or `unchanged` outcome
+    """
+    # Last entry wins if a `cp` was sent more than once
+    checkpoints = {checkpoint.cp: checkpoint for checkpoint in data.checkpoints}
+    outcomes = []
+    values = []
+
+    with transaction() as mydb:
+        mycursor = mydb.cursor(dictionary=True)
+        mycursor.execute(
+            surftimer.queries.sql_selectRunCheckpointsForUpdate,
+            (data.steamid, data.mapname, data.zonegroup),
+        )
+        current = {row["cp"]: row for row in mycursor.fetchall()}
+
+        for cp, checkpoint in checkpoints.items():
+            row = current.get(cp)
+            if row is None:
+                outcome = "inserted"
+            elif (row["time"], row["stage_time"], row["stage_attempts"]) == (
+                checkpoint.time,
+                checkpoint.stage_time,
+                checkpoint.stage_attempts,
+            ):
+                outcome = "unchanged"
+            else:
+                outcome = "updated"
+
+            outcomes.append({"cp": cp, "outcome": outcome})
+            if outcome != "unchanged":
+                values += [
+                    data.steamid,
+                    data.mapname,
+                    cp,
+                    checkpoint.time,
+                    checkpoint.stage_time,
+                    checkpoint.stage_attempts,
+                    data.zonegroup,
+                ]
+
+        if values:
+            rows = ", ".join(["(%s, %s, %s, %s, %s, %s, %s)"] * (len(values) // 7))
+            mycursor.execute(
+                surftimer.queries.sql_InsertOrUpdateCheckpointsBulk.format(rows),
+                values,
+            )
+        mycursor.close()
+
+    return outcomes
+
+
 # ck_checkpoints
 @router.post(
     "/surftimer/insertOrUpdateCheckpoints",
@@ -36,19 +114,17 @@ async def insertOrUpdateCheckpoints(
 ):
     tic = time.perf_counter()
 
-    sql = surftimer.queries.sql_InsertOrUpdateCheckpoints.format(
-        data.steamid,
-        data.mapname,
-        data.cp,
-        data.time,
-        data.stage_time,
-        data.stage_attempts,
-        data.zonegroup,
-        data.time,
-        data.stage_time,
-        data.stage_attempts,
+    xquery = await insertPreparedAsync(
+        surftimer.queries.sql_InsertOrUpdateCheckpoints,
+        steamid=data.steamid,
+        mapname=data.mapname,
+        cp=data.cp,
+        time=data.time,
+        stage_time=data.stage_time,
+        stage_attempts=data.stage_attempts,
+        zonegroup=data.zonegroup,
     )
-    xquery = insertQuery(sql)
+    invalidate_tags(f"player:{data.steamid}")
     content_data = {"inserted": xquery, "xtime": time.perf_counter() - tic}
 
     if xquery < 1:
@@ -66,40 +142,62 @@ async def insertOrUpdateCheckpoints(
     return response
 
 
+@router.post(
+    "/surftimer/insertOrUpdateCheckpointsBulk",
+    name="Insert or Update all Checkpoints of a run",
+    tags=["ck_checkpoints"],
+)
+async def insertOrUpdateCheckpointsBulk(
+    request: Request,
+    response: Response,
+    data: PlayerRunCheckpoints,
+):
+    """Batch variant of `insertOrUpdateCheckpoints`, one request and one commit per run instead of one per checkpoint"""
+    tic = time.perf_counter()
+
+    outcomes = await runAsync(upsertRunCheckpoints, data, write=True)
+    invalidate_tags(f"player:{data.steamid}")
+    content_data = {
+        "inserted": sum(row["outcome"] == "inserted" for row in outcomes),
+        "updated": sum(row["outcome"] == "updated" for row in outcomes),
+        "unchanged": sum(row["outcome"] == "unchanged" for row in outcomes),
+        "checkpoints": outcomes,
+        "xtime": time.perf_counter() - tic,
+    }
+
+    if content_data["inserted"] + content_data["updated"] < 1:
+        response.headers["content-type"] = "application/json"
+        response.status_code = status.HTTP_304_NOT_MODIFIED
+        return response
+
+    # Prepare the response
+    toc = time.perf_counter()
+    print(f"Execution time {toc - tic:0.4f}")
+
+    response.body = json.dumps(content_data).encode("utf-8")
+    response.status_code = status.HTTP_201_CREATED
+    return response
+
+
 @router.get(
     "/surftimer/selectCheckpoints",
     name="Get Checkpoints",
     tags=["ck_checkpoints"],
 )
+@cached(
+    "selectCheckpoints:{mapname}-{steamid32}",
+    tags=["player:{steamid32}", "map:{mapname}", "table:ck_checkpoints"],
+)
 async def selectCheckpoints(
     request: Request, response: Response, mapname: str, steamid32: str
 ):
     """`char[] sql_selectCheckpoints = ....`"""
-    tic = time.perf_counter()
-
-    # Check if data is cached in Redis
-    cache_key = f"selectCheckpoints:{mapname}-{steamid32}"
-    cached_data = get_cache(cache_key)
-    if cached_data is not None:
-        print(f"[Redis] Loaded '{cache_key}' ({time.perf_counter() - tic:0.4f}s)")
-        response.headers["content-type"] = "application/json"
-        response.status_code = status.HTTP_200_OK
-        response.body = json.loads(cached_data, use_decimal=True, parse_nan=True)
-        return response
-
-    xquery = selectQuery(
-        surftimer.queries.sql_selectCheckpoints.format(mapname, steamid32)
+    xquery = await selectPreparedAsync(
+        surftimer.queries.sql_selectCheckpoints, mapname=mapname, steamid=steamid32
     )
 
     if len(xquery) <= 0:
-        response.status_code = status.HTTP_204_NO_CONTENT
-        return response
-
-    # Cache the data in Redis
-    set_cache(cache_key, xquery)
-
-    toc = time.perf_counter()
-    print(f"Execution time {toc - tic:0.4f}")
+        return None
 
     return xquery
 
@@ -109,6 +207,10 @@ async def selectCheckpoints(
     name="Get Checkpoints in Zonegroup",
     tags=["ck_checkpoints"],
 )
+@cached(
+    "selectCheckpointsinZoneGroup:{mapname}-{steamid32}-{zonegroup}",
+    tags=["player:{steamid32}", "map:{mapname}", "table:ck_checkpoints"],
+)
 async def selectCheckpointsinZoneGroup(
     request: Request,
     response: Response,
@@ -117,35 +219,14 @@ async def selectCheckpointsinZoneGroup(
     zonegroup: int,
 ):
     """`char[] sql_selectCheckpointsinZoneGroup = ....`"""
-    tic = time.perf_counter()
-
-    # Check if data is cached in Redis
-    cache_key = f"selectCheckpointsinZoneGroup:{mapname}-{steamid32}-{zonegroup}"
-    cached_data = get_cache(cache_key)
-    if cached_data is not None:
-        print(f"[Redis] Loaded '{cache_key}' ({time.perf_counter() - tic:0.4f}s)")
-        response.headers["content-type"] = "application/json"
-        response.status_code = status.HTTP_200_OK
-        response.body = json.loads(cached_data, use_decimal=True, parse_nan=True)
-        return response
-
-    xquery = selectQuery(
+    xquery = await selectQueryAsync(
         surftimer.queries.sql_selectCheckpointsinZoneGroup.format(
             mapname, steamid32, zonegroup
         )
     )
 
-    if len(xquery) > 0:
-        print("Hit, length:", len(xquery))
-    else:
-        response.status_code = status.HTTP_204_NO_CONTENT
-        return response
-
-    # Cache the data in Redis
-    set_cache(cache_key, xquery)
-
-    toc = time.perf_counter()
-    print(f"Execution time {toc - tic:0.4f}")
+    if len(xquery) <= 0:
+        return None
 
     return xquery
 
@@ -155,39 +236,27 @@ async def selectCheckpointsinZoneGroup(
     name="Get Record Checkpoints",
     tags=["ck_checkpoints"],
 )
+@cached(
+    "selectRecordCheckpoints:{steamid32}-{mapname}-{mapname}",
+    tags=[
+        "player:{steamid32}",
+        "map:{mapname}",
+        "table:ck_checkpoints",
+        "table:ck_bonus",
+    ],
+)
 async def selectRecordCheckpoints(
     request: Request, response: Response, steamid32: str, mapname: str
 ):
     """`char[] sql_selectRecordCheckpoints = ....`"""
-    tic = time.perf_counter()
-
-    # Check if data is cached in Redis
-    cache_key = f"selectRecordCheckpoints:{steamid32}-{mapname}-{mapname}"
-    cached_data = get_cache(cache_key)
-    if cached_data is not None:
-        print(f"[Redis] Loaded '{cache_key}' ({time.perf_counter() - tic:0.4f}s)")
-        response.headers["content-type"] = "application/json"
-        response.status_code = status.HTTP_200_OK
-        response.body = json.loads(cached_data, use_decimal=True, parse_nan=True)
-        return response
-
-    xquery = selectQuery(
+    xquery = await selectQueryAsync(
         surftimer.queries.sql_selectRecordCheckpoints.format(
             steamid32, mapname, mapname
         )
     )
 
-    if len(xquery) > 0:
-        print("Hit, length:", len(xquery))
-    else:
-        response.status_code = status.HTTP_204_NO_CONTENT
-        return response
-
-    # Cache the data in Redis
-    set_cache(cache_key, xquery)
-
-    toc = time.perf_counter()
-    print(f"Execution time {toc - tic:0.4f}")
+    if len(xquery) <= 0:
+        return None
 
     return xquery
 
@@ -205,8 +274,11 @@ async def deleteCheckpoints(
     """```char sql_deleteCheckpoints[] = ....```"""
     tic = time.perf_counter()
 
-    xquery = insertQuery(surftimer.queries.sql_deleteCheckpoints.format(mapname))
+    xquery = await insertQueryAsync(
+        surftimer.queries.sql_deleteCheckpoints.format(mapname)
+    )
 
+    invalidate_tags(f"map:{mapname}")
     content_data = {"deleted": xquery, "xtime": time.perf_counter() - tic}
     if xquery < 1:
         # response.body = json.dumps(content_data).encode('utf-8')
@@ -228,37 +300,20 @@ async def deleteCheckpoints(
     name="Get Stage Times",
     tags=["ck_checkpoints"],
 )
+@cached(
+    "selectStageTimes:{mapname}-{steamid32}",
+    tags=["player:{steamid32}", "map:{mapname}", "table:ck_checkpoints"],
+)
 async def selectStageTimes(
     request: Request, response: Response, mapname: str, steamid32: str
 ):
     """`char[] sql_selectStageTimes = ....`"""
-    tic = time.perf_counter()
-
-    # Check if data is cached in Redis
-    cache_key = f"selectStageTimes:{mapname}-{steamid32}"
-    cached_data = get_cache(cache_key)
-    if cached_data is not None:
-        print(f"[Redis] Loaded '{cache_key}' ({time.perf_counter() - tic:0.4f}s)")
-        response.headers["content-type"] = "application/json"
-        response.status_code = status.HTTP_200_OK
-        response.body = json.loads(cached_data, use_decimal=True, parse_nan=True)
-        return response
-
-    xquery = selectQuery(
-        surftimer.queries.sql_selectStageTimes.format(mapname, steamid32)
+    xquery = await selectPreparedAsync(
+        surftimer.queries.sql_selectStageTimes, mapname=mapname, steamid=steamid32
     )
 
-    if len(xquery) > 0:
-        print("Hit, length:", len(xquery))
-    else:
-        response.status_code = status.HTTP_204_NO_CONTENT
-        return response
-
-    # Cache the data in Redis
-    set_cache(cache_key, xquery)
-
-    toc = time.perf_counter()
-    print(f"Execution time {toc - tic:0.4f}")
+    if len(xquery) <= 0:
+        return None
 
     return xquery
 
@@ -268,37 +323,20 @@ async def selectStageTimes(
     name="Get Stage Attempts",
     tags=["ck_checkpoints"],
 )
+@cached(
+    "selectStageAttempts:{mapname}-{steamid32}",
+    tags=["player:{steamid32}", "map:{mapname}", "table:ck_checkpoints"],
+)
 async def selectStageAttempts(
     request: Request, response: Response, mapname: str, steamid32: str
 ):
     """`char[] sql_selectStageAttempts = ....`"""
-    tic = time.perf_counter()
-
-    # Check if data is cached in Redis
-    cache_key = f"selectStageAttempts:{mapname}-{steamid32}"
-    cached_data = get_cache(cache_key)
-    if cached_data is not None:
-        print(f"[Redis] Loaded '{cache_key}' ({time.perf_counter() - tic:0.4f}s)")
-        response.headers["content-type"] = "application/json"
-        response.status_code = status.HTTP_200_OK
-        response.body = json.loads(cached_data, use_decimal=True, parse_nan=True)
-        return response
-
-    xquery = selectQuery(
+    xquery = await selectQueryAsync(
         surftimer.queries.sql_selectStageAttempts.format(mapname, steamid32)
     )
 
-    if len(xquery) > 0:
-        print("Hit, length:", len(xquery))
-    else:
-        response.status_code = status.HTTP_204_NO_CONTENT
-        return response
-
-    # Cache the data in Redis
-    set_cache(cache_key, xquery)
-
-    toc = time.perf_counter()
-    print(f"Execution time {toc - tic:0.4f}")
+    if len(xquery) <= 0:
+        return None
 
     return xquery
 
@@ -316,10 +354,11 @@ async def deleteWipePlayerCheckpoints(
     """```char sql_stray_deleteWipePlayerCheckpoints[] = ....```"""
     tic = time.perf_counter()
 
-    xquery = insertQuery(
+    xquery = await insertQueryAsync(
         surftimer.queries.sql_stray_deleteWipePlayerCheckpoints.format(steamid32)
     )
 
+    invalidate_tags(f"player:{steamid32}")
     content_data = {"deleted": xquery, "xtime": time.perf_counter() - tic}
     if xquery < 1:
         # response.body = json.dumps(content_data).encode('utf-8')
@@ -341,6 +380,10 @@ async def deleteWipePlayerCheckpoints(
     name="Get Player Checkpoints for !cpr",
     tags=["ck_checkpoints", "strays"],
 )
+@cached(
+    "selectCPR:{steamid32}-{mapname}",
+    tags=["player:{steamid32}", "map:{mapname}", "table:ck_checkpoints"],
+)
 async def stray_selectCPR(
     request: Request,
     response: Response,
@@ -348,33 +391,12 @@ async def stray_selectCPR(
     mapname: str,
 ):
     """`char[] sql_stray_selectCPR = ....`"""
-    tic = time.perf_counter()
-
-    # Check if data is cached in Redis
-    cache_key = f"selectCPR:{steamid32}-{mapname}"
-    cached_data = get_cache(cache_key)
-    if cached_data is not None:
-        print(f"[Redis] Loaded '{cache_key}' ({time.perf_counter() - tic:0.4f}s)")
-        response.headers["content-type"] = "application/json"
-        response.status_code = status.HTTP_200_OK
-        response.body = json.loads(cached_data, use_decimal=True, parse_nan=True)
-        return response
-
-    xquery = selectQuery(
+    xquery = await selectQueryAsync(
         surftimer.queries.sql_stray_selectCPR.format(steamid32, mapname)
     )
 
-    if len(xquery) > 0:
-        print("Hit, length:", len(xquery))
-    else:
-        response.status_code = status.HTTP_204_NO_CONTENT
-        return response
-
-    # Cache the data in Redis
-    set_cache(cache_key, xquery)
-
-    toc = time.perf_counter()
-    print(f"Execution time {toc - tic:0.4f}")
+    if len(xquery) <= 0:
+        return None
 
     return xquery
 
@@ -384,6 +406,11 @@ async def stray_selectCPR(
     name="Get Player CCP info",
     tags=["ck_checkpoints", "strays"],
 )
+@cached(
+    "ccp_getPlayerPR:{mapname}-{steamid32}",
+    tags=["player:{steamid32}", "map:{mapname}", "table:ck_checkpoints"],
+    expiry=config["REDIS"]["EXPIRY"],
+)
 async def ccp_getPlayerPR(
     request: Request,
     response: Response,
@@ -391,32 +418,11 @@ async def ccp_getPlayerPR(
     steamid32: str,
 ):
     """`char[] sql_stray_ccp_getPlayerPR = ....`"""
-    tic = time.perf_counter()
-
-    # Check if data is cached in Redis
-    cache_key = f"ccp_getPlayerPR:{mapname}-{steamid32}"
-    cached_data = get_cache(cache_key)
-    if cached_data is not None:
-        print(f"[Redis] Loaded '{cache_key}' ({time.perf_counter() - tic:0.4f}s)")
-        response.headers["content-type"] = "application/json"
-        response.status_code = status.HTTP_200_OK
-        response.body = json.loads(cached_data, use_decimal=True, parse_nan=True)
-        return response
-
-    xquery = selectQuery(
+    xquery = await selectQueryAsync(
         surftimer.queries.sql_stray_ccp_getPlayerPR.format(mapname, steamid32)
     )
 
-    if len(xquery) > 0:
-        print("Hit, length:", len(xquery))
-    else:
-        response.status_code = status.HTTP_204_NO_CONTENT
-        return response
-
-    # Cache the data in Redis
-    set_cache(cache_key, xquery)
-
-    toc = time.perf_counter()
-    print(f"Execution time {toc - tic:0.4f}")
+    if len(xquery) <= 0:
+        return None
 
     return xquery
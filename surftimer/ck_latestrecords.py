@@ -1,8 +1,7 @@
 from fastapi import APIRouter, Request, Response, status
-from fastapi.responses import JSONResponse
 from pydantic import BaseModel
-from sql import selectQuery, insertQuery
-from globals import get_cache, set_cache, default_serializer
+from sql import selectQueryAsync, insertQueryAsync
+from globals import cached, default_serializer, invalidate_tags
 import time
 import simplejson as json
 import surftimer.queries
@@ -26,34 +25,14 @@ class LatestRec(BaseModel):
     name="Get Latest Records",
     tags=["ck_latestrecords"],
 )
+@cached("selectLatestRecord", tags=["table:ck_latestrecords"])
 async def selectLatestRecord(request: Request, response: Response):
     """Retrieves the last 50 records\n
     ```char sql_selectLatestRecords[] = ....```"""
-    tic = time.perf_counter()
-
-    # Check if data is cached in Redis
-    cache_key = f"selectLatestRecord"
-    cached_data = get_cache(cache_key)
-
-    if cached_data is not None:
-        print(f"[Redis] Loaded '{cache_key}' ({time.perf_counter() - tic:0.4f}s)")
-
-        return JSONResponse(
-            status_code=status.HTTP_200_OK, content=json.loads(cached_data)
-        )
-
-    xquery = selectQuery(surftimer.queries.sql_selectLatestRecords)
+    xquery = await selectQueryAsync(surftimer.queries.sql_selectLatestRecords)
 
     if len(xquery) <= 0:
-        response.headers["content-type"] = "application/json"
-        response.status_code = status.HTTP_204_NO_CONTENT
-        return response
-
-    toc = time.perf_counter()
-    print(f"Execution time {toc - tic:0.4f}")
-
-    # Cache the data in Redis
-    set_cache(cache_key, xquery)
+        return None
 
     return xquery
 
@@ -71,10 +50,11 @@ async def insertLatestRecord(request: Request, response: Response, data: LatestR
     sql = surftimer.queries.sql_insertLatestRecords.format(
         data.steamid32, data.name, data.runtime, data.mapname
     )
-    xquery = insertQuery(sql)
+    xquery = await insertQueryAsync(sql)
     # xquery = 0
     # time.sleep(3)
 
+    invalidate_tags("table:ck_latestrecords")
     content_data = {"inserted": xquery, "xtime": time.perf_counter() - tic}
     if xquery < 1:
         # response.body = json.dumps(content_data).encode('utf-8')
@@ -104,10 +84,11 @@ async def deleteWipePlayerLatestRecords(
     """```char sql_stray_deleteWipePlayerLatestRecords[] = ....```"""
     tic = time.perf_counter()
 
-    xquery = insertQuery(
+    xquery = await insertQueryAsync(
         surftimer.queries.sql_stray_deleteWipePlayerLatestRecords.format(steamid32)
     )
 
+    invalidate_tags("table:ck_latestrecords")
     content_data = {"deleted": xquery, "xtime": time.perf_counter() - tic}
     if xquery < 1:
         # response.body = json.dumps(content_data).encode('utf-8')
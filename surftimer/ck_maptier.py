@@ -1,9 +1,11 @@
 from fastapi import APIRouter, Request, Response, status
 from fastapi.responses import JSONResponse
-from sql import selectQuery, insertQuery
-from globals import get_cache, set_cache
+from sql import selectQueryAsync, insertQueryAsync
+from globals import cached, cached_response, encode_response, invalidate_tags, config
 import time, json
 import surftimer.queries
+from surftimer.map_catalog import map_catalog
+from surftimer.completion_index import unfinished_zones
 from pydantic import BaseModel
 
 router = APIRouter()
@@ -23,41 +25,16 @@ class MaptierModel(BaseModel):
     name="Get Map Tier",
     tags=["ck_maptier"],
 )
+@cached("selectMapTier:{mapname}", tags=["map:{mapname}", "table:ck_maptier"])
 async def selectMapTier(
     request: Request,
     response: Response,
     mapname: str,
 ):
     """`char[] sql_selectMapTier = ....`"""
-    tic = time.perf_counter()
+    xquery = await selectQueryAsync(surftimer.queries.sql_selectMapTier.format(mapname))
 
-    # Check if data is cached in Redis
-    cache_key = f"selectMapTier:{mapname}"
-    cached_data = get_cache(cache_key)
-    if cached_data is not None:
-        print(f"[Redis] Loaded '{cache_key}' ({time.perf_counter() - tic:0.4f}s)")
-        response.headers["content-type"] = "application/json"
-        response.status_code = status.HTTP_200_OK
-        response.body = json.loads(cached_data, use_decimal=True, parse_nan=True)
-        return response
-
-    xquery = selectQuery(surftimer.queries.sql_selectMapTier.format(mapname))
-
-    if xquery:
-        xquery = xquery.pop()
-    else:
-        response.headers["content-type"] = "application/json"
-        response.status_code = status.HTTP_204_NO_CONTENT
-        return response
-
-    # Cache the data in Redis
-    set_cache(cache_key, xquery)
-
-    toc = time.perf_counter()
-
-    print(f"Execution time {toc - tic:0.4f}")
-
-    return xquery
+    return xquery.pop() if xquery else None
 
 
 @router.post(
@@ -75,10 +52,13 @@ async def insertMapTier(
     ```"""
     tic = time.perf_counter()
 
-    xquery = insertQuery(
+    xquery = await insertQueryAsync(
         surftimer.queries.sql_insertmaptier.format(data.mapname, data.tier)
     )
 
+    if xquery > 0:
+        map_catalog.reset(data.mapname)
+    invalidate_tags(f"map:{data.mapname}", "table:ck_maptier")
     content_data = {"inserted": xquery, "xtime": time.perf_counter() - tic}
     if xquery < 1:
         # response.body = json.dumps(content_data).encode('utf-8')
@@ -110,10 +90,13 @@ async def updateMapTier(
     ```"""
     tic = time.perf_counter()
 
-    xquery = insertQuery(
+    xquery = await insertQueryAsync(
         surftimer.queries.sql_updatemaptier.format(data.tier, data.mapname)
     )
 
+    if xquery > 0:
+        map_catalog.reset(data.mapname)
+    invalidate_tags(f"map:{data.mapname}", "table:ck_maptier")
     content_data = {"updated": xquery, "xtime": time.perf_counter() - tic}
     if xquery < 1:
         # response.body = json.dumps(content_data).encode('utf-8')
@@ -146,10 +129,11 @@ async def updateMapperName(
     ```"""
     tic = time.perf_counter()
 
-    xquery = insertQuery(
+    xquery = await insertQueryAsync(
         surftimer.queries.sql_updateMapperName.format(data.mappername, data.mapname)
     )
 
+    invalidate_tags(f"map:{data.mapname}", "table:ck_maptier")
     content_data = {"updated": xquery, "xtime": time.perf_counter() - tic}
     if xquery < 1:
         # response.body = json.dumps(content_data).encode('utf-8')
@@ -178,41 +162,22 @@ async def viewUnfinishedMaps(
     style: int,
     steamid32: str,
 ):
-    """`char[] sql_stray_viewUnfinishedMaps = ....`"""
+    """`char[] sql_stray_viewUnfinishedMaps = ....`\n
+    Served from the in-memory completion index (`surftimer.completion_index`)"""
     tic = time.perf_counter()
 
-    # Check if data is cached in Redis
-    cache_key = f"viewUnfinishedMaps:{style}-{steamid32}"
-    cached_data = get_cache(cache_key)
-    if cached_data is not None:
-        print(f"[Redis] Loaded '{cache_key}' ({time.perf_counter() - tic:0.4f}s)")
-        response.headers["content-type"] = "application/json"
-        response.status_code = status.HTTP_200_OK
-        response.body = json.loads(cached_data, use_decimal=True, parse_nan=True)
-        return response
-
-    xquery = selectQuery(
-        surftimer.queries.sql_stray_viewUnfinishedMaps.format(
-            style,
-            steamid32,
-            style,
-            steamid32,
-        )
-    )
+    xquery = await unfinished_zones(steamid32, style)
 
     if len(xquery) <= 0:
         response.headers["content-type"] = "application/json"
         response.status_code = status.HTTP_204_NO_CONTENT
         return response
 
-    # Cache the data in Redis
-    set_cache(cache_key, xquery)
-
     toc = time.perf_counter()
 
     print(f"Execution time {toc - tic:0.4f}")
 
-    return xquery
+    return cached_response(encode_response(xquery))
 
 
 @router.get(
@@ -220,43 +185,22 @@ async def viewUnfinishedMaps(
     name="View Map Total Finishes",
     tags=["ck_maptier", "strays"],
 )
+@cached(
+    "selectMapImprovement:{mapname}",
+    tags=["map:{mapname}", "table:ck_maptier"],
+    expiry=config["REDIS"]["EXPIRY"],
+)
 async def selectMapImprovement(
     request: Request,
     response: Response,
     mapname: str,
 ):
     """`char[] sql_stray_selectMapImprovement = ....`"""
-    tic = time.perf_counter()
-
-    # Check if data is cached in Redis
-    cache_key = f"selectMapImprovement:{mapname}"
-    cached_data = get_cache(cache_key)
-    if cached_data is not None:
-        print(f"[Redis] Loaded '{cache_key}' ({time.perf_counter() - tic:0.4f}s)")
-        response.headers["content-type"] = "application/json"
-        response.status_code = status.HTTP_200_OK
-        response.body = json.loads(cached_data, use_decimal=True, parse_nan=True)
-        return response
-
-    xquery = selectQuery(
+    xquery = await selectQueryAsync(
         surftimer.queries.sql_stray_selectMapImprovement.format(mapname)
     )
 
-    if xquery:
-        xquery = xquery.pop()
-    else:
-        response.headers["content-type"] = "application/json"
-        response.status_code = status.HTTP_204_NO_CONTENT
-        return response
-
-    # Cache the data in Redis
-    set_cache(cache_key, xquery)
-
-    toc = time.perf_counter()
-
-    print(f"Execution time {toc - tic:0.4f}")
-
-    return xquery
+    return xquery.pop() if xquery else None
 
 
 @router.get(
@@ -264,41 +208,18 @@ async def selectMapImprovement(
     name="View Map Name",
     tags=["ck_maptier", "strays"],
 )
+@cached("viewMapnamePr:{mapname}", tags=["map:{mapname}", "table:ck_maptier"])
 async def viewMapnamePr(
     request: Request,
     response: Response,
     mapname: str,
 ):
     """`char[] sql_stray_viewMapnamePr = ....`"""
-    tic = time.perf_counter()
-
-    # Check if data is cached in Redis
-    cache_key = f"viewMapnamePr:{mapname}"
-    cached_data = get_cache(cache_key)
-    if cached_data is not None:
-        print(f"[Redis] Loaded '{cache_key}' ({time.perf_counter() - tic:0.4f}s)")
-        response.headers["content-type"] = "application/json"
-        response.status_code = status.HTTP_200_OK
-        response.body = json.loads(cached_data, use_decimal=True, parse_nan=True)
-        return response
-
-    xquery = selectQuery(surftimer.queries.sql_stray_viewMapnamePr.format(mapname))
-
-    if xquery:
-        xquery = xquery.pop()
-    else:
-        response.headers["content-type"] = "application/json"
-        response.status_code = status.HTTP_204_NO_CONTENT
-        return response
-
-    # Cache the data in Redis
-    set_cache(cache_key, xquery)
+    xquery = await selectQueryAsync(
+        surftimer.queries.sql_stray_viewMapnamePr.format(mapname)
+    )
 
-    toc = time.perf_counter()
-
-    print(f"Execution time {toc - tic:0.4f}")
-
-    return xquery
+    return xquery.pop() if xquery else None
 
 
 @router.get(
@@ -306,45 +227,23 @@ async def viewMapnamePr(
     name="View PR Map Info",
     tags=["ck_maptier", "strays"],
 )
+@cached(
+    "viewPlayerPrMapInfo:{mapname}",
+    tags=["map:{mapname}", "table:ck_maptier", "table:ck_zones"],
+)
 async def viewPlayerPrMapInfo(
     request: Request,
     response: Response,
     mapname: str,
 ):
     """`char[] sql_stray_viewPlayerPrMapInfo = ....`"""
-    tic = time.perf_counter()
-
-    # Check if data is cached in Redis
-    cache_key = f"viewPlayerPrMapInfo:{mapname}"
-    cached_data = get_cache(cache_key)
-    if cached_data is not None:
-        print(f"[Redis] Loaded '{cache_key}' ({time.perf_counter() - tic:0.4f}s)")
-        response.headers["content-type"] = "application/json"
-        response.status_code = status.HTTP_200_OK
-        response.body = json.loads(cached_data, use_decimal=True, parse_nan=True)
-        return response
-
-    xquery = selectQuery(
+    xquery = await selectQueryAsync(
         surftimer.queries.sql_stray_viewPlayerPrMapInfo.format(
             mapname, mapname, mapname
         )
     )
 
-    if xquery:
-        xquery = xquery.pop()
-    else:
-        response.headers["content-type"] = "application/json"
-        response.status_code = status.HTTP_204_NO_CONTENT
-        return response
-
-    # Cache the data in Redis
-    set_cache(cache_key, xquery)
-
-    toc = time.perf_counter()
-
-    print(f"Execution time {toc - tic:0.4f}")
-
-    return xquery
+    return xquery.pop() if xquery else None
 
 
 @router.get(
@@ -352,35 +251,16 @@ async def viewPlayerPrMapInfo(
     name="View Mapcycle",
     tags=["ck_maptier", "strays"],
 )
+@cached("selectMapcycle:", tags=["table:ck_maptier"], coalesce=True)
 async def selectMapcycle(
     request: Request,
     response: Response,
 ):
-    """`char[] sql_stray_selectMapcycle = ....`"""
-    tic = time.perf_counter()
-
-    # Check if data is cached in Redis
-    cache_key = f"selectMapcycle:"
-    cached_data = get_cache(cache_key)
-    if cached_data is not None:
-        print(f"[Redis] Loaded '{cache_key}' ({time.perf_counter() - tic:0.4f}s)")
-        response.headers["content-type"] = "application/json"
-        response.status_code = status.HTTP_200_OK
-        response.body = json.loads(cached_data, use_decimal=True, parse_nan=True)
-        return response
-
-    xquery = selectQuery(surftimer.queries.sql_stray_selectMapcycle)
+    """`char[] sql_stray_selectMapcycle = ....`\n
+    Every server asks for it at map change, only one of them runs the query"""
+    xquery = await selectQueryAsync(surftimer.queries.sql_stray_selectMapcycle)
 
     if len(xquery) <= 0:
-        response.headers["content-type"] = "application/json"
-        response.status_code = status.HTTP_204_NO_CONTENT
-        return response
-
-    # Cache the data in Redis
-    set_cache(cache_key, xquery)
-
-    toc = time.perf_counter()
-
-    print(f"Execution time {toc - tic:0.4f}")
+        return None
 
     return xquery
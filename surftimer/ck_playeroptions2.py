@@ -1,7 +1,6 @@
 from fastapi import APIRouter, Request, Response, status, HTTPException
-from fastapi.responses import JSONResponse
-from sql import selectQuery, insertQuery
-from globals import get_cache, set_cache
+from sql import insertQueryAsync, insertQuery, selectQuery, runAsync
+from globals import cached, invalidate_tags
 from pydantic import BaseModel
 import time, surftimer.queries
 import simplejson as json
@@ -63,8 +62,9 @@ async def insertPlayerOptions(request: Request, response: Response, steamid32: s
     ```"""
     tic = time.perf_counter()
 
-    xquery = insertQuery(surftimer.queries.sql_insertPlayerOptions.format(steamid32))
+    xquery = await insertQueryAsync(surftimer.queries.sql_insertPlayerOptions.format(steamid32))
 
+    invalidate_tags(f"player:{steamid32}")
     content_data = {"inserted": xquery, "xtime": time.perf_counter() - tic}
     if xquery < 1:
         # response.body = json.dumps(content_data).encode('utf-8')
@@ -86,34 +86,17 @@ async def insertPlayerOptions(request: Request, response: Response, steamid32: s
     name="Get Player Options",
     tags=["ck_playeroptions2"],
 )
+@cached(
+    "selectPlayerOptions:{steamid32}",
+    tags=["player:{steamid32}", "table:ck_playeroptions2"],
+)
 async def selectPlayerOptions(request: Request, response: Response, steamid32: str):
     """`char[] sql_selectPlayerOptions = ....`"""
-    tic = time.perf_counter()
-
-    # Check if data is cached in Redis
-    cache_key = f"selectPlayerOptions:{steamid32}"
-    cached_data = get_cache(cache_key)
-    if cached_data is not None:
-        print(f"[Redis] Loaded '{cache_key}' ({time.perf_counter() - tic:0.4f}s)")
-        return JSONResponse(
-            status_code=status.HTTP_200_OK,
-            content=json.loads(cached_data, allow_nan=True),
-        )
-
-    xquery = selectQuery(surftimer.queries.sql_selectPlayerOptions.format(steamid32))
-
-    if xquery:
-        xquery = xquery.pop()
-    else:
-        return Response(status_code=status.HTTP_204_NO_CONTENT)
-
-    # Cache the data in Redis
-    set_cache(cache_key, xquery)
-
-    toc = time.perf_counter()
-    print(f"Execution time {toc - tic:0.4f}")
+    xquery = await runAsync(
+        selectQuery, surftimer.queries.sql_selectPlayerOptions, [steamid32]
+    )
 
-    return xquery
+    return xquery.pop() if xquery else None
 
 
 @router.put(
@@ -129,7 +112,7 @@ async def updatePlayerOptions(
     ```"""
     tic = time.perf_counter()
 
-    xquery = insertQuery(
+    xquery = await insertQueryAsync(
         surftimer.queries.sql_updatePlayerOptions.format(
             data.timer,
             data.hide,
@@ -170,6 +153,7 @@ async def updatePlayerOptions(
         )
     )
 
+    invalidate_tags(f"player:{data.steamid32}")
     content_data = {"updated": xquery, "xtime": time.perf_counter() - tic}
     if xquery < 1:
         # response.body = json.dumps(content_data).encode('utf-8')
@@ -205,6 +189,7 @@ def deleteWipePlayerOptions(
         surftimer.queries.sql_stray_deleteWipePlayerOptions.format(steamid32)
     )
 
+    invalidate_tags(f"player:{steamid32}")
     content_data = {"deleted": xquery, "xtime": time.perf_counter() - tic}
     if xquery < 1:
         # response.body = json.dumps(content_data).encode('utf-8')
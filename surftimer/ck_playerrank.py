@@ -1,8 +1,25 @@
 from fastapi import APIRouter, Request, Response, status
 from fastapi.responses import JSONResponse
-from sql import selectQuery, insertQuery, insert_escaped_query
-from globals import get_cache, set_cache, all_styles
+from sql import (
+    selectQueryAsync,
+    insertQueryAsync,
+    insert_escaped_query_async,
+    insertQuery,
+    selectPreparedAsync,
+    runAsync,
+)
+from globals import (
+    cached,
+    get_cache,
+    set_cache,
+    cached_response,
+    all_styles,
+    invalidate_tags,
+    config,
+)
 from pydantic import BaseModel
+from surftimer.rank_index import rank_indexes
+from surftimer.ranking import POINTS_COLUMNS, updatePlayerRankPointsRows
 import time, json
 import surftimer.queries
 
@@ -74,8 +91,14 @@ async def insertPlayerRank(
         data.joined,
         data.style,
     )
-    xquery = insertQuery(sql)
+    xquery = await insertQueryAsync(sql)
 
+    if xquery > 0:
+        rank_indexes.update(
+            data.style,
+            [(data.steamid32, 0, data.name, data.country, data.continentCode)],
+        )
+    invalidate_tags(f"player:{data.steamid32}", f"style:{data.style}", "players")
     content_data = {"inserted": xquery, "xtime": time.perf_counter() - tic}
     if xquery < 1:
         # response.body = json.dumps(content_data).encode('utf-8')
@@ -128,8 +151,11 @@ async def updatePlayerRankPoints(
         data.style,
     )
 
-    xquery = insert_escaped_query(sql)
+    xquery = await insert_escaped_query_async(sql)
 
+    if xquery > 0:
+        rank_indexes.update(data.style, [(data.steamid32, data.points, data.name)])
+    invalidate_tags(f"player:{data.steamid32}", f"style:{data.style}", "players")
     content_data = {"updated": xquery, "xtime": time.perf_counter() - tic}
     if xquery < 1:
         # response.body = json.dumps(content_data).encode('utf-8')
@@ -184,8 +210,22 @@ async def updatePlayerRankPoints2(
         data.steamid32,
         data.style,
     )
-    xquery = insert_escaped_query(sql)
-
+    xquery = await insert_escaped_query_async(sql)
+
+    if xquery > 0:
+        rank_indexes.update(
+            data.style,
+            [
+                (
+                    data.steamid32,
+                    data.points,
+                    data.name,
+                    data.country,
+                    data.continentCode,
+                )
+            ],
+        )
+    invalidate_tags(f"player:{data.steamid32}", f"style:{data.style}", "players")
     content_data = {"updated": xquery, "xtime": time.perf_counter() - tic}
     if xquery < 1:
         # response.body = json.dumps(content_data).encode('utf-8')
@@ -203,6 +243,63 @@ async def updatePlayerRankPoints2(
     return response
 
 
+@router.put(
+    "/surftimer/updatePlayerRankPointsBulk",
+    name="Update Player Rank Points Bulk",
+    tags=["ck_playerrank"],
+)
+async def updatePlayerRankPointsBulk(
+    request: Request,
+    response: Response,
+    data: list[UpdatePlayerPoints],
+):
+    """Batch variant of `updatePlayerRankPoints`/`updatePlayerRankPoints2`, one request for many players\n
+    Uses a staging table and chunked transactions, `country` is kept unless sent"""
+    tic = time.perf_counter()
+
+    rows = [
+        {
+            "steamid32": player.steamid32,
+            "style": player.style,
+            "name": player.name,
+            **{column: getattr(player, column) for column in POINTS_COLUMNS},
+            "country": player.country,
+            "countryCode": player.countryCode,
+            "continentCode": player.continentCode,
+        }
+        for player in data
+    ]
+    outcomes = await runAsync(
+        updatePlayerRankPointsRows,
+        rows,
+        config["RECALCULATION"]["CHUNK_SIZE"],
+        write=True,
+    )
+
+    xtime = time.perf_counter() - tic
+    content_data = {
+        "updated": sum(row["outcome"] == "updated" for row in outcomes),
+        "unchanged": sum(row["outcome"] == "unchanged" for row in outcomes),
+        "missing": sum(row["outcome"] == "missing" for row in outcomes),
+        "players": outcomes,
+        "xtime": xtime,
+        "rows_per_second": len(outcomes) / xtime if xtime > 0 else None,
+    }
+    if content_data["updated"] < 1:
+        response.headers["content-type"] = "application/json"
+        response.status_code = status.HTTP_304_NOT_MODIFIED
+        return response
+
+    # Prepare the response
+    toc = time.perf_counter()
+    print(f"Execution time {toc - tic:0.4f}")
+
+    response.body = json.dumps(content_data).encode("utf-8")
+    response.headers["content-type"] = "application/json"
+    response.status_code = status.HTTP_200_OK
+    return response
+
+
 @router.put(
     "/surftimer/updatePlayerRank",
     name="Update Player Rank",
@@ -225,8 +322,9 @@ async def updatePlayerRank(
         steamid32,
         style,
     )
-    xquery = insertQuery(sql)
+    xquery = await insertQueryAsync(sql)
 
+    invalidate_tags(f"player:{steamid32}", f"style:{style}", "players")
     content_data = {"updated": xquery, "xtime": time.perf_counter() - tic}
     if xquery < 1:
         # response.body = json.dumps(content_data).encode('utf-8')
@@ -264,12 +362,9 @@ async def selectPlayerName(
     cached_data = get_cache(cache_key)
     if cached_data is not None:
         print(f"[Redis] Loaded '{cache_key}' ({time.perf_counter() - tic:0.4f}s)")
-        response.headers["content-type"] = "application/json"
-        response.status_code = status.HTTP_200_OK
-        response.body = json.loads(cached_data, use_decimal=True, parse_nan=True)
-        return response
+        return cached_response(cached_data)
 
-    xquery = selectQuery(surftimer.queries.sql_selectPlayerName.format(steamid32))
+    xquery = await selectQueryAsync(surftimer.queries.sql_selectPlayerName.format(steamid32))
 
     if xquery:
         xquery = xquery.pop()
@@ -283,9 +378,13 @@ async def selectPlayerName(
     xquery["xtime"] = time.perf_counter() - tic
 
     # Cache the data in Redis
-    set_cache(cache_key, xquery)
+    cached_data = set_cache(
+        cache_key,
+        xquery,
+        tags=[f"player:{steamid32}", "table:ck_playerrank"],
+    )
 
-    return xquery
+    return cached_response(cached_data)
 
 
 @router.put(
@@ -302,8 +401,9 @@ async def updateLastSeen(
     tic = time.perf_counter()
 
     sql = surftimer.queries.sql_UpdateLastSeenMySQL.format(steamid32)
-    xquery = insertQuery(sql)
+    xquery = await insertQueryAsync(sql)
 
+    invalidate_tags(f"player:{steamid32}", "players")
     content_data = {"updated": xquery, "xtime": time.perf_counter() - tic}
     if xquery < 1:
         # response.body = json.dumps(content_data).encode('utf-8')
@@ -326,38 +426,17 @@ async def updateLastSeen(
     name="Select Top Players",
     tags=["ck_playerrank"],
 )
+@cached("selectTopPlayers:{style}", tags=["style:{style}", "table:ck_playerrank"])
 async def selectTopPlayers(
     request: Request,
     response: Response,
     style: int,
 ):
     """`char[] sql_selectTopPlayers = ....`"""
-    tic = time.perf_counter()
-
-    # Check if data is cached in Redis
-    cache_key = f"selectTopPlayers:{style}"
-    cached_data = get_cache(cache_key)
-    if cached_data is not None:
-        print(f"[Redis] Loaded '{cache_key}' ({time.perf_counter() - tic:0.4f}s)")
-        response.headers["content-type"] = "application/json"
-        response.status_code = status.HTTP_200_OK
-        response.body = json.loads(cached_data, use_decimal=True, parse_nan=True)
-        return response
-
-    xquery = selectQuery(surftimer.queries.sql_selectTopPlayers.format(style))
-
-    if xquery:
-        xquery = xquery
-    else:
-        response.status_code = status.HTTP_204_NO_CONTENT
-        return response
-
-    toc = time.perf_counter()
-
-    print(f"Execution time {toc - tic:0.4f}")
+    xquery = await selectQueryAsync(surftimer.queries.sql_selectTopPlayers.format(style))
 
-    # Cache the data in Redis
-    set_cache(cache_key, xquery)
+    if not xquery:
+        return None
 
     return xquery
 
@@ -367,6 +446,10 @@ async def selectTopPlayers(
     name="Select Ranked Players Rank",
     tags=["ck_playerrank"],
 )
+@cached(
+    "selectRankedPlayersRank:{style}-{steamid32}",
+    tags=["style:{style}", "table:ck_playerrank"],
+)
 async def selectRankedPlayersRank(
     request: Request,
     response: Response,
@@ -374,34 +457,14 @@ async def selectRankedPlayersRank(
     steamid32: str,
 ):
     """`char[] sql_selectRankedPlayersRank = ....`\n
-    Done 2/4 query executions in ST code for this T_T"""
-    tic = time.perf_counter()
-
-    # Check if data is cached in Redis
-    cache_key = f"selectTopPlayers:{style}_{steamid32}"
-    cached_data = get_cache(cache_key)
-    if cached_data is not None:
-        print(f"[Redis] Loaded '{cache_key}' ({time.perf_counter() - tic:0.4f}s)")
-        response.headers["content-type"] = "application/json"
-        response.status_code = status.HTTP_200_OK
-        response.body = json.loads(cached_data, use_decimal=True, parse_nan=True)
-        return response
-
-    xquery = selectQuery(
+    Done 2/4 query executions in ST code for this T_T\n
+    Use `selectRankedPlayersRankNumber` when only the rank is needed"""
+    xquery = await selectQueryAsync(
         surftimer.queries.sql_selectRankedPlayersRank.format(style, steamid32, style)
     )
 
-    if xquery:
-        xquery = xquery
-    else:
-        response.status_code = status.HTTP_204_NO_CONTENT
-        return response
-
-    toc = time.perf_counter()
-
-    print(f"Execution time {toc - tic:0.4f}")
-    # Cache the data in Redis
-    set_cache(cache_key, xquery)
+    if not xquery:
+        return None
 
     return xquery
 
@@ -417,7 +480,7 @@ async def selectRankedPlayerRankAllStyles(
     steamid32: str,
 ):
     """`char[] sql_selectRankedPlayersRank = ....`\n
-    Get all styles player rank in 1 go"""
+    Get all styles player rank in 1 go, read from the in-memory rank index"""
     tic = time.perf_counter()
 
     # Check if data is cached in Redis
@@ -425,55 +488,76 @@ async def selectRankedPlayerRankAllStyles(
     cached_data = get_cache(cache_key)
     if cached_data is not None:
         print(f"[Redis] Loaded '{cache_key}' ({time.perf_counter() - tic:0.4f}s)")
-        response.headers["content-type"] = "application/json"
-        response.status_code = status.HTTP_200_OK
-        response.body = json.loads(cached_data, use_decimal=True, parse_nan=True)
-        return response
+        return cached_response(cached_data)
 
     output = []
 
-    i = 0
-    for style in all_styles:
-        xquery = selectQuery(
-            surftimer.queries.sql_selectPlayersStylesRank.format(i, steamid32, i)
-        )
-        output.append({"style": style,"rank": xquery.pop()["COUNT(steamid)"]})
-        i = i + 1
+    for i, style in enumerate(all_styles):
+        index = await rank_indexes.get(i)
+        output.append({"style": style, "rank": index.rank(steamid32) or 0})
 
     toc = time.perf_counter()
 
     print(f"Execution time {toc - tic:0.4f}")
     # Cache the data in Redis
-    set_cache(cache_key, output)
+    cached_data = set_cache(
+        cache_key,
+        output,
+        tags=[
+            *[f"style:{style}" for style in range(len(all_styles))],
+            "table:ck_playerrank",
+        ],
+    )
 
-    return output
+    return cached_response(cached_data)
 
 
 @router.get(
-    "/surftimer/selectRankedPlayers",
-    name="Select Ranked Players",
-    tags=["ck_playerrank"],
+    "/surftimer/selectRankedPlayersRankNumber",
+    name="Select Ranked Player Rank Number",
+    tags=["ck_playerrank", "Refactored"],
 )
-async def selectRankedPlayers(request: Request, response: Response):
-    """`char[] sql_selectRankedPlayers = ....`"""
+async def selectRankedPlayersRankNumber(
+    request: Request,
+    response: Response,
+    style: int,
+    steamid32: str,
+):
+    """Rank of the player in `style` from the in-memory rank index\n
+    Same rank as the number of rows returned by `selectRankedPlayersRank`"""
     tic = time.perf_counter()
 
-    # Check if data is cached in Redis
-    cache_key = f"selectRankedPlayers"
-    cached_data = get_cache(cache_key)
-    if cached_data is not None:
-        print(f"[Redis] Loaded '{cache_key}' ({time.perf_counter() - tic:0.4f}s)")
-        response.headers["content-type"] = "application/json"
-        response.status_code = status.HTTP_200_OK
-        response.body = json.loads(cached_data, use_decimal=True, parse_nan=True)
+    rank = (await rank_indexes.get(style)).rank(steamid32)
+
+    if rank is None:
+        response.status_code = status.HTTP_204_NO_CONTENT
         return response
 
-    xquery = selectQuery(surftimer.queries.sql_selectRankedPlayers)
-    # xquery = []
+    toc = time.perf_counter()
 
-    if len(xquery) > 0:
-        xquery = xquery
-    else:
+    print(f"Execution time {toc - tic:0.4f}")
+
+    return {"rank": rank}
+
+
+@router.get(
+    "/surftimer/selectTopRankedPlayers",
+    name="Select Top Ranked Players",
+    tags=["ck_playerrank", "Refactored"],
+)
+async def selectTopRankedPlayers(
+    request: Request,
+    response: Response,
+    style: int,
+    limit: int = 100,
+):
+    """`steamid`, `name` and `points` of the `limit` players with the most points in `style`, from the in-memory
+    rank index"""
+    tic = time.perf_counter()
+
+    xquery = (await rank_indexes.get(style)).top(limit)
+
+    if len(xquery) <= 0:
         response.status_code = status.HTTP_204_NO_CONTENT
         return response
 
@@ -481,8 +565,22 @@ async def selectRankedPlayers(request: Request, response: Response):
 
     print(f"Execution time {toc - tic:0.4f}")
 
-    # Cache the data in Redis
-    set_cache(cache_key, xquery)
+    return xquery
+
+
+@router.get(
+    "/surftimer/selectRankedPlayers",
+    name="Select Ranked Players",
+    tags=["ck_playerrank"],
+)
+@cached("selectRankedPlayers", tags=["style:0", "table:ck_playerrank"])
+async def selectRankedPlayers(request: Request, response: Response):
+    """`char[] sql_selectRankedPlayers = ....`"""
+    xquery = await selectQueryAsync(surftimer.queries.sql_selectRankedPlayers)
+    # xquery = []
+
+    if len(xquery) <= 0:
+        return None
 
     return xquery
 
@@ -492,35 +590,19 @@ async def selectRankedPlayers(request: Request, response: Response):
     name="Select Ranked Players",
     tags=["ck_playerrank"],
 )
+@cached(
+    "selectRankedPlayer:{steamid32}",
+    tags=["player:{steamid32}", "table:ck_playerrank"],
+)
 async def selectRankedPlayer(request: Request, response: Response, steamid32: str):
     """`char[] sql_selectRankedPlayer = ....`"""
-    tic = time.perf_counter()
-
-    # Check if data is cached in Redis
-    cache_key = f"selectRankedPlayer"
-    cached_data = get_cache(cache_key)
-    if cached_data is not None:
-        print(f"[Redis] Loaded '{cache_key}' ({time.perf_counter() - tic:0.4f}s)")
-        response.headers["content-type"] = "application/json"
-        response.status_code = status.HTTP_200_OK
-        response.body = json.loads(cached_data, use_decimal=True, parse_nan=True)
-        return response
-
-    xquery = selectQuery(surftimer.queries.sql_selectRankedPlayer.format(steamid32))
+    xquery = await selectPreparedAsync(
+        surftimer.queries.sql_selectRankedPlayer, steamid=steamid32
+    )
     # xquery = []
 
-    if len(xquery) > 0:
-        xquery = xquery
-    else:
-        response.status_code = status.HTTP_204_NO_CONTENT
-        return response
-
-    toc = time.perf_counter()
-
-    print(f"Execution time {toc - tic:0.4f}")
-
-    # Cache the data in Redis
-    set_cache(cache_key, xquery)
+    if len(xquery) <= 0:
+        return None
 
     return xquery
 
@@ -530,6 +612,7 @@ async def selectRankedPlayer(request: Request, response: Response, steamid32: st
     name="Count Ranked Players",
     tags=["ck_playerrank"],
 )
+@cached("countRankedPlayers:{style}", tags=["style:{style}", "table:ck_playerrank"])
 async def countRankedPlayers(
     request: Request,
     response: Response,
@@ -537,32 +620,9 @@ async def countRankedPlayers(
 ):
     """This is technically not ***Ranked*** players, it's all `steamid` count in `ck_playerrank`\n
     `char[] sql_CountRankedPlayers = ....`"""
-    tic = time.perf_counter()
-
-    cache_key = f"countRankedPlayers:{style}"
-    cached_data = get_cache(cache_key)
-    if cached_data is not None:
-        print(f"[Redis] Loaded '{cache_key}' ({time.perf_counter() - tic:0.4f}s)")
-        response.headers["content-type"] = "application/json"
-        response.status_code = status.HTTP_200_OK
-        response.body = json.loads(cached_data, use_decimal=True, parse_nan=True)
-        return response
-
-    xquery = selectQuery(surftimer.queries.sql_CountRankedPlayers.format(style))
-
-    if xquery:
-        xquery = xquery.pop()
-    else:
-        response.status_code = status.HTTP_204_NO_CONTENT
-        return response
+    xquery = await selectQueryAsync(surftimer.queries.sql_CountRankedPlayers.format(style))
 
-    toc = time.perf_counter()
-
-    print(f"Execution time {toc - tic:0.4f}")
-
-    # Cache the data in Redis
-    set_cache(cache_key, xquery)
-    return xquery
+    return xquery.pop() if xquery else None
 
 
 @router.get(
@@ -570,6 +630,7 @@ async def countRankedPlayers(
     name="Count Ranked Players 2",
     tags=["ck_playerrank"],
 )
+@cached("countRankedPlayers2:{style}", tags=["style:{style}", "table:ck_playerrank"])
 async def countRankedPlayers2(
     request: Request,
     response: Response,
@@ -577,33 +638,9 @@ async def countRankedPlayers2(
 ):
     """This ***DOES*** check for player points being higher than 0\n
     `char[] sql_CountRankedPlayers2 = ....`"""
-    tic = time.perf_counter()
-
-    cache_key = f"countRankedPlayers2:{style}"
-    cached_data = get_cache(cache_key)
-    if cached_data is not None:
-        print(f"[Redis] Loaded '{cache_key}' ({time.perf_counter() - tic:0.4f}s)")
-        response.headers["content-type"] = "application/json"
-        response.status_code = status.HTTP_200_OK
-        response.body = json.loads(cached_data, use_decimal=True, parse_nan=True)
-        return response
-
-    xquery = selectQuery(surftimer.queries.sql_CountRankedPlayers2.format(style))
-
-    if xquery:
-        xquery = xquery.pop()
-    else:
-        response.status_code = status.HTTP_204_NO_CONTENT
-        return response
-
-    toc = time.perf_counter()
-
-    print(f"Execution time {toc - tic:0.4f}")
+    xquery = await selectQueryAsync(surftimer.queries.sql_CountRankedPlayers2.format(style))
 
-    # Cache the data in Redis
-    set_cache(cache_key, xquery)
-
-    return xquery
+    return xquery.pop() if xquery else None
 
 
 @router.get(
@@ -611,6 +648,10 @@ async def countRankedPlayers2(
     name="Select Player Profile",
     tags=["ck_playerrank"],
 )
+@cached(
+    "selectPlayerProfile:{steamid32}-{style}",
+    tags=["player:{steamid32}", "table:ck_playerrank"],
+)
 async def selectPlayerProfile(
     request: Request,
     response: Response,
@@ -618,19 +659,7 @@ async def selectPlayerProfile(
     style: int,
 ):
     """`char[] sql_selectPlayerProfile = ....`"""
-    tic = time.perf_counter()
-
-    # Check if data is cached in Redis
-    cache_key = f"selectTopPlayers:{steamid32}_{style}"
-    cached_data = get_cache(cache_key)
-    if cached_data is not None:
-        print(f"[Redis] Loaded '{cache_key}' ({time.perf_counter() - tic:0.4f}s)")
-        response.headers["content-type"] = "application/json"
-        response.status_code = status.HTTP_200_OK
-        response.body = json.loads(cached_data, use_decimal=True, parse_nan=True)
-        return response
-
-    xquery = selectQuery(
+    xquery = await selectQueryAsync(
         surftimer.queries.sql_selectPlayerProfile.format(steamid32, style)
     )
 
@@ -642,13 +671,6 @@ async def selectPlayerProfile(
         response.status_code = status.HTTP_304_NOT_MODIFIED
         return response
 
-    toc = time.perf_counter()
-
-    print(f"Execution time {toc - tic:0.4f}")
-
-    # Cache the data in Redis
-    set_cache(cache_key, xquery)
-
     return xquery
 
 
@@ -657,25 +679,14 @@ async def selectPlayerProfile(
     name="Select Unknown Player Profile",
     tags=["ck_playerrank"],
 )
+@cached("selectUnknownPlayerProfile:{name}", tags=["players", "table:ck_playerrank"])
 async def selectUnknownPlayerProfile(
     request: Request,
     response: Response,
     name: str,
 ):
     """`SELECT steamid, name, points FROM ck_playerrank WHERE name LIKE '%c%s%c' ORDER BY points DESC LIMIT 0, 1;`"""
-    tic = time.perf_counter()
-
-    # Check if data is cached in Redis
-    cache_key = f"selectUnknownPlayerProfile:{name}"
-    cached_data = get_cache(cache_key)
-    if cached_data is not None:
-        print(f"[Redis] Loaded '{cache_key}' ({time.perf_counter() - tic:0.4f}s)")
-        response.headers["content-type"] = "application/json"
-        response.status_code = status.HTTP_200_OK
-        response.body = json.loads(cached_data, use_decimal=True, parse_nan=True)
-        return response
-
-    xquery = selectQuery(surftimer.queries.sql_selectPlayerRankUnknown.format(name))
+    xquery = await selectQueryAsync(surftimer.queries.sql_selectPlayerRankUnknown.format(name))
 
     if xquery:
         xquery = xquery.pop()
@@ -685,13 +696,6 @@ async def selectUnknownPlayerProfile(
         response.status_code = status.HTTP_304_NOT_MODIFIED
         return response
 
-    toc = time.perf_counter()
-
-    print(f"Execution time {toc - tic:0.4f}")
-
-    # Cache the data in Redis
-    set_cache(cache_key, xquery)
-
     return xquery
 
 
@@ -709,8 +713,9 @@ async def updatePlayerConnections(
     tic = time.perf_counter()
 
     sql = surftimer.queries.sql_updatePlayerConnections.format(steamid32)
-    xquery = insertQuery(sql)
+    xquery = await insertQueryAsync(sql)
 
+    invalidate_tags(f"player:{steamid32}", "players")
     content_data = {"updated": xquery, "xtime": time.perf_counter() - tic}
     if xquery < 1:
         # response.body = json.dumps(content_data).encode('utf-8')
@@ -746,6 +751,9 @@ def deleteWipePlayerRank(
         surftimer.queries.sql_stray_deleteWipePlayerRank.format(steamid32)
     )
 
+    if xquery > 0:
+        rank_indexes.remove(steamid32)
+    invalidate_tags(f"player:{steamid32}", "table:ck_playerrank")
     content_data = {"deleted": xquery, "xtime": time.perf_counter() - tic}
     if xquery < 1:
         # response.body = json.dumps(content_data).encode('utf-8')
@@ -767,6 +775,10 @@ def deleteWipePlayerRank(
     name="Select Player Name",
     tags=["ck_playerrank", "strays", "Points Calculation"],
 )
+@cached(
+    "point_calc_playerRankName:{steamid32}-{style}",
+    tags=["player:{steamid32}", "table:ck_playerrank"],
+)
 async def point_calc_playerRankName(
     request: Request,
     response: Response,
@@ -774,36 +786,11 @@ async def point_calc_playerRankName(
     style: int,
 ):
     """```char sql_stray_point_calc_playerRankName[] = ....```"""
-    tic = time.perf_counter()
-
-    # Check if data is cached in Redis
-    cache_key = f"point_calc_playerRankName:{steamid32}-{style}"
-    cached_data = get_cache(cache_key)
-    if cached_data is not None:
-        print(f"[Redis] Loaded '{cache_key}' ({time.perf_counter() - tic:0.4f}s)")
-        response.headers["content-type"] = "application/json"
-        response.status_code = status.HTTP_200_OK
-        response.body = json.loads(cached_data, use_decimal=True, parse_nan=True)
-        return response
-
-    xquery = selectQuery(
+    xquery = await selectQueryAsync(
         surftimer.queries.sql_stray_point_calc_playerRankName.format(steamid32, style)
     )
 
-    if xquery:
-        xquery = xquery.pop()
-    else:
-        response.status_code = status.HTTP_204_NO_CONTENT
-        return response
-
-    toc = time.perf_counter()
-
-    print(f"Execution time {toc - tic:0.4f}")
-
-    # Cache the data in Redis
-    set_cache(cache_key, xquery)
-
-    return xquery
+    return xquery.pop() if xquery else None
 
 
 @router.delete(
@@ -821,6 +808,9 @@ def cleanupPlayerRank(
 
     xquery = insertQuery(surftimer.queries.sql_stray_cleanupPlayerRank.format())
 
+    if xquery > 0:
+        rank_indexes.remove_up_to(0)
+    invalidate_tags("table:ck_playerrank")
     content_data = {"deleted": xquery, "xtime": time.perf_counter() - tic}
     if xquery < 1:
         # response.body = json.dumps(content_data).encode('utf-8')
@@ -842,6 +832,10 @@ def cleanupPlayerRank(
     name="Country Rank",
     tags=["ck_playerrank", "strays"],
 )
+@cached(
+    "specificCountryRank:{country}-{style}",
+    tags=["style:{style}", "table:ck_playerrank"],
+)
 async def specificCountryRank(
     request: Request,
     response: Response,
@@ -849,35 +843,11 @@ async def specificCountryRank(
     style: int,
 ):
     """`char[] sql_stray_specificCountryRank = ....`"""
-    tic = time.perf_counter()
-
-    cache_key = f"specificCountryRank:{country}-{style}"
-    cached_data = get_cache(cache_key)
-    if cached_data is not None:
-        print(f"[Redis] Loaded '{cache_key}' ({time.perf_counter() - tic:0.4f}s)")
-        response.headers["content-type"] = "application/json"
-        response.status_code = status.HTTP_200_OK
-        response.body = json.loads(cached_data, use_decimal=True, parse_nan=True)
-        return response
-
-    xquery = selectQuery(
+    xquery = await selectQueryAsync(
         surftimer.queries.sql_stray_specificCountryRank.format(country, style)
     )
 
-    if xquery:
-        xquery = xquery.pop()
-    else:
-        response.status_code = status.HTTP_204_NO_CONTENT
-        return response
-
-    toc = time.perf_counter()
-
-    print(f"Execution time {toc - tic:0.4f}")
-
-    # Cache the data in Redis
-    set_cache(cache_key, xquery)
-
-    return xquery
+    return xquery.pop() if xquery else None
 
 
 @router.get(
@@ -885,6 +855,7 @@ async def specificCountryRank(
     name="Player Points by Name",
     tags=["ck_playerrank", "strays"],
 )
+@cached("getPlayerPointsByName:{name}-{style}", tags=["players", "table:ck_playerrank"])
 async def getPlayerPointsByName(
     request: Request,
     response: Response,
@@ -892,35 +863,11 @@ async def getPlayerPointsByName(
     style: int,
 ):
     """`char[] sql_stray_getPlayerPointsByName = ....`"""
-    tic = time.perf_counter()
-
-    cache_key = f"getPlayerPointsByName:{name}-{style}"
-    cached_data = get_cache(cache_key)
-    if cached_data is not None:
-        print(f"[Redis] Loaded '{cache_key}' ({time.perf_counter() - tic:0.4f}s)")
-        response.headers["content-type"] = "application/json"
-        response.status_code = status.HTTP_200_OK
-        response.body = json.loads(cached_data, use_decimal=True, parse_nan=True)
-        return response
-
-    xquery = selectQuery(
+    xquery = await selectQueryAsync(
         surftimer.queries.sql_stray_getPlayerPointsByName.format(name, style)
     )
 
-    if xquery:
-        xquery = xquery.pop()
-    else:
-        response.status_code = status.HTTP_204_NO_CONTENT
-        return response
-
-    toc = time.perf_counter()
-
-    print(f"Execution time {toc - tic:0.4f}")
-
-    # Cache the data in Redis
-    set_cache(cache_key, xquery)
-
-    return xquery
+    return xquery.pop() if xquery else None
 
 
 @router.get(
@@ -928,41 +875,18 @@ async def getPlayerPointsByName(
     name="Continent Player Rank",
     tags=["ck_playerrank", "strays"],
 )
+@cached("countryRankGetPlayerByName:{name}", tags=["players", "table:ck_playerrank"])
 async def continentPlayerRankByName(
     request: Request,
     response: Response,
     name: str,
 ):
     """`char[] sql_stray_continentPlayerRankByName = ....`"""
-    tic = time.perf_counter()
-
-    cache_key = f"countryRankGetPlayerByName:{name}"
-    cached_data = get_cache(cache_key)
-    if cached_data is not None:
-        print(f"[Redis] Loaded '{cache_key}' ({time.perf_counter() - tic:0.4f}s)")
-        response.headers["content-type"] = "application/json"
-        response.status_code = status.HTTP_200_OK
-        response.body = json.loads(cached_data, use_decimal=True, parse_nan=True)
-        return response
-
-    xquery = selectQuery(
+    xquery = await selectQueryAsync(
         surftimer.queries.sql_stray_continentPlayerRankByName.format(name)
     )
 
-    if xquery:
-        xquery = xquery.pop()
-    else:
-        response.status_code = status.HTTP_204_NO_CONTENT
-        return response
-
-    toc = time.perf_counter()
-
-    print(f"Execution time {toc - tic:0.4f}")
-
-    # Cache the data in Redis
-    set_cache(cache_key, xquery)
-
-    return xquery
+    return xquery.pop() if xquery else None
 
 
 @router.get(
@@ -977,35 +901,17 @@ async def getPlayerCountryRank(
     style: int,
     points: int,
 ):
-    """`char[] sql_stray_getPlayerCountryRank = ....`"""
+    """`char[] sql_stray_getPlayerCountryRank = ....`\n
+    Read from the in-memory rank index"""
     tic = time.perf_counter()
 
-    cache_key = f"getPlayerCountryRank:{country}-{style}-{points}"
-    cached_data = get_cache(cache_key)
-    if cached_data is not None:
-        print(f"[Redis] Loaded '{cache_key}' ({time.perf_counter() - tic:0.4f}s)")
-        response.headers["content-type"] = "application/json"
-        response.status_code = status.HTTP_200_OK
-        response.body = json.loads(cached_data, use_decimal=True, parse_nan=True)
-        return response
-
-    xquery = selectQuery(
-        surftimer.queries.sql_stray_getPlayerCountryRank.format(country, style, points)
-    )
-
-    if xquery:
-        xquery = xquery.pop()
-    else:
-        response.status_code = status.HTTP_204_NO_CONTENT
-        return response
+    index = await rank_indexes.get(style)
+    xquery = {"COUNT(steamid) + 1": index.rank_for_points(points, country=country)}
 
     toc = time.perf_counter()
 
     print(f"Execution time {toc - tic:0.4f}")
 
-    # Cache the data in Redis
-    set_cache(cache_key, xquery)
-
     return xquery
 
 
@@ -1014,6 +920,7 @@ async def getPlayerCountryRank(
     name="Player Country by Name",
     tags=["ck_playerrank", "strays"],
 )
+@cached("getPlayerCountry:{name}-{style}", tags=["players", "table:ck_playerrank"])
 async def getPlayerCountryByName(
     request: Request,
     response: Response,
@@ -1021,37 +928,13 @@ async def getPlayerCountryByName(
     style: int,
 ):
     """`char[] sql_stray_countryRankPlayerCountryRankByName = ....`"""
-    tic = time.perf_counter()
-
-    cache_key = f"getPlayerCountry:{name}-{style}"
-    cached_data = get_cache(cache_key)
-    if cached_data is not None:
-        print(f"[Redis] Loaded '{cache_key}' ({time.perf_counter() - tic:0.4f}s)")
-        response.headers["content-type"] = "application/json"
-        response.status_code = status.HTTP_200_OK
-        response.body = json.loads(cached_data, use_decimal=True, parse_nan=True)
-        return response
-
-    xquery = selectQuery(
+    xquery = await selectQueryAsync(
         surftimer.queries.sql_stray_countryRankPlayerCountryRankByName.format(
             name, style
         )
     )
 
-    if xquery:
-        xquery = xquery.pop()
-    else:
-        response.status_code = status.HTTP_204_NO_CONTENT
-        return response
-
-    toc = time.perf_counter()
-
-    print(f"Execution time {toc - tic:0.4f}")
-
-    # Cache the data in Redis
-    set_cache(cache_key, xquery)
-
-    return xquery
+    return xquery.pop() if xquery else None
 
 
 @router.get(
@@ -1059,6 +942,7 @@ async def getPlayerCountryByName(
     name="Country Top 100",
     tags=["ck_playerrank", "strays"],
 )
+@cached("countryTop:{country}-{style}", tags=["style:{style}", "table:ck_playerrank"])
 async def countryTop(
     request: Request,
     response: Response,
@@ -1066,29 +950,10 @@ async def countryTop(
     style: int,
 ):
     """`char[] sql_stray_countryTop = ....`"""
-    tic = time.perf_counter()
-
-    cache_key = f"getPlayerCountryRank:{country}-{style}"
-    cached_data = get_cache(cache_key)
-    if cached_data is not None:
-        print(f"[Redis] Loaded '{cache_key}' ({time.perf_counter() - tic:0.4f}s)")
-        response.headers["content-type"] = "application/json"
-        response.status_code = status.HTTP_200_OK
-        response.body = json.loads(cached_data, use_decimal=True, parse_nan=True)
-        return response
-
-    xquery = selectQuery(surftimer.queries.sql_stray_countryTop.format(country, style))
+    xquery = await selectQueryAsync(surftimer.queries.sql_stray_countryTop.format(country, style))
 
     if len(xquery) <= 0:
-        response.status_code = status.HTTP_204_NO_CONTENT
-        return response
-
-    toc = time.perf_counter()
-
-    print(f"Execution time {toc - tic:0.4f}")
-
-    # Cache the data in Redis
-    set_cache(cache_key, xquery)
+        return None
 
     return xquery
 
@@ -1098,37 +963,19 @@ async def countryTop(
     name="All Countries in Top",
     tags=["ck_playerrank", "strays"],
 )
+@cached("countryTopAllCountries:{style}", tags=["style:{style}", "table:ck_playerrank"])
 async def countryTopAllCountries(
     request: Request,
     response: Response,
     style: int,
 ):
     """`char[] sql_stray_countryTopAllCountries = ....`"""
-    tic = time.perf_counter()
-
-    cache_key = f"countryTopAllCountries:{style}"
-    cached_data = get_cache(cache_key)
-    if cached_data is not None:
-        print(f"[Redis] Loaded '{cache_key}' ({time.perf_counter() - tic:0.4f}s)")
-        response.headers["content-type"] = "application/json"
-        response.status_code = status.HTTP_200_OK
-        response.body = json.loads(cached_data, use_decimal=True, parse_nan=True)
-        return response
-
-    xquery = selectQuery(
+    xquery = await selectQueryAsync(
         surftimer.queries.sql_stray_countryTopAllCountries.format(style)
     )
 
     if len(xquery) <= 0:
-        response.status_code = status.HTTP_204_NO_CONTENT
-        return response
-
-    toc = time.perf_counter()
-
-    print(f"Execution time {toc - tic:0.4f}")
-
-    # Cache the data in Redis
-    set_cache(cache_key, xquery)
+        return None
 
     return xquery
 
@@ -1138,6 +985,10 @@ async def countryTopAllCountries(
     name="Continent Rank",
     tags=["ck_playerrank", "strays"],
 )
+@cached(
+    "specificContinentRank:{continentCode}-{style}",
+    tags=["style:{style}", "table:ck_playerrank"],
+)
 async def specificContinentRank(
     request: Request,
     response: Response,
@@ -1145,35 +996,11 @@ async def specificContinentRank(
     style: int,
 ):
     """`char[] sql_stray_specificContinentRank = ....`"""
-    tic = time.perf_counter()
-
-    cache_key = f"specificContinentRank:{style}"
-    cached_data = get_cache(cache_key)
-    if cached_data is not None:
-        print(f"[Redis] Loaded '{cache_key}' ({time.perf_counter() - tic:0.4f}s)")
-        response.headers["content-type"] = "application/json"
-        response.status_code = status.HTTP_200_OK
-        response.body = json.loads(cached_data, use_decimal=True, parse_nan=True)
-        return response
-
-    xquery = selectQuery(
+    xquery = await selectQueryAsync(
         surftimer.queries.sql_stray_specificContinentRank.format(continentCode, style)
     )
 
-    if xquery:
-        xquery = xquery.pop()
-    else:
-        response.status_code = status.HTTP_204_NO_CONTENT
-        return response
-
-    toc = time.perf_counter()
-
-    print(f"Execution time {toc - tic:0.4f}")
-
-    # Cache the data in Redis
-    set_cache(cache_key, xquery)
-
-    return xquery
+    return xquery.pop() if xquery else None
 
 
 @router.get(
@@ -1182,6 +1009,10 @@ async def specificContinentRank(
     tags=["ck_playerrank", "strays"],
     deprecated=True,
 )
+@cached(
+    "continentPlayerPoints:{continentCode}-{style}",
+    tags=["style:{style}", "table:ck_playerrank"],
+)
 async def continentPlayerPoints(
     request: Request,
     response: Response,
@@ -1190,35 +1021,11 @@ async def continentPlayerPoints(
 ):
     """`char[] sql_stray_continentPlayerPoints = ....`\n
     same as `/surftimer/getPlayerPointsByName`"""
-    tic = time.perf_counter()
-
-    cache_key = f"continentPlayerPoints:{style}"
-    cached_data = get_cache(cache_key)
-    if cached_data is not None:
-        print(f"[Redis] Loaded '{cache_key}' ({time.perf_counter() - tic:0.4f}s)")
-        response.headers["content-type"] = "application/json"
-        response.status_code = status.HTTP_200_OK
-        response.body = json.loads(cached_data, use_decimal=True, parse_nan=True)
-        return response
-
-    xquery = selectQuery(
+    xquery = await selectQueryAsync(
         surftimer.queries.sql_stray_continentPlayerPoints.format(continentCode, style)
     )
 
-    if xquery:
-        xquery = xquery.pop()
-    else:
-        response.status_code = status.HTTP_204_NO_CONTENT
-        return response
-
-    toc = time.perf_counter()
-
-    print(f"Execution time {toc - tic:0.4f}")
-
-    # Cache the data in Redis
-    set_cache(cache_key, xquery)
-
-    return xquery
+    return xquery.pop() if xquery else None
 
 
 @router.get(
@@ -1233,37 +1040,19 @@ async def continentPlayerRank(
     style: int,
     points: int,
 ):
-    """`char[] sql_stray_continentPlayerRank = ....`"""
+    """`char[] sql_stray_continentPlayerRank = ....`\n
+    Read from the in-memory rank index"""
     tic = time.perf_counter()
 
-    cache_key = f"continentPlayerRank:{continentCode}-{style}-{points}"
-    cached_data = get_cache(cache_key)
-    if cached_data is not None:
-        print(f"[Redis] Loaded '{cache_key}' ({time.perf_counter() - tic:0.4f}s)")
-        response.headers["content-type"] = "application/json"
-        response.status_code = status.HTTP_200_OK
-        response.body = json.loads(cached_data, use_decimal=True, parse_nan=True)
-        return response
-
-    xquery = selectQuery(
-        surftimer.queries.sql_stray_continentPlayerRank.format(
-            continentCode, style, points
-        )
-    )
-
-    if xquery:
-        xquery = xquery.pop()
-    else:
-        response.status_code = status.HTTP_204_NO_CONTENT
-        return response
+    index = await rank_indexes.get(style)
+    xquery = {
+        "COUNT(steamid) + 1": index.rank_for_points(points, continent=continentCode)
+    }
 
     toc = time.perf_counter()
 
     print(f"Execution time {toc - tic:0.4f}")
 
-    # Cache the data in Redis
-    set_cache(cache_key, xquery)
-
     return xquery
 
 
@@ -1272,6 +1061,10 @@ async def continentPlayerRank(
     name="Player Continent by Name",
     tags=["ck_playerrank", "strays"],
 )
+@cached(
+    "continentGetPlayerContinentByName:{name}-{style}",
+    tags=["players", "table:ck_playerrank"],
+)
 async def continentGetPlayerContinentByName(
     request: Request,
     response: Response,
@@ -1279,37 +1072,13 @@ async def continentGetPlayerContinentByName(
     style: int,
 ):
     """`char[] sql_stray_continentGetPlayerContinentByName = ....`"""
-    tic = time.perf_counter()
-
-    cache_key = f"continentGetPlayerContinentByName:{name}-{style}"
-    cached_data = get_cache(cache_key)
-    if cached_data is not None:
-        print(f"[Redis] Loaded '{cache_key}' ({time.perf_counter() - tic:0.4f}s)")
-        response.headers["content-type"] = "application/json"
-        response.status_code = status.HTTP_200_OK
-        response.body = json.loads(cached_data, use_decimal=True, parse_nan=True)
-        return response
-
-    xquery = selectQuery(
+    xquery = await selectQueryAsync(
         surftimer.queries.sql_stray_continentGetPlayerContinentByName.format(
             name, style
         )
     )
 
-    if xquery:
-        xquery = xquery.pop()
-    else:
-        response.status_code = status.HTTP_204_NO_CONTENT
-        return response
-
-    toc = time.perf_counter()
-
-    print(f"Execution time {toc - tic:0.4f}")
-
-    # Cache the data in Redis
-    set_cache(cache_key, xquery)
-
-    return xquery
+    return xquery.pop() if xquery else None
 
 
 @router.get(
@@ -1317,6 +1086,10 @@ async def continentGetPlayerContinentByName(
     name="Continent Top",
     tags=["ck_playerrank", "strays"],
 )
+@cached(
+    "continentTop:{continentCode}-{style}",
+    tags=["style:{style}", "table:ck_playerrank"],
+)
 async def continentTop(
     request: Request,
     response: Response,
@@ -1324,31 +1097,12 @@ async def continentTop(
     style: int,
 ):
     """`char[] sql_stray_continentTop = ....`"""
-    tic = time.perf_counter()
-
-    cache_key = f"continentTop:{continentCode}-{style}"
-    cached_data = get_cache(cache_key)
-    if cached_data is not None:
-        print(f"[Redis] Loaded '{cache_key}' ({time.perf_counter() - tic:0.4f}s)")
-        response.headers["content-type"] = "application/json"
-        response.status_code = status.HTTP_200_OK
-        response.body = json.loads(cached_data, use_decimal=True, parse_nan=True)
-        return response
-
-    xquery = selectQuery(
+    xquery = await selectQueryAsync(
         surftimer.queries.sql_stray_continentTop.format(continentCode, style)
     )
 
     if len(xquery) <= 0:
-        response.status_code = status.HTTP_204_NO_CONTENT
-        return response
-
-    toc = time.perf_counter()
-
-    print(f"Execution time {toc - tic:0.4f}")
-
-    # Cache the data in Redis
-    set_cache(cache_key, xquery)
+        return None
 
     return xquery
 
@@ -1358,35 +1112,17 @@ async def continentTop(
     name="All Continent Names",
     tags=["ck_playerrank", "strays"],
 )
+@cached("continentNames:{style}", tags=["style:{style}", "table:ck_playerrank"])
 async def continentNames(
     request: Request,
     response: Response,
     style: int,
 ):
     """`char[] sql_stray_continentNames = ....`"""
-    tic = time.perf_counter()
-
-    cache_key = f"continentNames:{style}"
-    cached_data = get_cache(cache_key)
-    if cached_data is not None:
-        print(f"[Redis] Loaded '{cache_key}' ({time.perf_counter() - tic:0.4f}s)")
-        response.headers["content-type"] = "application/json"
-        response.status_code = status.HTTP_200_OK
-        response.body = json.loads(cached_data, use_decimal=True, parse_nan=True)
-        return response
-
-    xquery = selectQuery(surftimer.queries.sql_stray_continentNames.format(style))
+    xquery = await selectQueryAsync(surftimer.queries.sql_stray_continentNames.format(style))
 
     if len(xquery) <= 0:
-        response.status_code = status.HTTP_204_NO_CONTENT
-        return response
-
-    toc = time.perf_counter()
-
-    print(f"Execution time {toc - tic:0.4f}")
-
-    # Cache the data in Redis
-    set_cache(cache_key, xquery)
+        return None
 
     return xquery
 
@@ -1396,6 +1132,10 @@ async def continentNames(
     name="Player Rank",
     tags=["ck_playerrank", "strays"],
 )
+@cached(
+    "viewPlayerRank:{style}-{steamid32}",
+    tags=["style:{style}", "table:ck_playerrank"],
+)
 async def viewPlayerRank(
     request: Request,
     response: Response,
@@ -1403,31 +1143,12 @@ async def viewPlayerRank(
     steamid32: str,
 ):
     """`char[] sql_stray_viewPlayerRank = ....`"""
-    tic = time.perf_counter()
-
-    cache_key = f"viewPlayerRank:{style}-{steamid32}"
-    cached_data = get_cache(cache_key)
-    if cached_data is not None:
-        print(f"[Redis] Loaded '{cache_key}' ({time.perf_counter() - tic:0.4f}s)")
-        response.headers["content-type"] = "application/json"
-        response.status_code = status.HTTP_200_OK
-        response.body = json.loads(cached_data, use_decimal=True, parse_nan=True)
-        return response
-
-    xquery = selectQuery(
+    xquery = await selectQueryAsync(
         surftimer.queries.sql_stray_viewPlayerRank.format(style, steamid32, style)
     )
 
     if len(xquery) <= 0:
-        response.status_code = status.HTTP_204_NO_CONTENT
-        return response
-
-    toc = time.perf_counter()
-
-    print(f"Execution time {toc - tic:0.4f}")
-
-    # Cache the data in Redis
-    set_cache(cache_key, xquery)
+        return None
 
     return xquery
 
@@ -1443,24 +1164,14 @@ async def getNextRankPoints(
     style: int,
     limit: int,
 ):
-    """`char[] sql_stray_getNextRankPoints = ....`"""
+    """`char[] sql_stray_getNextRankPoints = ....`\n
+    Read from the in-memory rank index"""
     tic = time.perf_counter()
 
-    cache_key = f"getNextRankPoints:{style}-{limit}"
-    cached_data = get_cache(cache_key)
-    if cached_data is not None:
-        print(f"[Redis] Loaded '{cache_key}' ({time.perf_counter() - tic:0.4f}s)")
-        response.headers["content-type"] = "application/json"
-        response.status_code = status.HTTP_200_OK
-        response.body = json.loads(cached_data, use_decimal=True, parse_nan=True)
-        return response
-
-    xquery = selectQuery(
-        surftimer.queries.sql_stray_getNextRankPoints.format(style, limit)
-    )
+    xquery = (await rank_indexes.get(style)).at(limit)
 
     if xquery:
-        xquery = xquery.pop()
+        xquery = {"points": xquery["points"]}
     else:
         response.status_code = status.HTTP_204_NO_CONTENT
         return response
@@ -1469,9 +1180,6 @@ async def getNextRankPoints(
 
     print(f"Execution time {toc - tic:0.4f}")
 
-    # Cache the data in Redis
-    set_cache(cache_key, xquery)
-
     return xquery
 
 
@@ -1480,6 +1188,10 @@ async def getNextRankPoints(
     name="Player Info - TO BE MERGED",
     tags=["ck_playerrank", "strays"],
 )
+@cached(
+    "viewPlayerInfo:{steamid32}",
+    tags=["player:{steamid32}", "table:ck_playerrank"],
+)
 async def viewPlayerInfo(
     request: Request,
     response: Response,
@@ -1487,33 +1199,9 @@ async def viewPlayerInfo(
 ):
     """To be merged with a `SELECT *` *(?)*\n
     `char[] sql_stray_viewPlayerInfo = ....`"""
-    tic = time.perf_counter()
-
-    cache_key = f"viewPlayerInfo:{steamid32}"
-    cached_data = get_cache(cache_key)
-    if cached_data is not None:
-        print(f"[Redis] Loaded '{cache_key}' ({time.perf_counter() - tic:0.4f}s)")
-        response.headers["content-type"] = "application/json"
-        response.status_code = status.HTTP_200_OK
-        response.body = json.loads(cached_data, use_decimal=True, parse_nan=True)
-        return response
+    xquery = await selectQueryAsync(surftimer.queries.sql_stray_viewPlayerInfo.format(steamid32))
 
-    xquery = selectQuery(surftimer.queries.sql_stray_viewPlayerInfo.format(steamid32))
-
-    if xquery:
-        xquery = xquery.pop()
-    else:
-        response.status_code = status.HTTP_204_NO_CONTENT
-        return response
-
-    toc = time.perf_counter()
-
-    print(f"Execution time {toc - tic:0.4f}")
-
-    # Cache the data in Redis
-    set_cache(cache_key, xquery)
-
-    return xquery
+    return xquery.pop() if xquery else None
 
 
 @router.get(
@@ -1526,22 +1214,14 @@ async def rankCommand(
     response: Response,
     limit: int,
 ):
-    """`char[] sql_stray_rankCommand = ....`"""
+    """`char[] sql_stray_rankCommand = ....`\n
+    Read from the in-memory rank index"""
     tic = time.perf_counter()
 
-    cache_key = f"rankCommand:{limit}"
-    cached_data = get_cache(cache_key)
-    if cached_data is not None:
-        print(f"[Redis] Loaded '{cache_key}' ({time.perf_counter() - tic:0.4f}s)")
-        response.headers["content-type"] = "application/json"
-        response.status_code = status.HTTP_200_OK
-        response.body = json.loads(cached_data, use_decimal=True, parse_nan=True)
-        return response
-
-    xquery = selectQuery(surftimer.queries.sql_stray_rankCommand.format(limit))
+    xquery = (await rank_indexes.get(0)).at(limit)
 
     if xquery:
-        xquery = xquery.pop()
+        xquery = {"name": xquery["name"], "points": xquery["points"]}
     else:
         response.status_code = status.HTTP_204_NO_CONTENT
         return response
@@ -1550,9 +1230,6 @@ async def rankCommand(
 
     print(f"Execution time {toc - tic:0.4f}")
 
-    # Cache the data in Redis
-    set_cache(cache_key, xquery)
-
     return xquery
 
 
@@ -1566,22 +1243,14 @@ async def rankCommandSelf(
     response: Response,
     steamid32: str,
 ):
-    """`char[] sql_stray_rankCommandSelf = ....`"""
+    """`char[] sql_stray_rankCommandSelf = ....`\n
+    Read from the in-memory rank index"""
     tic = time.perf_counter()
 
-    cache_key = f"rankCommandSelf:{steamid32}"
-    cached_data = get_cache(cache_key)
-    if cached_data is not None:
-        print(f"[Redis] Loaded '{cache_key}' ({time.perf_counter() - tic:0.4f}s)")
-        response.headers["content-type"] = "application/json"
-        response.status_code = status.HTTP_200_OK
-        response.body = json.loads(cached_data, use_decimal=True, parse_nan=True)
-        return response
-
-    xquery = selectQuery(surftimer.queries.sql_stray_rankCommandSelf.format(steamid32))
+    xquery = (await rank_indexes.get(0)).player(steamid32)
 
     if xquery:
-        xquery = xquery.pop()
+        xquery = {"name": xquery["name"], "points": xquery["points"]}
     else:
         response.status_code = status.HTTP_204_NO_CONTENT
         return response
@@ -1590,9 +1259,6 @@ async def rankCommandSelf(
 
     print(f"Execution time {toc - tic:0.4f}")
 
-    # Cache the data in Redis
-    set_cache(cache_key, xquery)
-
     return xquery
 
 
@@ -1601,41 +1267,18 @@ async def rankCommandSelf(
     name="Unknown Player Info - TO BE MERGED",
     tags=["ck_playerrank", "strays"],
 )
+@cached("selectPlayerRankUnknown:{name}", tags=["players", "table:ck_playerrank"])
 async def selectPlayerRankUnknown(
     request: Request,
     response: Response,
     name: str,
 ):
     """`char[] sql_stray_selectPlayerRankUnknown = ....`"""
-    tic = time.perf_counter()
-
-    cache_key = f"selectPlayerRankUnknown:{name}"
-    cached_data = get_cache(cache_key)
-    if cached_data is not None:
-        print(f"[Redis] Loaded '{cache_key}' ({time.perf_counter() - tic:0.4f}s)")
-        response.headers["content-type"] = "application/json"
-        response.status_code = status.HTTP_200_OK
-        response.body = json.loads(cached_data, use_decimal=True, parse_nan=True)
-        return response
-
-    xquery = selectQuery(
+    xquery = await selectQueryAsync(
         surftimer.queries.sql_stray_selectPlayerRankUnknown.format(name)
     )
 
-    if xquery:
-        xquery = xquery.pop()
-    else:
-        response.status_code = status.HTTP_204_NO_CONTENT
-        return response
-
-    toc = time.perf_counter()
-
-    print(f"Execution time {toc - tic:0.4f}")
-
-    # Cache the data in Redis
-    set_cache(cache_key, xquery)
-
-    return xquery
+    return xquery.pop() if xquery else None
 
 
 @router.get(
@@ -1643,6 +1286,7 @@ async def selectPlayerRankUnknown(
     name="Unknown Player Info - TO BE MERGED",
     tags=["ck_playerrank", "strays"],
 )
+@cached("playerRankByName:{style}-{name}", tags=["players", "table:ck_playerrank"])
 async def selectPlayerRankByName(
     request: Request,
     response: Response,
@@ -1650,32 +1294,8 @@ async def selectPlayerRankByName(
     name: str,
 ):
     """`char[] sql_stray_playerRankByName = ....`"""
-    tic = time.perf_counter()
-
-    cache_key = f"playerRankByName:{style}-{name}"
-    cached_data = get_cache(cache_key)
-    if cached_data is not None:
-        print(f"[Redis] Loaded '{cache_key}' ({time.perf_counter() - tic:0.4f}s)")
-        response.headers["content-type"] = "application/json"
-        response.status_code = status.HTTP_200_OK
-        response.body = json.loads(cached_data, use_decimal=True, parse_nan=True)
-        return response
-
-    xquery = selectQuery(
+    xquery = await selectQueryAsync(
         surftimer.queries.sql_stray_playerRankByName.format(style, name)
     )
 
-    if xquery:
-        xquery = xquery.pop()
-    else:
-        response.status_code = status.HTTP_204_NO_CONTENT
-        return response
-
-    toc = time.perf_counter()
-
-    print(f"Execution time {toc - tic:0.4f}")
-
-    # Cache the data in Redis
-    set_cache(cache_key, xquery)
-
-    return xquery
+    return xquery.pop() if xquery else None
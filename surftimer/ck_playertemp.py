@@ -1,7 +1,6 @@
 from fastapi import APIRouter, Request, Response, status
-from fastapi.responses import JSONResponse
-from sql import selectQuery, insertQuery
-from globals import get_cache, set_cache
+from sql import selectQueryAsync, insertQueryAsync
+from globals import cached, invalidate_tags
 from pydantic import BaseModel
 import time, json, surftimer.queries
 
@@ -38,7 +37,7 @@ async def insertPlayerTmp(request: Request, response: Response, data: PlayerTemp
     ```"""
     tic = time.perf_counter()
 
-    xquery = insertQuery(
+    xquery = await insertQueryAsync(
         surftimer.queries.sql_insertPlayerTmp.format(
             data.cords1,
             data.cords2,
@@ -55,6 +54,7 @@ async def insertPlayerTmp(request: Request, response: Response, data: PlayerTemp
         )
     )
 
+    invalidate_tags(f"player:{data.steamid}")
     content_data = {"inserted": xquery, "xtime": time.perf_counter() - tic}
     if xquery < 1:
         # response.body = json.dumps(content_data).encode('utf-8')
@@ -81,7 +81,7 @@ async def updatePlayerTmp(request: Request, response: Response, data: PlayerTemp
     ```"""
     tic = time.perf_counter()
 
-    xquery = insertQuery(
+    xquery = await insertQueryAsync(
         surftimer.queries.sql_updatePlayerTmp.format(
             data.cords1,
             data.cords2,
@@ -98,6 +98,7 @@ async def updatePlayerTmp(request: Request, response: Response, data: PlayerTemp
         )
     )
     
+    invalidate_tags(f"player:{data.steamid}")
     content_data = {"updated": xquery, "xtime": time.perf_counter() - tic}
     if xquery < 1:
         # response.body = json.dumps(content_data).encode('utf-8')
@@ -127,8 +128,9 @@ async def deletePlayerTmp(
     """```char sql_deletePlayerTmp[] = ....```"""
     tic = time.perf_counter()
 
-    xquery = insertQuery(surftimer.queries.sql_deletePlayerTmp.format(steamid32))
+    xquery = await insertQueryAsync(surftimer.queries.sql_deletePlayerTmp.format(steamid32))
 
+    invalidate_tags(f"player:{steamid32}")
     content_data = {"deleted": xquery, "xtime": time.perf_counter() - tic}
     if xquery < 1:
         # response.body = json.dumps(content_data).encode('utf-8')
@@ -149,22 +151,15 @@ async def deletePlayerTmp(
     name="Get Player Temp",
     tags=["ck_playertemp"],
 )
+@cached(
+    "selectPlayerTmp:{steamid32}-{mapname}",
+    tags=["player:{steamid32}", "map:{mapname}", "table:ck_playertemp"],
+)
 async def selectPlayerTmp(
     request: Request, response: Response, steamid32: str, mapname: str
 ):
     """`char[] sql_selectPlayerTmp = ....`"""
-    tic = time.perf_counter()
-
-    # Check if data is cached in Redis
-    cache_key = f"selectPlayerTmp:{steamid32}-{mapname}"
-    cached_data = get_cache(cache_key)
-    if cached_data is not None:
-        print(f"[Redis] Loaded '{cache_key}' ({time.perf_counter() - tic:0.4f}s)")
-        return JSONResponse(
-            status_code=status.HTTP_200_OK, content=json.loads(cached_data)
-        )
-
-    xquery = selectQuery(
+    xquery = await selectQueryAsync(
         surftimer.queries.sql_selectPlayerTmp.format(steamid32, mapname)
     )
 
@@ -175,10 +170,4 @@ async def selectPlayerTmp(
         response.status_code = status.HTTP_204_NO_CONTENT
         return response
 
-    # Cache the data in Redis
-    set_cache(cache_key, xquery)
-
-    toc = time.perf_counter()
-    print(f"Execution time {toc - tic:0.4f}")
-
     return xquery
@@ -1,7 +1,7 @@
 from fastapi import APIRouter, Request, Response, status
 from fastapi.responses import JSONResponse
-from sql import selectQuery, insertQuery
-from globals import get_cache, set_cache
+from sql import selectQueryAsync, insertQueryAsync
+from globals import cached, invalidate_tags
 from pydantic import BaseModel
 from decimal import Decimal
 import simplejson as json
@@ -30,6 +30,10 @@ router = APIRouter()
     name="Get Personal Record Info",
     tags=["ck_prinfo"],
 )
+@cached(
+    "selectPR:{steamid32}-{mapname}-{zonegroup}",
+    tags=["player:{steamid32}", "map:{mapname}", "table:ck_prinfo"],
+)
 async def selectPR(
     request: Request,
     response: Response,
@@ -38,33 +42,12 @@ async def selectPR(
     zonegroup: int,
 ):
     """`char[] sql_selectPR = ....`"""
-    tic = time.perf_counter()
-
-    # Check if data is cached in Redis
-    cache_key = f"selectPR:{steamid32}-{mapname}-{zonegroup}"
-    cached_data = get_cache(cache_key)
-    if cached_data is not None:
-        print(f"[Redis] Loaded '{cache_key}' ({time.perf_counter() - tic:0.4f}s)")
-        response.headers["content-type"] = "application/json"
-        response.status_code = status.HTTP_200_OK
-        response.body = json.loads(cached_data, use_decimal=True, parse_nan=True)
-        return response
-
-    xquery = selectQuery(
+    xquery = await selectQueryAsync(
         surftimer.queries.sql_selectPR.format(steamid32, mapname, zonegroup)
     )
 
     if len(xquery) <= 0:
-        response.headers["content-type"] = "application/json"
-        response.status_code = status.HTTP_204_NO_CONTENT
-        return response
-
-    # Cache the data in Redis
-    set_cache(cache_key, xquery)
-
-    toc = time.perf_counter()
-
-    print(f"Execution time {toc - tic:0.4f}")
+        return None
 
     return xquery
 
@@ -74,6 +57,10 @@ async def selectPR(
     name="Get Personal Record Info by Name",
     tags=["ck_prinfo", "strays"],
 )
+@cached(
+    "PRinfoByName:{mapname}-{zonegroup}-{steamid32}",
+    tags=["player:{steamid32}", "map:{mapname}", "table:ck_prinfo"],
+)
 async def PRinfoByName(
     request: Request,
     response: Response,
@@ -82,33 +69,12 @@ async def PRinfoByName(
     steamid32: str,
 ):
     """`char[] sql_stray_PRinfoByName = ....`"""
-    tic = time.perf_counter()
-
-    # Check if data is cached in Redis
-    cache_key = f"PRinfoByName:{mapname}-{zonegroup}-{steamid32}"
-    cached_data = get_cache(cache_key)
-    if cached_data is not None:
-        print(f"[Redis] Loaded '{cache_key}' ({time.perf_counter() - tic:0.4f}s)")
-        response.headers["content-type"] = "application/json"
-        response.status_code = status.HTTP_200_OK
-        response.body = json.loads(cached_data, use_decimal=True, parse_nan=True)
-        return response
-
-    xquery = selectQuery(
+    xquery = await selectQueryAsync(
         surftimer.queries.sql_stray_PRinfoByName.format(mapname, zonegroup, steamid32)
     )
 
     if len(xquery) <= 0:
-        response.headers["content-type"] = "application/json"
-        response.status_code = status.HTTP_204_NO_CONTENT
-        return response
-
-    # Cache the data in Redis
-    set_cache(cache_key, xquery)
-
-    toc = time.perf_counter()
-
-    print(f"Execution time {toc - tic:0.4f}")
+        return None
 
     return xquery
 
@@ -129,7 +95,7 @@ async def insertPR(
     ```"""
     tic = time.perf_counter()
 
-    xquery = insertQuery(
+    xquery = await insertQueryAsync(
         surftimer.queries.sql_insertPR.format(
             data.steamid32,
             data.name,
@@ -143,6 +109,7 @@ async def insertPR(
         )
     )
 
+    invalidate_tags(f"player:{data.steamid32}")
     content_data = {"inserted": xquery, "xtime": time.perf_counter() - tic}
     if xquery < 1:
         # response.body = json.dumps(content_data).encode('utf-8')
@@ -179,7 +146,7 @@ async def updatePrInfo(
     tic = time.perf_counter()
 
     if data.runtime is None:
-        xquery = insertQuery(
+        xquery = await insertQueryAsync(
             surftimer.queries.sql_updatePrinfo.format(
                 data.PRtimeinzone,
                 data.PRcomplete,
@@ -191,7 +158,7 @@ async def updatePrInfo(
             )
         )
     else:
-        xquery = insertQuery(
+        xquery = await insertQueryAsync(
             surftimer.queries.sql_updatePrinfo_withruntime.format(
                 data.PRtimeinzone,
                 data.PRcomplete,
@@ -204,6 +171,7 @@ async def updatePrInfo(
             )
         )
 
+    invalidate_tags(f"player:{data.steamid32}")
     content_data = {"updated": xquery, "xtime": time.perf_counter() - tic}
     if xquery < 1:
         # response.body = json.dumps(content_data).encode('utf-8')
@@ -238,10 +206,11 @@ async def clearPRruntime(
     ```\n"""
     tic = time.perf_counter()
 
-    xquery = insertQuery(
+    xquery = await insertQueryAsync(
         surftimer.queries.sql_clearPRruntime.format(steamid32, mapname, zonegroup)
     )
 
+    invalidate_tags(f"player:{steamid32}")
     content_data = {"updated": xquery, "xtime": time.perf_counter() - tic}
     if xquery < 1:
         # response.body = json.dumps(content_data).encode('utf-8')
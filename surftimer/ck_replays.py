@@ -1,7 +1,7 @@
 from fastapi import APIRouter, Request, Response, status
 from fastapi.responses import JSONResponse
-from sql import selectQuery, insertQuery
-from globals import get_cache, set_cache
+from sql import selectQueryAsync, insertQueryAsync
+from globals import cached, invalidate_tags
 from pydantic import BaseModel
 from decimal import Decimal
 import simplejson as json
@@ -16,6 +16,10 @@ router = APIRouter()
     name="Get Replay Checkpoints Ticks",
     tags=["ck_replays"],
 )
+@cached(
+    "selectReplayCPTicksAll:{mapname}-{style}",
+    tags=["map:{mapname}", "table:ck_replays"],
+)
 async def selectReplayCPTicksAll(
     request: Request,
     response: Response,
@@ -23,33 +27,12 @@ async def selectReplayCPTicksAll(
     style: int,
 ):
     """`char[] sql_selectReplayCPTicksAll = ....`"""
-    tic = time.perf_counter()
-
-    # Check if data is cached in Redis
-    cache_key = f"selectReplayCPTicksAll:{mapname}-{style}"
-    cached_data = get_cache(cache_key)
-    if cached_data is not None:
-        print(f"[Redis] Loaded '{cache_key}' ({time.perf_counter() - tic:0.4f}s)")
-        response.headers["content-type"] = "application/json"
-        response.status_code = status.HTTP_200_OK
-        response.body = json.loads(cached_data, use_decimal=True, parse_nan=True)
-        return response
-
-    xquery = selectQuery(
+    xquery = await selectQueryAsync(
         surftimer.queries.sql_selectReplayCPTicksAll.format(mapname, style)
     )
 
     if len(xquery) <= 0:
-        response.headers["content-type"] = "application/json"
-        response.status_code = status.HTTP_204_NO_CONTENT
-        return response
-
-    # Cache the data in Redis
-    set_cache(cache_key, xquery)
-
-    toc = time.perf_counter()
-
-    print(f"Execution time {toc - tic:0.4f}")
+        return None
 
     return xquery
 
@@ -72,10 +55,11 @@ async def insertReplayCPTicks(
     ```"""
     tic = time.perf_counter()
 
-    xquery = insertQuery(
+    xquery = await insertQueryAsync(
         surftimer.queries.sql_insertReplayCPTicks.format(mapname, cp, frame, style)
     )
 
+    invalidate_tags(f"map:{mapname}")
     content_data = {"inserted": xquery, "xtime": time.perf_counter() - tic}
     if xquery < 1:
         # response.body = json.dumps(content_data).encode('utf-8')
@@ -110,10 +94,11 @@ async def updateReplayCPTicks(
     ```"""
     tic = time.perf_counter()
 
-    xquery = insertQuery(
+    xquery = await insertQueryAsync(
         surftimer.queries.sql_updateReplayCPTicks.format(frame, mapname, cp, style)
     )
 
+    invalidate_tags(f"map:{mapname}")
     content_data = {"updated": xquery, "xtime": time.perf_counter() - tic}
     if xquery < 1:
         # response.body = json.dumps(content_data).encode('utf-8')
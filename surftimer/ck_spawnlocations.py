@@ -1,7 +1,7 @@
 from fastapi import APIRouter, Request, Response, status
 from fastapi.responses import JSONResponse
-from sql import selectQuery, insertQuery
-from globals import get_cache, set_cache
+from sql import selectQueryAsync, insertQueryAsync
+from globals import cached, invalidate_tags
 from pydantic import BaseModel
 from decimal import Decimal
 import simplejson as json
@@ -33,37 +33,22 @@ router = APIRouter()
     name="Get Spawn Locations",
     tags=["ck_spawnlocations"],
 )
+@cached(
+    "selectSpawnLocations:{mapname}",
+    tags=["map:{mapname}", "table:ck_spawnlocations"],
+)
 async def selectSpawnLocations(
     request: Request,
     response: Response,
     mapname: str,
 ):
     """`char[] sql_selectSpawnLocations = ....`"""
-    tic = time.perf_counter()
-
-    # Check if data is cached in Redis
-    cache_key = f"selectSpawnLocations:{mapname}"
-    cached_data = get_cache(cache_key)
-    if cached_data is not None:
-        print(f"[Redis] Loaded '{cache_key}' ({time.perf_counter() - tic:0.4f}s)")
-        response.headers["content-type"] = "application/json"
-        response.status_code = status.HTTP_200_OK
-        response.body = json.loads(cached_data, use_decimal=True, parse_nan=True)
-        return response
-
-    xquery = selectQuery(surftimer.queries.sql_selectSpawnLocations.format(mapname))
+    xquery = await selectQueryAsync(
+        surftimer.queries.sql_selectSpawnLocations.format(mapname)
+    )
 
     if len(xquery) <= 0:
-        response.headers["content-type"] = "application/json"
-        response.status_code = status.HTTP_204_NO_CONTENT
-        return response
-
-    # Cache the data in Redis
-    set_cache(cache_key, xquery)
-
-    toc = time.perf_counter()
-
-    print(f"Execution time {toc - tic:0.4f}")
+        return None
 
     return xquery
 
@@ -73,37 +58,19 @@ async def selectSpawnLocations(
     name="Get Spawn Points - can merge this ig?",
     tags=["ck_spawnlocations", "strays"],
 )
+@cached("getSpawnPoints:{mapname}", tags=["map:{mapname}", "table:ck_spawnlocations"])
 async def getSpawnPoints(
     request: Request,
     response: Response,
     mapname: str,
 ):
     """`char[] sql_stray_getSpawnPoints = ....`"""
-    tic = time.perf_counter()
-
-    # Check if data is cached in Redis
-    cache_key = f"getSpawnPoints:{mapname}"
-    cached_data = get_cache(cache_key)
-    if cached_data is not None:
-        print(f"[Redis] Loaded '{cache_key}' ({time.perf_counter() - tic:0.4f}s)")
-        response.headers["content-type"] = "application/json"
-        response.status_code = status.HTTP_200_OK
-        response.body = json.loads(cached_data, use_decimal=True, parse_nan=True)
-        return response
-
-    xquery = selectQuery(surftimer.queries.sql_stray_getSpawnPoints.format(mapname))
+    xquery = await selectQueryAsync(
+        surftimer.queries.sql_stray_getSpawnPoints.format(mapname)
+    )
 
     if len(xquery) <= 0:
-        response.headers["content-type"] = "application/json"
-        response.status_code = status.HTTP_204_NO_CONTENT
-        return response
-
-    # Cache the data in Redis
-    set_cache(cache_key, xquery)
-
-    toc = time.perf_counter()
-
-    print(f"Execution time {toc - tic:0.4f}")
+        return None
 
     return xquery
 
@@ -123,7 +90,7 @@ async def insertSpawnLocations(
     ```"""
     tic = time.perf_counter()
 
-    xquery = insertQuery(
+    xquery = await insertQueryAsync(
         surftimer.queries.sql_insertSpawnLocations.format(
             data.mapname,
             data.pos_x,
@@ -140,6 +107,7 @@ async def insertSpawnLocations(
         )
     )
 
+    invalidate_tags(f"map:{data.mapname}")
     content_data = {"inserted": xquery, "xtime": time.perf_counter() - tic}
     if xquery < 1:
         # response.body = json.dumps(content_data).encode('utf-8')
@@ -171,7 +139,7 @@ async def updateSpawnLocations(
     ```\n"""
     tic = time.perf_counter()
 
-    xquery = insertQuery(
+    xquery = await insertQueryAsync(
         surftimer.queries.sql_updateSpawnLocations.format(
             data.pos_x,
             data.pos_y,
@@ -188,6 +156,7 @@ async def updateSpawnLocations(
         )
     )
 
+    invalidate_tags(f"map:{data.mapname}")
     content_data = {"updated": xquery, "xtime": time.perf_counter() - tic}
     if xquery < 1:
         # response.body = json.dumps(content_data).encode('utf-8')
@@ -220,10 +189,11 @@ async def deleteCheckpoints(
     """```char sql_deleteSpawnLocations[] = ....```"""
     tic = time.perf_counter()
 
-    xquery = insertQuery(
+    xquery = await insertQueryAsync(
         surftimer.queries.sql_deleteSpawnLocations.format(mapname, zonegroup, teleside)
     )
 
+    invalidate_tags(f"map:{mapname}")
     content_data = {"deleted": xquery, "xtime": time.perf_counter() - tic}
     if xquery < 1:
         # response.body = json.dumps(content_data).encode('utf-8')
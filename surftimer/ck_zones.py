@@ -1,10 +1,11 @@
 from fastapi import APIRouter, Request, Response, status
 from fastapi.responses import JSONResponse
-from sql import selectQuery, insertQuery
-from globals import get_cache, set_cache
+from sql import selectQueryAsync, insertQueryAsync
+from globals import cached, invalidate_tags
 from pydantic import BaseModel
 from decimal import Decimal
 import simplejson as json
+from surftimer.map_catalog import map_catalog
 import time, surftimer.queries
 
 
@@ -49,7 +50,7 @@ async def insertZones(
     ```"""
     tic = time.perf_counter()
 
-    xquery = insertQuery(
+    xquery = await insertQueryAsync(
         surftimer.queries.sql_insertZones.format(
             data.mapname,
             data.zoneid,
@@ -72,6 +73,9 @@ async def insertZones(
         )
     )
 
+    if xquery > 0:
+        map_catalog.reset(data.mapname)
+    invalidate_tags(f"map:{data.mapname}", "table:ck_zones")
     content_data = {"inserted": xquery, "xtime": time.perf_counter() - tic}
     if xquery < 1:
         # response.body = json.dumps(content_data).encode('utf-8')
@@ -103,7 +107,7 @@ async def updateSpawnLocations(
     ```\n"""
     tic = time.perf_counter()
 
-    xquery = insertQuery(
+    xquery = await insertQueryAsync(
         surftimer.queries.sql_updateZone.format(
             data.zonetype,
             data.zonetypeid,
@@ -125,6 +129,9 @@ async def updateSpawnLocations(
         )
     )
 
+    if xquery > 0:
+        map_catalog.reset(data.mapname)
+    invalidate_tags(f"map:{data.mapname}", "table:ck_zones")
     content_data = {"updated": xquery, "xtime": time.perf_counter() - tic}
     if xquery < 1:
         # response.body = json.dumps(content_data).encode('utf-8')
@@ -147,6 +154,10 @@ async def updateSpawnLocations(
     name="Get Zone Type IDs",
     tags=["ck_zones"],
 )
+@cached(
+    "selectzoneTypeIds:{mapname}-{zonetype}-{zonegroup}",
+    tags=["map:{mapname}", "table:ck_zones"],
+)
 async def selectzoneTypeIds(
     request: Request,
     response: Response,
@@ -155,42 +166,11 @@ async def selectzoneTypeIds(
     zonegroup: int,
 ):
     """`char[] sql_selectzoneTypeIds = ....`"""
-    tic = time.perf_counter()
-
-    # Check if data is cached in Redis
-    cache_key = f"selectzoneTypeIds:{mapname}-{zonetype}-{zonegroup}"
-    cached_data = get_cache(cache_key)
-    if cached_data is not None:
-        print(f"[Redis] Loaded '{cache_key}' ({time.perf_counter() - tic:0.4f}s)")
-        response.headers["content-type"] = "application/json"
-        response.status_code = status.HTTP_200_OK
-        response.body = json.loads(cached_data, use_decimal=True, parse_nan=True)
-        return response
-
-    xquery = selectQuery(
+    xquery = await selectQueryAsync(
         surftimer.queries.sql_selectzoneTypeIds.format(mapname, zonetype, zonegroup)
     )
 
-    if xquery:
-        xquery = xquery.pop()
-    else:
-        response.headers["content-type"] = "application/json"
-        response.status_code = status.HTTP_204_NO_CONTENT
-        return response
-
-    # if len(xquery) <= 0:
-    #     response.headers["content-type"] = "application/json"
-    #     response.status_code = status.HTTP_204_NO_CONTENT
-    #     return response
-
-    # Cache the data in Redis
-    set_cache(cache_key, xquery)
-
-    toc = time.perf_counter()
-
-    print(f"Execution time {toc - tic:0.4f}")
-
-    return xquery
+    return xquery.pop() if xquery else None
 
 
 @router.get(
@@ -198,25 +178,19 @@ async def selectzoneTypeIds(
     name="Get Map Zones",
     tags=["ck_zones"],
 )
+@cached(
+    "selectMapZones:{mapname}",
+    tags=["map:{mapname}", "table:ck_zones"],
+    coalesce=True,
+)
 async def selectMapZones(
     request: Request,
     response: Response,
     mapname: str,
 ):
-    """`char[] sql_selectMapZones = ....`"""
-    tic = time.perf_counter()
-
-    # Check if data is cached in Redis
-    cache_key = f"selectMapZones:{mapname}"
-    cached_data = get_cache(cache_key)
-    if cached_data is not None:
-        print(f"[Redis] Loaded '{cache_key}' ({time.perf_counter() - tic:0.4f}s)")
-        response.headers["content-type"] = "application/json"
-        response.status_code = status.HTTP_200_OK
-        response.body = json.loads(cached_data, use_decimal=True, parse_nan=True)
-        return response
-
-    xquery = selectQuery(surftimer.queries.sql_selectMapZones.format(mapname))
+    """`char[] sql_selectMapZones = ....`\n
+    Servers loading the same map share a single query"""
+    xquery = await selectQueryAsync(surftimer.queries.sql_selectMapZones.format(mapname))
 
     # if len(xquery) <= 0:
     #     xquery = xquery.pop()
@@ -226,16 +200,7 @@ async def selectMapZones(
     #     return response
 
     if len(xquery) <= 0:
-        response.headers["content-type"] = "application/json"
-        response.status_code = status.HTTP_204_NO_CONTENT
-        return response
-
-    # Cache the data in Redis
-    set_cache(cache_key, xquery)
-
-    toc = time.perf_counter()
-
-    print(f"Execution time {toc - tic:0.4f}")
+        return None
 
     return xquery
 
@@ -245,24 +210,13 @@ async def selectMapZones(
     name="Get Total Bonuses",
     tags=["ck_zones"],
 )
+@cached("selectTotalBonusCount", tags=["table:ck_zones"])
 async def selectTotalBonusCount(
     request: Request,
     response: Response,
 ):
     """`char[] sql_selectTotalBonusCount = ....`"""
-    tic = time.perf_counter()
-
-    # Check if data is cached in Redis
-    cache_key = f"selectMapZones:"
-    cached_data = get_cache(cache_key)
-    if cached_data is not None:
-        print(f"[Redis] Loaded '{cache_key}' ({time.perf_counter() - tic:0.4f}s)")
-        response.headers["content-type"] = "application/json"
-        response.status_code = status.HTTP_200_OK
-        response.body = json.loads(cached_data, use_decimal=True, parse_nan=True)
-        return response
-
-    xquery = selectQuery(surftimer.queries.sql_selectTotalBonusCount)
+    xquery = await selectQueryAsync(surftimer.queries.sql_selectTotalBonusCount)
 
     # if len(xquery) <= 0:
     #     xquery = xquery.pop()
@@ -272,16 +226,7 @@ async def selectTotalBonusCount(
     #     return response
 
     if len(xquery) <= 0:
-        response.headers["content-type"] = "application/json"
-        response.status_code = status.HTTP_204_NO_CONTENT
-        return response
-
-    # Cache the data in Redis
-    set_cache(cache_key, xquery)
-
-    toc = time.perf_counter()
-
-    print(f"Execution time {toc - tic:0.4f}")
+        return None
 
     return xquery
 
@@ -291,25 +236,14 @@ async def selectTotalBonusCount(
     name="Get Zone IDs",
     tags=["ck_zones"],
 )
+@cached("selectZoneIds:{mapname}", tags=["map:{mapname}", "table:ck_zones"])
 async def selectZoneIds(
     request: Request,
     response: Response,
     mapname: str,
 ):
     """`char[] sql_selectZoneIds = ....`"""
-    tic = time.perf_counter()
-
-    # Check if data is cached in Redis
-    cache_key = f"selectZoneIds:{mapname}"
-    cached_data = get_cache(cache_key)
-    if cached_data is not None:
-        print(f"[Redis] Loaded '{cache_key}' ({time.perf_counter() - tic:0.4f}s)")
-        response.headers["content-type"] = "application/json"
-        response.status_code = status.HTTP_200_OK
-        response.body = json.loads(cached_data, use_decimal=True, parse_nan=True)
-        return response
-
-    xquery = selectQuery(surftimer.queries.sql_selectZoneIds.format(mapname))
+    xquery = await selectQueryAsync(surftimer.queries.sql_selectZoneIds.format(mapname))
 
     # if xquery:
     #     xquery = xquery.pop()
@@ -319,16 +253,7 @@ async def selectZoneIds(
     #     return response
 
     if len(xquery) <= 0:
-        response.headers["content-type"] = "application/json"
-        response.status_code = status.HTTP_204_NO_CONTENT
-        return response
-
-    # Cache the data in Redis
-    set_cache(cache_key, xquery)
-
-    toc = time.perf_counter()
-
-    print(f"Execution time {toc - tic:0.4f}")
+        return None
 
     return xquery
 
@@ -338,25 +263,14 @@ async def selectZoneIds(
     name="Get Bonuses In Map",
     tags=["ck_zones"],
 )
+@cached("selectBonusesInMap:{mapname}", tags=["map:{mapname}", "table:ck_zones"])
 async def selectBonusesInMap(
     request: Request,
     response: Response,
     mapname: str,
 ):
     """`char[] sql_selectBonusesInMap = ....`"""
-    tic = time.perf_counter()
-
-    # Check if data is cached in Redis
-    cache_key = f"selectBonusesInMap:{mapname}"
-    cached_data = get_cache(cache_key)
-    if cached_data is not None:
-        print(f"[Redis] Loaded '{cache_key}' ({time.perf_counter() - tic:0.4f}s)")
-        response.headers["content-type"] = "application/json"
-        response.status_code = status.HTTP_200_OK
-        response.body = json.loads(cached_data, use_decimal=True, parse_nan=True)
-        return response
-
-    xquery = selectQuery(surftimer.queries.sql_selectBonusesInMap.format(mapname))
+    xquery = await selectQueryAsync(surftimer.queries.sql_selectBonusesInMap.format(mapname))
 
     # if xquery:
     #     xquery = xquery.pop()
@@ -366,16 +280,7 @@ async def selectBonusesInMap(
     #     return response
 
     if len(xquery) <= 0:
-        response.headers["content-type"] = "application/json"
-        response.status_code = status.HTTP_204_NO_CONTENT
-        return response
-
-    # Cache the data in Redis
-    set_cache(cache_key, xquery)
-
-    toc = time.perf_counter()
-
-    print(f"Execution time {toc - tic:0.4f}")
+        return None
 
     return xquery
 
@@ -393,8 +298,11 @@ async def deleteMapZones(
     """```char sql_deleteMapZones[] = ....```"""
     tic = time.perf_counter()
 
-    xquery = insertQuery(surftimer.queries.sql_deleteMapZones.format(mapname))
+    xquery = await insertQueryAsync(surftimer.queries.sql_deleteMapZones.format(mapname))
 
+    if xquery > 0:
+        map_catalog.reset(mapname)
+    invalidate_tags(f"map:{mapname}", "table:ck_zones")
     content_data = {"deleted": xquery, "xtime": time.perf_counter() - tic}
     if xquery < 1:
         # response.body = json.dumps(content_data).encode('utf-8')
@@ -425,8 +333,11 @@ async def deleteZone(
     """```char sql_deleteZone[] = ....```"""
     tic = time.perf_counter()
 
-    xquery = insertQuery(surftimer.queries.sql_deleteZone.format(mapname, zoneid))
+    xquery = await insertQueryAsync(surftimer.queries.sql_deleteZone.format(mapname, zoneid))
 
+    if xquery > 0:
+        map_catalog.reset(mapname)
+    invalidate_tags(f"map:{mapname}", "table:ck_zones")
     content_data = {"deleted": xquery, "xtime": time.perf_counter() - tic}
     if xquery < 1:
         # response.body = json.dumps(content_data).encode('utf-8')
@@ -457,8 +368,11 @@ async def deleteZonesInGroup(
     """```char sql_deleteZonesInGroup[] = ....```"""
     tic = time.perf_counter()
 
-    xquery = insertQuery(surftimer.queries.sql_deleteZonesInGroup.format(mapname, zonegroup))
+    xquery = await insertQueryAsync(surftimer.queries.sql_deleteZonesInGroup.format(mapname, zonegroup))
 
+    if xquery > 0:
+        map_catalog.reset(mapname)
+    invalidate_tags(f"map:{mapname}", "table:ck_zones")
     content_data = {"deleted": xquery, "xtime": time.perf_counter() - tic}
     if xquery < 1:
         # response.body = json.dumps(content_data).encode('utf-8')
@@ -492,11 +406,14 @@ async def setZoneNames(
     ```\n"""
     tic = time.perf_counter()
 
-    xquery = insertQuery(
+    xquery = await insertQueryAsync(
         surftimer.queries.sql_setZoneNames.format(zonename, mapname, zonegroup
         )
     )
 
+    if xquery > 0:
+        map_catalog.reset(mapname)
+    invalidate_tags(f"map:{mapname}", "table:ck_zones")
     content_data = {"updated": xquery, "xtime": time.perf_counter() - tic}
     if xquery < 1:
         # response.body = json.dumps(content_data).encode('utf-8')
@@ -0,0 +1,213 @@
+"""In-memory completion index for the unfinished maps and bonuses of a player\n
+Every `(mapname, zonegroup)` is interned to a bit and the completions of a player in a style are stored as an
+integer bitset, so the unfinished maps are a single AND-NOT between the catalog bitset and the player's. The catalog
+is rebuilt after the `map_catalog` changed and player bitsets are read again after `REDIS.EXPIRY` seconds
+(`ck_playertimes` is not written through the API) or when a `ck_bonus` write endpoint changes them. Changes are sent
+to the other workers through Redis pub/sub (`REDIS.COMPLETION_CHANNEL`)"""
+
+import threading, time
+from collections import OrderedDict
+from cache import PubSubChannel
+from sql import selectPrepared, selectQuery, runAsync
+from globals import config, redis_client
+from surftimer.map_catalog import map_catalog
+import surftimer.queries
+
+# Bitsets kept per worker, least recently used ones are dropped first
+MAX_PLAYERS = 4096
+
+
+def _bits(mask: int):
+    """Indexes of the set bits of `mask`"""
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+class CompletionIndex(PubSubChannel):
+    """Catalog and player completion bitsets, loaded lazily and kept in sync between workers\n
+    Without Redis changes are only applied in the worker that made them"""
+
+    def __init__(self, client, channel: str, ttl: float):
+        super().__init__(client, channel)
+        self.ttl = ttl
+
+        self._ids = {}
+        self._catalog = None
+        self._catalog_version = None
+        self._players = OrderedDict()  # (steamid, style) -> (expires, bitset)
+        self._lock = threading.Lock()
+
+    def _sync(self):
+        return self.client is not None
+
+    def _id(self, mapname: str, zonegroup: int):
+        """Bit of `(mapname, zonegroup)`, new ones get the next free bit"""
+        key = (mapname, zonegroup)
+        bit = self._ids.get(key)
+        if bit is None:
+            with self._lock:
+                bit = self._ids.setdefault(key, len(self._ids))
+        return bit
+
+    def catalog(self):
+        """Map and bonus start zones (`viewUnfinishedMaps`) and maps with a tier (mapchooser type 4), each as the
+        bitset of their ids and the rows in output order"""
+        if map_catalog.client is not None:
+            map_catalog.ensure_listening()
+
+        version = map_catalog.version
+        if self._catalog is not None and self._catalog_version == version:
+            return self._catalog
+
+        zones = selectQuery(surftimer.queries.sql_selectCompletionZones)
+        # Unknown tiers (`NULL`) first, like MySQL sorts them
+        zones.sort(
+            key=lambda row: (
+                row["tier"] is not None,
+                row["tier"] or 0,
+                row["mapname"],
+                row["zonegroup"],
+            )
+        )
+        maps = [
+            row
+            for row in selectQuery(surftimer.queries.sql_stray_selectMapcycle)
+            if row["tier"] is not None and row["tier"] > 0
+        ]
+        maps.sort(key=lambda row: (row["tier"], row["mapname"]))
+
+        catalog = {}
+        for name, rows, output in (
+            ("zones", zones, lambda row: row),
+            ("maps", maps, lambda row: {"mapname": row["mapname"]}),
+        ):
+            ids = [self._id(row["mapname"], row.get("zonegroup", 0)) for row in rows]
+            catalog[name] = (
+                sum(1 << bit for bit in set(ids)),
+                {bit: output(row) for bit, row in zip(ids, rows)},
+                ids,
+            )
+
+        self._catalog = catalog
+        self._catalog_version = version
+        return catalog
+
+    def completed(self, steamid32: str, style: int):
+        """Bitset of the maps and bonuses the player finished in `style`"""
+        if self._sync():
+            self.ensure_listening()
+
+        key = (steamid32, style)
+        with self._lock:
+            entry = self._players.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._players.move_to_end(key)
+                return entry[1]
+
+        bitset = 0
+        for row in selectPrepared(
+            surftimer.queries.sql_selectPlayerCompletions,
+            steamid=steamid32,
+            style=style,
+        ):
+            bitset |= 1 << self._id(row["mapname"], row["zonegroup"])
+
+        with self._lock:
+            self._players[key] = (time.monotonic() + self.ttl, bitset)
+            self._players.move_to_end(key)
+            while len(self._players) > MAX_PLAYERS:
+                self._players.popitem(last=False)
+
+        return bitset
+
+    def _unfinished(self, name: str, steamid32: str, style: int):
+        mask, rows, order = self.catalog()[name]
+        unfinished = mask & ~self.completed(steamid32, style)
+        if not unfinished:
+            return []
+
+        # Few unfinished entries are sorted directly, otherwise the catalog order is filtered
+        if unfinished.bit_count() * 8 < len(order):
+            positions = {bit: index for index, bit in enumerate(order)}
+            return [
+                rows[bit]
+                for bit in sorted(_bits(unfinished), key=positions.__getitem__)
+            ]
+        return [rows[bit] for bit in order if unfinished >> bit & 1]
+
+    def unfinished_zones(self, steamid32: str, style: int):
+        """`sql_stray_viewUnfinishedMaps`: `mapname`, `zonegroup`, `zonename` and `tier` of every map and bonus the
+        player did not finish in `style`, ordered by tier, map and zonegroup"""
+        return self._unfinished("zones", steamid32, style)
+
+    def unfinished_maps(self, steamid32: str, style: int):
+        """`sql_SelectIncompleteMapList`: `mapname` of every map with a tier the player did not finish in `style`,
+        ordered by tier and map"""
+        return self._unfinished("maps", steamid32, style)
+
+    def _apply(self, payload: dict):
+        with self._lock:
+            if payload["op"] == "finish":
+                entry = self._players.get((payload["steamid"], payload["style"]))
+                if entry is not None:
+                    bit = self._ids.setdefault(
+                        (payload["mapname"], payload["zonegroup"]), len(self._ids)
+                    )
+                    self._players[(payload["steamid"], payload["style"])] = (
+                        entry[0],
+                        entry[1] | 1 << bit,
+                    )
+            elif payload["steamid"] is None:
+                self._players.clear()
+            else:
+                for key in [
+                    key for key in self._players if key[0] == payload["steamid"]
+                ]:
+                    del self._players[key]
+
+    def _publish(self, payload: dict):
+        self._apply(payload)
+        if self._sync():
+            self.send(payload)
+
+    def finish(self, steamid32: str, style: int, mapname: str, zonegroup: int):
+        """Marks the map (`zonegroup` 0) or bonus as finished by the player"""
+        self._publish(
+            {
+                "op": "finish",
+                "steamid": steamid32,
+                "style": style,
+                "mapname": mapname,
+                "zonegroup": zonegroup,
+            }
+        )
+
+    def drop(self, steamid32: str = None):
+        """Reads the completions of the player (every player by default) again on next use"""
+        self._publish({"op": "drop", "steamid": steamid32})
+
+    def handle(self, payload: dict):
+        self._apply(payload)
+
+    def disconnected(self):
+        # Changes may have been missed while disconnected
+        self._apply({"op": "drop", "steamid": None})
+
+
+completion_index = CompletionIndex(
+    redis_client if config["REDIS"]["ENABLED"] == 1 else None,
+    channel=config["REDIS"].get("COMPLETION_CHANNEL", "surftimer:completions"),
+    ttl=config["REDIS"]["EXPIRY"],
+)
+
+
+async def unfinished_zones(steamid32: str, style: int):
+    """`CompletionIndex.unfinished_zones` without blocking the event loop"""
+    return await runAsync(completion_index.unfinished_zones, steamid32, style)
+
+
+async def unfinished_maps(steamid32: str, style: int):
+    """`CompletionIndex.unfinished_maps` without blocking the event loop"""
+    return await runAsync(completion_index.unfinished_maps, steamid32, style)
@@ -0,0 +1,478 @@
+"""In-memory bonus leaderboards keyed by `(mapname, zonegroup, style)`\n
+Each bonus is loaded from `ck_bonus` on first use, then kept current by the `ck_bonus` write endpoints which apply
+their change locally and send it to the other workers through Redis pub/sub (`REDIS.LEADERBOARD_CHANNEL`). Those only
+write the normal style, the plugin writes the other styles directly, so every leaderboard is read again after
+`REDIS.EXPIRY` seconds.
+Rank for a time, rank of a player and player at a rank are answered with binary searches instead of counting rows in
+MySQL.\n
+With `REDIS.LEADERBOARD_BACKEND` set to `"redis"` the leaderboards are Redis sorted sets shared by every worker
+instead (`RedisLeaderboards`), answered with `ZCOUNT`/`ZRANGE`"""
+
+import bisect, threading, time, redis
+import simplejson as json
+from decimal import Decimal, ROUND_HALF_UP
+from cache import PubSubChannel
+from sql import selectPrepared, runAsync
+from globals import config, redis_client
+import surftimer.queries
+
+# Sorts after every steamid, so `(runtime, LAST)` is past all the players with `runtime`
+LAST = "\U0010ffff"
+# `ck_bonus.runtime` is a `decimal(12,6)`, MySQL rounds what is written to it
+RUNTIME_EXPONENT = Decimal("0.000001")
+
+
+def _runtime(runtime):
+    """`runtime` rounded like MySQL stores it, as a string"""
+    return str(Decimal(runtime).quantize(RUNTIME_EXPONENT, ROUND_HALF_UP))
+
+
+class Leaderboard:
+    """Times of a single bonus and style sorted fastest first\n
+    Lookups are binary searches over the sorted `(runtime, steamid)` list, an update only moves
+    one entry"""
+
+    def __init__(self, rows: list[dict]):
+        self._players = {row["steamid"]: (row["runtime"], row["name"]) for row in rows}
+        self._keys = sorted(
+            (runtime, steamid) for steamid, (runtime, name) in self._players.items()
+        )
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._keys)
+
+    def _entry(self, key):
+        runtime, name = self._players[key[1]]
+        return {"steamid": key[1], "name": name, "runtime": runtime}
+
+    def update(self, steamid32: str, runtime: Decimal, name: str = None):
+        """Adds the player or moves them to their new `runtime`, `name` is kept when `None`"""
+        with self._lock:
+            current = self._players.get(steamid32)
+            if current is not None:
+                if name is None:
+                    name = current[1]
+                del self._keys[bisect.bisect_left(self._keys, (current[0], steamid32))]
+
+            bisect.insort(self._keys, (runtime, steamid32))
+            self._players[steamid32] = (runtime, name)
+
+    def remove(self, steamid32: str):
+        with self._lock:
+            current = self._players.pop(steamid32, None)
+            if current is not None:
+                del self._keys[bisect.bisect_left(self._keys, (current[0], steamid32))]
+
+    def runtime(self, steamid32: str):
+        current = self._players.get(steamid32)
+        return None if current is None else current[0]
+
+    def rank_for_time(self, runtime: Decimal):
+        """Rank a run of `runtime` would get, one more than the number of faster times"""
+        with self._lock:
+            return bisect.bisect_left(self._keys, (runtime, "")) + 1
+
+    def rank(self, steamid32: str):
+        """Number of times at least as fast as the player's (ties share the lowest rank), `None` if the player has
+        no time"""
+        with self._lock:
+            current = self._players.get(steamid32)
+            if current is None:
+                return None
+
+            return bisect.bisect_right(self._keys, (current[0], LAST))
+
+    def at(self, offset: int, above: Decimal = None):
+        """Player at `offset` (0 is the fastest) among the times slower than `above` (all of them by default),
+        `None` past the last player"""
+        with self._lock:
+            start = (
+                0 if above is None else bisect.bisect_right(self._keys, (above, LAST))
+            )
+            if offset < 0 or start + offset >= len(self._keys):
+                return None
+            return self._entry(self._keys[start + offset])
+
+    def top(self, limit: int):
+        with self._lock:
+            return [self._entry(key) for key in self._keys[:limit]]
+
+
+class Leaderboards(PubSubChannel):
+    """`Leaderboard` of every bonus, loaded lazily and kept in sync between workers\n
+    Without Redis changes are only applied in the worker that made them"""
+
+    def __init__(self, client, channel: str, ttl: float):
+        super().__init__(client, channel)
+        self.ttl = ttl
+
+        self._boards = {}  # (mapname, zonegroup, style) -> (expires, leaderboard)
+        self._generation = 0
+        self._load_lock = threading.Lock()
+
+    def _sync(self):
+        return self.client is not None
+
+    def _current(self, key: tuple):
+        """The loaded leaderboard of `key`, `None` if it is missing or expired"""
+        entry = self._boards.get(key)
+        if entry is not None and entry[0] > time.monotonic():
+            return entry[1]
+        return None
+
+    def load(self, mapname: str, zonegroup: int, style: int):
+        """Returns the leaderboard of the bonus, reading its times from the database the first time and once
+        expired"""
+        if self._sync():
+            self.ensure_listening()
+
+        key = (mapname, zonegroup, style)
+        board = self._current(key)
+        if board is not None:
+            return board
+
+        with self._load_lock:
+            board = self._current(key)
+            while board is None:
+                # Reload if a change came in while reading, it may be missing from the rows
+                generation = self._generation
+                rows = selectPrepared(
+                    surftimer.queries.sql_selectBonusLeaderboard,
+                    mapname=mapname,
+                    zonegroup=zonegroup,
+                    style=style,
+                )
+                if generation == self._generation:
+                    board = Leaderboard(rows)
+                    self._boards[key] = (time.monotonic() + self.ttl, board)
+
+        return board
+
+    async def get(self, mapname: str, zonegroup: int, style: int):
+        """`load` without blocking the event loop when the bonus still has to be read"""
+        board = self._current((mapname, zonegroup, style))
+        if board is not None:
+            if self._sync():
+                self.ensure_listening()
+            return board
+
+        return await runAsync(self.load, mapname, zonegroup, style)
+
+    def _apply(self, payload: dict):
+        op = payload["op"]
+        self._generation += 1
+
+        for key, (expires, board) in list(self._boards.items()):
+            if payload.get("mapname") is not None and key[0] != payload["mapname"]:
+                continue
+            if payload.get("zonegroup") is not None and key[1] != payload["zonegroup"]:
+                continue
+            if payload.get("style") is not None and key[2] != payload["style"]:
+                continue
+
+            if op == "reset":
+                del self._boards[key]
+            elif op == "update":
+                for steamid32, runtime, name in payload["players"]:
+                    board.update(steamid32, Decimal(runtime), name)
+            elif op == "remove":
+                board.remove(payload["steamid"])
+
+    def _publish(self, payload: dict):
+        self._apply(payload)
+        if self._sync():
+            self.send(payload)
+
+    def update(self, mapname: str, zonegroup: int, style: int, players: list[tuple]):
+        """Moves `(steamid32, runtime, name)` players of the bonus to their new time, `name` is kept when `None`"""
+        if players:
+            self._publish(
+                {
+                    "op": "update",
+                    "mapname": mapname,
+                    "zonegroup": zonegroup,
+                    "style": style,
+                    # Sent as strings so the other workers keep exact `Decimal` runtimes
+                    "players": [
+                        (steamid32, _runtime(runtime), name)
+                        for steamid32, runtime, name in players
+                    ],
+                }
+            )
+
+    def remove(self, steamid32: str):
+        """Removes the player from every bonus"""
+        self._publish({"op": "remove", "steamid": steamid32})
+
+    def reset(self, mapname: str = None, zonegroup: int = None):
+        """Drops the leaderboards of `mapname` (every map by default) or only its `zonegroup`, they are read again
+        on next use"""
+        self._publish({"op": "reset", "mapname": mapname, "zonegroup": zonegroup})
+
+    def rebuild(self, mapname: str = None, zonegroup: int = None):
+        """Drops the leaderboards like `reset` and returns how many were loaded in this worker, every worker
+        reads them again on next use"""
+        rebuilt = sum(
+            1
+            for key in list(self._boards)
+            if (mapname is None or key[0] == mapname)
+            and (zonegroup is None or key[1] == zonegroup)
+        )
+        self.reset(mapname, zonegroup)
+        return rebuilt
+
+    def handle(self, payload: dict):
+        self._apply(payload)
+
+    def disconnected(self):
+        # Changes may have been missed while disconnected
+        self._apply({"op": "reset"})
+
+
+class RedisLeaderboard:
+    """`Leaderboard` stored in Redis, a sorted set of steamids scored by runtime (ties are ordered by steamid like
+    the in-memory one) with the exact runtimes and the names kept in hashes next to it
+    """
+
+    def __init__(self, client: redis.Redis, key: str):
+        self.client = client
+        self.key = key
+        self._runtimes = f"{key}:runtimes"
+        self._names = f"{key}:names"
+
+    def __len__(self):
+        return self.client.zcard(self.key)
+
+    def _entries(self, steamids: list):
+        if not steamids:
+            return []
+
+        pipe = self.client.pipeline(transaction=False)
+        pipe.hmget(self._runtimes, steamids)
+        pipe.hmget(self._names, steamids)
+        runtimes, names = pipe.execute()
+        return [
+            {
+                "steamid": steamid.decode(),
+                "name": json.loads(name),
+                "runtime": Decimal(runtime.decode()),
+            }
+            for steamid, runtime, name in zip(steamids, runtimes, names)
+        ]
+
+    def runtime(self, steamid32: str):
+        runtime = self.client.hget(self._runtimes, steamid32)
+        return None if runtime is None else Decimal(runtime.decode())
+
+    def rank_for_time(self, runtime: Decimal):
+        """Rank a run of `runtime` would get, one more than the number of faster times"""
+        return self.client.zcount(self.key, "-inf", f"({float(runtime)!r}") + 1
+
+    def rank(self, steamid32: str):
+        """Number of times at least as fast as the player's (ties share the lowest rank), `None` if the player has
+        no time"""
+        score = self.client.zscore(self.key, steamid32)
+        if score is None:
+            return None
+
+        return self.client.zcount(self.key, "-inf", repr(score))
+
+    def at(self, offset: int, above: Decimal = None):
+        """Player at `offset` (0 is the fastest) among the times slower than `above` (all of them by default),
+        `None` past the last player"""
+        if offset < 0:
+            return None
+
+        low = "-inf" if above is None else f"({float(above)!r}"
+        entries = self._entries(
+            self.client.zrangebyscore(self.key, low, "+inf", start=offset, num=1)
+        )
+        return entries[0] if entries else None
+
+    def top(self, limit: int):
+        if limit <= 0:
+            return []
+        return self._entries(self.client.zrange(self.key, 0, limit - 1))
+
+
+class RedisLeaderboards:
+    """`Leaderboards` backed by Redis sorted sets, each bonus is seeded from `ck_bonus` by the first worker using it
+    and then shared by all of them until it is seeded again `ttl` seconds later\n
+    Every change bumps a version key of the bonus, a seed is only written if the version did not move while reading
+    the times from the database"""
+
+    # Applies `(steamid, score, runtime, has_name, name)` groups to a seeded leaderboard
+    _update_script = """
+    redis.call('INCR', KEYS[5])
+    if redis.call('EXISTS', KEYS[4]) == 0 then
+        return 0
+    end
+    for i = 1, #ARGV, 5 do
+        redis.call('ZADD', KEYS[1], ARGV[i + 1], ARGV[i])
+        redis.call('HSET', KEYS[2], ARGV[i], ARGV[i + 2])
+        if ARGV[i + 3] == '1' or redis.call('HEXISTS', KEYS[3], ARGV[i]) == 0 then
+            redis.call('HSET', KEYS[3], ARGV[i], ARGV[i + 4])
+        end
+    end
+    return 1
+    """
+    # Removes a player from every seeded leaderboard
+    _remove_script = """
+    redis.call('INCR', KEYS[2])
+    for _, key in ipairs(redis.call('HKEYS', KEYS[1])) do
+        redis.call('ZREM', key, ARGV[1])
+        redis.call('HDEL', key .. ':runtimes', ARGV[1])
+        redis.call('HDEL', key .. ':names', ARGV[1])
+        redis.call('INCR', key .. ':version')
+    end
+    """
+
+    def __init__(self, client: redis.Redis, prefix: str, ttl: int):
+        self.client = client
+        self.prefix = prefix
+        self.ttl = ttl
+        self._registry = f"{prefix}:boards"
+        # Bumped by the changes of several leaderboards, which may be seeding at the same time
+        self._version = f"{prefix}:version"
+        self._update = client.register_script(self._update_script)
+        self._remove = client.register_script(self._remove_script)
+
+    def _key(self, mapname: str, zonegroup: int, style: int):
+        return f"{self.prefix}:{mapname}:{zonegroup}:{style}"
+
+    def _seed(self, mapname: str, zonegroup: int, style: int, force: bool = False):
+        """Writes the times of the bonus from the database to Redis, unless it is already seeded"""
+        key = self._key(mapname, zonegroup, style)
+        loaded, version = f"{key}:loaded", f"{key}:version"
+
+        with self.client.pipeline() as pipe:
+            while force or not self.client.exists(loaded):
+                try:
+                    pipe.watch(version, self._version)
+                    rows = selectPrepared(
+                        surftimer.queries.sql_selectBonusLeaderboard,
+                        mapname=mapname,
+                        zonegroup=zonegroup,
+                        style=style,
+                    )
+
+                    pipe.multi()
+                    pipe.delete(key, f"{key}:runtimes", f"{key}:names")
+                    if rows:
+                        pipe.zadd(
+                            key, {row["steamid"]: float(row["runtime"]) for row in rows}
+                        )
+                        pipe.hset(
+                            f"{key}:runtimes",
+                            mapping={
+                                row["steamid"]: _runtime(row["runtime"]) for row in rows
+                            },
+                        )
+                        pipe.hset(
+                            f"{key}:names",
+                            mapping={
+                                row["steamid"]: json.dumps(row["name"]) for row in rows
+                            },
+                        )
+                    # Once it expires the next `load` seeds the times of the plugin written styles again
+                    pipe.set(loaded, 1, ex=self.ttl)
+                    pipe.hset(
+                        self._registry, key, json.dumps([mapname, zonegroup, style])
+                    )
+                    # Raises `WatchError` if a change came in while reading, it may be missing from the rows
+                    pipe.execute()
+                    force = False
+                except redis.WatchError:
+                    pipe.reset()
+
+        return RedisLeaderboard(self.client, key)
+
+    def load(self, mapname: str, zonegroup: int, style: int):
+        """Returns the leaderboard of the bonus, seeding it from the database the first time"""
+        return self._seed(mapname, zonegroup, style)
+
+    async def get(self, mapname: str, zonegroup: int, style: int):
+        """`load` without blocking the event loop"""
+        return await runAsync(self.load, mapname, zonegroup, style)
+
+    def update(self, mapname: str, zonegroup: int, style: int, players: list[tuple]):
+        """Moves `(steamid32, runtime, name)` players of the bonus to their new time, `name` is kept when `None`"""
+        if not players:
+            return
+
+        key = self._key(mapname, zonegroup, style)
+        args = []
+        for steamid32, runtime, name in players:
+            runtime = _runtime(runtime)
+            args += [
+                steamid32,
+                repr(float(runtime)),
+                runtime,
+                0 if name is None else 1,
+                json.dumps(name),
+            ]
+        self._update(
+            keys=[
+                key,
+                f"{key}:runtimes",
+                f"{key}:names",
+                f"{key}:loaded",
+                f"{key}:version",
+            ],
+            args=args,
+        )
+
+    def remove(self, steamid32: str):
+        """Removes the player from every bonus"""
+        self._remove(keys=[self._registry, self._version], args=[steamid32])
+
+    def _matching(self, mapname: str = None, zonegroup: int = None):
+        boards = {}
+        for key, board in self.client.hgetall(self._registry).items():
+            board = json.loads(board)
+            if mapname is not None and board[0] != mapname:
+                continue
+            if zonegroup is not None and board[1] != zonegroup:
+                continue
+            boards[key.decode()] = board
+        return boards
+
+    def reset(self, mapname: str = None, zonegroup: int = None):
+        """Drops the leaderboards of `mapname` (every map by default) or only its `zonegroup`, they are seeded again
+        on next use"""
+        boards = self._matching(mapname, zonegroup)
+
+        pipe = self.client.pipeline()
+        pipe.incr(self._version)
+        for key in boards:
+            pipe.delete(key, f"{key}:runtimes", f"{key}:names", f"{key}:loaded")
+            pipe.incr(f"{key}:version")
+        if boards:
+            pipe.hdel(self._registry, *boards)
+        pipe.execute()
+
+    def rebuild(self, mapname: str = None, zonegroup: int = None):
+        """Seeds the leaderboards of `mapname` (every map by default) or only its `zonegroup` from the database
+        again, returns how many were rebuilt"""
+        boards = self._matching(mapname, zonegroup)
+        for board in boards.values():
+            self._seed(*board, force=True)
+        return len(boards)
+
+
+if (
+    config["REDIS"]["ENABLED"] == 1
+    and config["REDIS"].get("LEADERBOARD_BACKEND", "memory") == "redis"
+):
+    leaderboards = RedisLeaderboards(
+        redis_client,
+        prefix=config["REDIS"].get("LEADERBOARD_PREFIX", "surftimer:leaderboard"),
+        ttl=config["REDIS"]["EXPIRY"],
+    )
+else:
+    leaderboards = Leaderboards(
+        redis_client if config["REDIS"]["ENABLED"] == 1 else None,
+        channel=config["REDIS"].get("LEADERBOARD_CHANNEL", "surftimer:leaderboards"),
+        ttl=config["REDIS"]["EXPIRY"],
+    )
@@ -0,0 +1,138 @@
+"""In-memory catalog of every zoned map with its tier, stage count and bonus count for `st-mapchooser`\n
+The whole catalog is read once, maps changed by the `ck_zones`/`ck_maptier` write endpoints are read again on next
+use (in every worker through Redis pub/sub, `REDIS.CATALOG_CHANNEL`). Tier filters are applied in-process and each
+filtered list is encoded once until the catalog changes"""
+
+import threading
+from cache import PubSubChannel
+from sql import selectQuery, runAsync
+from globals import config, redis_client, encode_response
+import surftimer.queries
+
+
+class MapCatalog(PubSubChannel):
+    """Rows of `sql_selectMapCatalog` keyed by `mapname`, loaded lazily and kept in sync between workers\n
+    Without Redis changes are only applied in the worker that made them"""
+
+    def __init__(self, client, channel: str):
+        super().__init__(client, channel)
+        self._maps = None
+        self._stale = set()
+        self._resets = 0
+        self._encoded = {}
+        # Changes whenever a map is reset, for indexes built on top of the catalog
+        self.version = 0
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+
+    def _sync(self):
+        return self.client is not None
+
+    def _select(self, mapnames: list = None):
+        if mapnames is None:
+            return selectQuery(surftimer.queries.sql_selectMapCatalog.format(""))
+
+        placeholders = ", ".join(["%s"] * len(mapnames))
+        return selectQuery(
+            surftimer.queries.sql_selectMapCatalog.format(
+                f"WHERE z.mapname IN ({placeholders})"
+            ),
+            mapnames,
+        )
+
+    def load(self):
+        """Reads the catalog the first time and the stale maps after a change, returns `{mapname: row}`"""
+        if self._sync():
+            self.ensure_listening()
+
+        with self._load_lock:
+            while self._maps is None or self._stale:
+                with self._lock:
+                    resets = self._resets
+                    stale = None if self._maps is None else sorted(self._stale)
+                    self._stale.clear()
+
+                rows = {row["mapname"]: row for row in self._select(stale)}
+
+                with self._lock:
+                    # Read everything again if the whole catalog was reset while reading
+                    if resets != self._resets:
+                        continue
+                    if stale is not None:
+                        rows = {
+                            **{
+                                mapname: row
+                                for mapname, row in self._maps.items()
+                                if mapname not in stale
+                            },
+                            **rows,
+                        }
+                    self._maps = dict(sorted(rows.items()))
+                    self._encoded = {}
+
+            return self._maps
+
+    async def get(self):
+        """`load` without blocking the event loop when maps still have to be read"""
+        if self._maps is not None and not self._stale:
+            if self._sync():
+                self.ensure_listening()
+            return self._maps
+
+        return await runAsync(self.load)
+
+    async def encoded(self, tier_min: int = None, tier_max: int = None):
+        """JSON of the maps with a tier between `tier_min` and `tier_max` (all of them by default), ordered by
+        `mapname`"""
+        maps = await self.get()
+        key = (tier_min, tier_max)
+        encoded = self._encoded.get(key)
+        if encoded is None:
+            encoded = encode_response(
+                [
+                    row
+                    for row in maps.values()
+                    if (tier_min is None and tier_max is None)
+                    or (
+                        row["maptier"] is not None
+                        and (tier_min is None or row["maptier"] >= tier_min)
+                        and (tier_max is None or row["maptier"] <= tier_max)
+                    )
+                ]
+            )
+            # Only keep it if the catalog was not reloaded in the meantime
+            if maps is self._maps:
+                self._encoded[key] = encoded
+
+        return encoded
+
+    def _apply(self, payload: dict):
+        with self._lock:
+            if payload["mapname"] is None:
+                self._resets += 1
+                self._maps = None
+                self._stale.clear()
+            else:
+                self._stale.add(payload["mapname"])
+            self._encoded = {}
+            self.version += 1
+
+    def reset(self, mapname: str = None):
+        """Reads `mapname` (the whole catalog by default) again on next use"""
+        payload = {"mapname": mapname}
+        self._apply(payload)
+        if self._sync():
+            self.send(payload)
+
+    def handle(self, payload: dict):
+        self._apply(payload)
+
+    def disconnected(self):
+        # Changes may have been missed while disconnected
+        self._apply({"mapname": None})
+
+
+map_catalog = MapCatalog(
+    redis_client if config["REDIS"]["ENABLED"] == 1 else None,
+    channel=config["REDIS"].get("CATALOG_CHANNEL", "surftimer:catalog"),
+)
@@ -1,49 +1,45 @@
 from fastapi import APIRouter, Request, Response, status
+from pydantic import BaseModel
 from sql import selectQuery
-from globals import get_cache, set_cache
-import time, json
-import surftimer.queries
+from globals import cached, config, all_styles
+import time
+import surftimer.queries, surftimer.ranking, surftimer.recalculation
 
 router = APIRouter()
 
 
+class PointsChange(BaseModel):
+    """Body for a new or improved time, `zonegroup` for bonuses and `stage` for stages"""
+
+    mapname: str
+    style: int
+    zonegroup: int = None
+    stage: int = None
+    steamid32: str = None
+
+
 @router.get(
     "/surftimer/point_calc_finishedStages",
     name="Count Player Finished Stages",
     tags=["strays", "Points Calculation"],
 )
+@cached(
+    "point_calc_finishedStages:{steamid32}-{style}",
+    tags=["player:{steamid32}"],
+    expiry=config["REDIS"]["EXPIRY"],
+)
 def point_calc_finishedStages(
     request: Request,
     response: Response,
     steamid32: str,
     style: int,
 ):
-    """```char sql_stray_point_calc_finishedStages[] = ....```\n"""
-    tic = time.perf_counter()
-
-    # Check if data is cached in Redis
-    cache_key = f"point_calc_finishedStages:{steamid32}-{style}"
-    cached_data = get_cache(cache_key)
-    if cached_data is not None:
-        print(f"[Redis] Loaded '{cache_key}' ({time.perf_counter() - tic:0.4f}s)")
-        response.headers["content-type"] = "application/json"
-        response.status_code = status.HTTP_200_OK
-        response.body = json.loads(cached_data, use_decimal=True, parse_nan=True)
-        return response
-
-    xquery = selectQuery(
-        surftimer.queries.sql_stray_point_calc_finishedStages.format(steamid32, style)
-    )
+    """```char sql_stray_point_calc_finishedStages[] = ....```\n
+    Ranked with window functions in `surftimer.ranking`"""
+    xquery = surftimer.ranking.select_finished_stages(steamid32, style)
 
     if len(xquery) <= 0:
-        response.status_code = status.HTTP_204_NO_CONTENT
-        return response
-
-    toc = time.perf_counter()
-    print(f"Execution time {toc - tic:0.4f}")
-
-    # Cache the data in Redis
-    set_cache(cache_key, xquery)
+        return None
 
     return xquery
 
@@ -53,40 +49,23 @@ def point_calc_finishedStages(
     name="Count Player Finished Maps",
     tags=["strays", "Points Calculation"],
 )
+@cached(
+    "point_calc_finishedMaps:{steamid32}-{style}",
+    tags=["player:{steamid32}", "table:ck_maptier"],
+    expiry=config["REDIS"]["EXPIRY"],
+)
 def point_calc_finishedMaps(
     request: Request,
     response: Response,
     steamid32: str,
     style: int,
 ):
-    """```char sql_stray_point_calc_finishedMaps[] = ....```\n"""
-    tic = time.perf_counter()
-
-    # Check if data is cached in Redis
-    cache_key = f"point_calc_finishedStages:{steamid32}-{style}"
-    cached_data = get_cache(cache_key)
-    if cached_data is not None:
-        print(f"[Redis] Loaded '{cache_key}' ({time.perf_counter() - tic:0.4f}s)")
-        response.headers["content-type"] = "application/json"
-        response.status_code = status.HTTP_200_OK
-        response.body = json.loads(cached_data, use_decimal=True, parse_nan=True)
-        return response
-
-    xquery = selectQuery(
-        surftimer.queries.sql_stray_point_calc_finishedMaps.format(
-            style, style, steamid32, style
-        )
-    )
+    """```char sql_stray_point_calc_finishedMaps[] = ....```\n
+    Ranked with window functions in `surftimer.ranking`"""
+    xquery = surftimer.ranking.select_finished_maps(steamid32, style)
 
     if len(xquery) <= 0:
-        response.status_code = status.HTTP_204_NO_CONTENT
-        return response
-
-    toc = time.perf_counter()
-    print(f"Execution time {toc - tic:0.4f}")
-
-    # Cache the data in Redis
-    set_cache(cache_key, xquery)
+        return None
 
     return xquery
 
@@ -115,34 +94,45 @@ def recalculatePoints(
     else:
         player_name_query = player_name_query.pop()
 
-    ## Bonuses
-    finished_bonuses_query = selectQuery(
-        surftimer.queries.sql_stray_point_calc_countFinishedBonus.format(
-            style, style, steamid32, style
-        )
-    )
-
-    ## Stages
-    finished_stages_query = selectQuery(
-        surftimer.queries.sql_stray_point_calc_finishedStages.format(steamid32, style)
-    )
-
-    ## Maps
-    finished_maps_query = selectQuery(
-        surftimer.queries.sql_stray_point_calc_finishedMaps.format(
-            style, style, steamid32, style
-        )
-    )
-
-    # Create the JSON output
+    # Maps, stages and bonuses with their ranks
     output = {
         **player_name_query,  # Replace with your desired name
-        "maps": finished_maps_query,
-        "stages": finished_stages_query,
-        "bonuses": finished_bonuses_query,
+        **surftimer.ranking.player_point_calc_data(steamid32, style),
     }
 
     toc = time.perf_counter()
     print(f"Execution time {toc - tic:0.4f}")
 
     return output
+
+
+@router.post(
+    "/surftimer/recalculateChange",
+    name="Incremental Points Recalculation",
+    tags=["Refactored", "Points Calculation"],
+)
+def recalculateChange(
+    request: Request,
+    response: Response,
+    data: PointsChange,
+):
+    """Recalculates only the players whose points may have changed after a map, bonus or stage time was added or improved\n
+    Changed rows are written in one batch, returns their `points` difference"""
+    tic = time.perf_counter()
+
+    if not 0 <= data.style < len(all_styles):
+        response.status_code = status.HTTP_422_UNPROCESSABLE_ENTITY
+        return {"message": "Invalid style"}
+
+    xquery = surftimer.recalculation.recalculate_change(
+        data.mapname,
+        data.style,
+        zonegroup=data.zonegroup,
+        stage=data.stage,
+        steamid32=data.steamid32,
+    )
+
+    toc = time.perf_counter()
+    print(f"Execution time {toc - tic:0.4f}")
+
+    return {**xquery, "xtime": toc - tic}
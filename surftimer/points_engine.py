@@ -0,0 +1,271 @@
+"""Vectorized KSF points calculation\n
+Computes the same points as the `calculate_points` loop, but from columnar arrays (`rank`, `total`, `tier`
+of every completion plus the index of the player it belongs to) so a whole recalculation can be done in a
+single batch instead of looping over every completion of every player in Python"""
+
+import numpy as np
+
+# Bonus points by rank (index), ranks above 20 get `BONUS_POINTS_OTHER`
+BONUS_POINTS = np.array(
+    [
+        0,
+        250,
+        235,
+        220,
+        205,
+        190,
+        175,
+        160,
+        145,
+        130,
+        100,
+        95,
+        90,
+        80,
+        70,
+        60,
+        50,
+        40,
+        30,
+        20,
+        10,
+    ]
+)
+BONUS_POINTS_OTHER = 5
+
+# Share of the map WR points by rank (index) for the Top 10, rank 1 gets the WR points as they are
+TOP10_MULTIPLIERS = np.array(
+    [0.0, 1.0, 0.80, 0.75, 0.70, 0.65, 0.60, 0.55, 0.50, 0.45, 0.40]
+)
+
+# Map completion points by tier (index), maps without a valid tier get `TIER_POINTS[0]`
+TIER_POINTS = np.array([13, 25, 50, 100, 200, 400, 600, 800, 1000])
+
+# `(multiplier, divisor, minimum, bonus)` of the WR points formula by tier (index)
+# Tiers 1-2 add `bonus` before applying the `minimum`, tiers 3-8 only add it when above the `minimum`
+WR_FORMULA = {
+    1: (1.75, 6, 250.0, 58.5),
+    2: (2.8, 5, 500.0, 82.15),
+    3: (3.5, 4, 750.0, 117),
+    4: (5.74, 4, 1000.0, 164.25),
+    5: (7, 4, 1250.0, 234),
+    6: (14, 4, 1500.0, 328),
+    7: (21, 4, 1750.0, 420),
+    8: (30, 4, 2000.0, 560),
+}
+WR_POINTS_NO_TIER = 25.0
+
+# ----------  KSF Points System  ----------#
+GROUP_PERCENTAGES = (0.03125, 0.0625, 0.125, 0.25, 0.5)
+GROUP_1_BOTTOM = 11
+GROUP_MIN_SIZE = 4
+
+
+def _int_array(values):
+    return np.asarray(
+        [-1 if value is None else int(value) for value in values], dtype=np.int64
+    )
+
+
+def _float_array(values):
+    return np.asarray([float(value) for value in values], dtype=np.float64)
+
+
+def _last_index(player, mask, players: int):
+    """Index of the last row matching `mask` for every player, `-1` if there is none"""
+    last = np.full(players, -1, dtype=np.int64)
+    rows = np.nonzero(mask)[0]
+    np.maximum.at(last, player[rows], rows)
+    return last
+
+
+def _last_values(values, last):
+    """`values[last]` for every player with a last row, `0.0` for the others"""
+    output = np.zeros(last.shape[0])
+    found = last >= 0
+    output[found] = values[last[found]]
+    return output
+
+
+def _sum(player, values, players: int):
+    return np.bincount(player, weights=values, minlength=players)
+
+
+def _count(player, mask, players: int):
+    return np.bincount(player[mask], minlength=players)
+
+
+def wr_points(total, tier):
+    """WR points of each map before rounding up, `total` is the number of completions of the map"""
+    total = np.asarray(total, dtype=np.float64)
+    points = np.full(total.shape, WR_POINTS_NO_TIER)
+
+    for map_tier, (multiplier, divisor, minimum, bonus) in WR_FORMULA.items():
+        rows = tier == map_tier
+        base = (total[rows] * multiplier) / divisor
+        if map_tier <= 2:
+            base = base + bonus
+            points[rows] = np.where(base < minimum, minimum, base)
+        else:
+            points[rows] = np.where(base < minimum, minimum, base + bonus)
+
+    return points
+
+
+def group_tops(total):
+    """Last rank of each of the 5 groups for every map, shape `(5, maps)`"""
+    total = np.asarray(total, dtype=np.float64)
+    tops = np.empty((len(GROUP_PERCENTAGES), total.shape[0]), dtype=np.int64)
+
+    bottom = np.full(total.shape, GROUP_1_BOTTOM, dtype=np.int64)
+    for group, percentage in enumerate(GROUP_PERCENTAGES):
+        top = np.ceil(total * percentage + 11.0).astype(np.int64)
+        top = np.where(top - bottom < GROUP_MIN_SIZE, bottom + GROUP_MIN_SIZE, top)
+        tops[group] = top
+        bottom = top + 1
+
+    return tops
+
+
+def calculate_points_batch(
+    players: int,
+    maps_player,
+    maps_rank,
+    maps_total,
+    maps_tier,
+    bonuses_player,
+    bonuses_rank,
+    stages_player,
+    stages_rank,
+    points_for_wrcp: int,
+):
+    """Points of `players` players at once from the columns of all their completions\n
+    `*_player` is the index (`0` to `players - 1`) of the player each completion belongs to, rows of the same
+    player have to keep the order of the queries as `wr_points` and `g*points` come from the last row.\n
+    Returns a `dict` of arrays indexed by player with the keys of `calculate_points` plus the sums of each
+    component (`map_wr_points`, `top10_points`, `group_points`, `map_points`, `bonus_points`, `top10s`, `groups`)
+    """
+    maps_player = np.asarray(maps_player, dtype=np.int64)
+    maps_rank = _int_array(maps_rank)
+    maps_total = _float_array(maps_total)
+    maps_tier = _int_array(maps_tier)
+    bonuses_player = np.asarray(bonuses_player, dtype=np.int64)
+    bonuses_rank = _int_array(bonuses_rank)
+    stages_player = np.asarray(stages_player, dtype=np.int64)
+    stages_rank = _int_array(stages_rank)
+
+    ## Stages
+    wrcps = _count(stages_player, stages_rank == 1, players)
+    wrcp_points = wrcps * points_for_wrcp
+
+    ## Bonuses
+    bonus_points = np.where(
+        bonuses_rank > 20,
+        BONUS_POINTS_OTHER,
+        BONUS_POINTS[np.clip(bonuses_rank, 0, 20)],
+    )
+    is_wrb = bonuses_rank == 1
+    wrb_points = _sum(bonuses_player[is_wrb], bonus_points[is_wrb], players)
+    other_bonus_points = _sum(bonuses_player[~is_wrb], bonus_points[~is_wrb], players)
+
+    ## Maps
+    map_wr_points = wr_points(maps_total, maps_tier)
+    iwrpoints = np.ceil(map_wr_points)
+
+    # Top 10
+    is_wr = maps_rank == 1
+    in_top10 = maps_rank < 11
+    top10_points = np.where(
+        is_wr,
+        iwrpoints,
+        np.ceil(TOP10_MULTIPLIERS[np.clip(maps_rank, 0, 10)] * iwrpoints),
+    )
+    top10_points = np.where(in_top10, top10_points, 0)
+
+    # Groups 1-5, boundaries depend on the number of completions of each map
+    tops = group_tops(maps_total)
+    in_group = (maps_rank > 10) & (maps_rank <= tops[4])
+    group = (maps_rank[None, :] > tops[:4]).sum(axis=0)
+    g_points = np.empty((len(GROUP_PERCENTAGES), maps_rank.shape[0]))
+    g_points[0] = iwrpoints * 0.25
+    for index in range(1, len(GROUP_PERCENTAGES)):
+        g_points[index] = g_points[index - 1] / 1.5
+    group_points = np.where(
+        in_group,
+        np.ceil(np.take_along_axis(g_points, group[None, :], axis=0)[0]),
+        0,
+    )
+
+    # Map completion
+    valid_tier = (maps_tier >= 1) & (maps_tier <= 8)
+    map_points = TIER_POINTS[np.where(valid_tier, maps_tier, 0)]
+
+    ## Totals
+    world_record_points = _sum(maps_player[is_wr], iwrpoints[is_wr], players)
+    top10_sum = _sum(maps_player, top10_points, players)
+    group_sum = _sum(maps_player, group_points, players)
+    map_sum = _sum(maps_player, map_points, players)
+    total = (
+        wrcp_points + wrb_points + other_bonus_points + top10_sum + group_sum + map_sum
+    )
+
+    # Values of the last map row and the last map row in a group, like the loop returns them
+    last_map = _last_index(maps_player, np.ones(maps_player.shape, dtype=bool), players)
+    last_group = _last_index(maps_player, in_group, players)
+
+    output = {
+        "total": total.astype(np.int64),
+        "finished_stages": np.bincount(stages_player, minlength=players),
+        "finished_maps": np.bincount(maps_player, minlength=players),
+        "finished_bonuses": np.bincount(bonuses_player, minlength=players),
+        "wrb_points": wrb_points.astype(np.int64),
+        # Map WRs are counted as well, same as in the loop
+        "wrbs": _count(bonuses_player, is_wrb, players)
+        + _count(maps_player, is_wr, players),
+        "wrcp_points": wrcp_points,
+        "wrcps": wrcps,
+        "wr_points": _last_values(map_wr_points, last_map),
+        "world_records": _count(maps_player, is_wr, players),
+    }
+    for index in range(len(GROUP_PERCENTAGES)):
+        output[f"g{index + 1}points"] = _last_values(g_points[index], last_group)
+
+    output.update(
+        {
+            "map_wr_points": world_record_points.astype(np.int64),
+            "top10_points": (top10_sum - world_record_points).astype(np.int64),
+            "group_points": group_sum.astype(np.int64),
+            "map_points": map_sum.astype(np.int64),
+            "bonus_points": other_bonus_points.astype(np.int64),
+            "top10s": _count(maps_player, in_top10, players),
+            "groups": _count(maps_player, in_group, players),
+        }
+    )
+    return output
+
+
+def calculate_player_points(player_data: dict[str, list], points_for_wrcp: int):
+    """Drop-in for `calculate_points` with the data of a single player (`maps`, `bonuses` and `stages` rows)\n
+    Returns plain Python numbers"""
+    maps = player_data["maps"]
+    bonuses = player_data["bonuses"]
+    stages = player_data["stages"]
+
+    batch = calculate_points_batch(
+        players=1,
+        maps_player=np.zeros(len(maps), dtype=np.int64),
+        maps_rank=[row["rank"] for row in maps],
+        maps_total=[row["total"] for row in maps],
+        maps_tier=[row["tier"] for row in maps],
+        bonuses_player=np.zeros(len(bonuses), dtype=np.int64),
+        bonuses_rank=[row["rank"] for row in bonuses],
+        stages_player=np.zeros(len(stages), dtype=np.int64),
+        stages_rank=[row["rank"] for row in stages],
+        points_for_wrcp=points_for_wrcp,
+    )
+
+    output = {key: values[0].item() for key, values in batch.items()}
+    if not maps:
+        # The loop leaves `wr_points` at its initial `0`
+        output["wr_points"] = 0
+    return output
@@ -1,4 +1,8 @@
-"""Containing all SurfTimer queries from `queries.sp`"""
+"""Containing all SurfTimer queries from `queries.sp`\n
+The hottest ones are declared as `PreparedQuery` with typed parameters, run them with `selectPrepared`/`insertPrepared`"""
+from sql import PreparedQuery
+from decimal import Decimal
+
 ## ck_announcements
 sql_createAnnouncements = "CREATE TABLE IF NOT EXISTS `ck_announcements` (`id` int(11) NOT NULL AUTO_INCREMENT, `server` varchar(256) NOT NULL DEFAULT 'Beginner', `name` varchar(64) NOT NULL, `mapname` varchar(128) NOT NULL, `mode` int(11) NOT NULL DEFAULT '0', `time` varchar(32) NOT NULL, `group` int(12) NOT NULL DEFAULT '0', PRIMARY KEY (`id`))DEFAULT CHARSET=utf8mb4;"
 
@@ -10,9 +14,31 @@ sql_createBonusIndex = (
 sql_insertBonus = "INSERT INTO ck_bonus (steamid, name, mapname, runtime, zonegroup, velStartXY, velStartXYZ, velStartZ) VALUES ('{}', '{}', '{}', '{}', '{}', '{}', '{}', '{}')"
 sql_updateBonus = "UPDATE ck_bonus SET runtime = '{}', name = '{}', velStartXY = {}, velStartXYZ = {}, velStartZ = {} WHERE steamid = '{}' AND mapname = '{}' AND zonegroup = {} AND style = 0"
 sql_selectBonusCount = "SELECT zonegroup, style, count(1) FROM ck_bonus WHERE mapname = '{}' GROUP BY zonegroup, style;" # merged with sql_selectBonusData
-sql_selectPersonalBonusRecords = "SELECT runtime, zonegroup, style, velStartXY, velStartXYZ, velStartZ FROM ck_bonus WHERE steamid = '{}' AND mapname = '{}' AND runtime > '0.0'"
+sql_selectPersonalBonusRecords = PreparedQuery(
+    "SELECT runtime, zonegroup, style, velStartXY, velStartXYZ, velStartZ FROM ck_bonus WHERE steamid = %(steamid)s AND mapname = %(mapname)s AND runtime > '0.0'",
+    steamid=str,
+    mapname=str,
+)
+sql_selectInitBonusRecords = "SELECT steamid AS init_steamid, runtime, zonegroup, style, velStartXY, velStartXYZ, velStartZ FROM ck_bonus WHERE mapname = %s AND runtime > '0.0' AND steamid IN ({});"
 sql_selectPlayerRankBonus = "SELECT name FROM ck_bonus WHERE runtime <= (SELECT runtime FROM ck_bonus WHERE steamid = '{}' AND mapname= '{}' AND runtime > 0.0 AND zonegroup = {} AND style = 0) AND mapname = '{}' AND zonegroup = {} AND style = 0;"
-sql_selectPlayerRankBonusCount = "SELECT COUNT(steamid) FROM ck_bonus WHERE runtime <= (SELECT runtime FROM ck_bonus WHERE steamid = '{}' AND mapname= '{}' AND runtime > 0.0 AND zonegroup = {} AND style = 0) AND mapname = '{}' AND zonegroup = {} AND style = 0;"
+sql_selectPlayerRankBonusCount = PreparedQuery(
+    "SELECT COUNT(steamid) FROM ck_bonus WHERE runtime <= (SELECT runtime FROM ck_bonus WHERE steamid = %(steamid)s AND mapname= %(mapname)s AND runtime > 0.0 AND zonegroup = %(zonegroup)s AND style = 0) AND mapname = %(mapname)s AND zonegroup = %(zonegroup)s AND style = 0;",
+    steamid=str,
+    mapname=str,
+    zonegroup=int,
+)
+sql_selectPlayerBonusRankCounts = PreparedQuery(
+    "SELECT p.zonegroup, COUNT(b.steamid) AS `rank` FROM ck_bonus p JOIN ck_bonus b ON b.mapname = p.mapname AND b.zonegroup = p.zonegroup AND b.style = 0 AND b.runtime <= p.runtime WHERE p.steamid = %(steamid)s AND p.mapname = %(mapname)s AND p.style = 0 AND p.runtime > 0.0 GROUP BY p.zonegroup;",
+    steamid=str,
+    mapname=str,
+)
+sql_selectInitBonusRankCounts = "SELECT p.steamid AS init_steamid, p.zonegroup, COUNT(b.steamid) AS `rank` FROM ck_bonus p JOIN ck_bonus b ON b.mapname = p.mapname AND b.zonegroup = p.zonegroup AND b.style = 0 AND b.runtime <= p.runtime WHERE p.mapname = %s AND p.style = 0 AND p.runtime > 0.0 AND p.steamid IN ({}) GROUP BY p.steamid, p.zonegroup;"
+sql_selectBonusLeaderboard = PreparedQuery(
+    "SELECT steamid, name, runtime FROM ck_bonus WHERE mapname = %(mapname)s AND zonegroup = %(zonegroup)s AND style = %(style)s;",
+    mapname=str,
+    zonegroup=int,
+    style=int,
+)
 sql_selectFastestBonus = "SELECT t1.name, t1.runtime, t1.zonegroup, t1.style, t1.velStartXY, t1.velStartXYZ, t1.velstartZ from ck_bonus t1 where t1.mapname = '{}' and t1.runtime = (select min(t2.runtime) from ck_bonus t2 where t2.mapname = t1.mapname and t2.zonegroup = t1.zonegroup and t2.style = t1.style);" # merged with sql_selectBonusData
 sql_deleteBonus = "DELETE FROM ck_bonus WHERE mapname = '{}'"
 sql_selectAllBonusTimesinMap = (
@@ -39,14 +65,39 @@ sql_selectBonusData = "SELECT t1.name, t1.runtime, t1.zonegroup, t1.style, t1.ve
 
 ## ck_checkpoints
 sql_createCheckpoints = "CREATE TABLE IF NOT EXISTS ck_checkpoints (steamid VARCHAR(32), mapname VARCHAR(32), cp INT(11) NOT NULL, time decimal(12,6) NOT NULL DEFAULT '-1.000000', zonegroup INT(12) NOT NULL DEFAULT 0, PRIMARY KEY(steamid, mapname, cp, zonegroup)) DEFAULT CHARSET=utf8mb4;"
-sql_InsertOrUpdateCheckpoints = "INSERT INTO ck_checkpoints (steamid, mapname, cp, time, stage_time, stage_attempts, zonegroup) VALUES ('{}', '{}', '{}', '{}', '{}', '{}', '{}') ON DUPLICATE KEY UPDATE time='{}', stage_time='{}', stage_attempts='{}';"
-sql_selectCheckpoints = "SELECT zonegroup, cp, time FROM ck_checkpoints WHERE mapname='{}' AND steamid = '{}';"
+sql_InsertOrUpdateCheckpoints = PreparedQuery(
+    "INSERT INTO ck_checkpoints (steamid, mapname, cp, time, stage_time, stage_attempts, zonegroup) VALUES (%(steamid)s, %(mapname)s, %(cp)s, %(time)s, %(stage_time)s, %(stage_attempts)s, %(zonegroup)s) ON DUPLICATE KEY UPDATE time=%(time)s, stage_time=%(stage_time)s, stage_attempts=%(stage_attempts)s;",
+    steamid=str,
+    mapname=str,
+    cp=int,
+    time=Decimal,
+    stage_time=Decimal,
+    stage_attempts=int,
+    zonegroup=int,
+)
+# Bulk upsert of a whole run, `{}` is replaced by one `(%s, %s, %s, %s, %s, %s, %s)` group per row
+sql_selectRunCheckpointsForUpdate = "SELECT cp, time, stage_time, stage_attempts FROM ck_checkpoints WHERE steamid = %s AND mapname = %s AND zonegroup = %s FOR UPDATE;"
+sql_InsertOrUpdateCheckpointsBulk = "INSERT INTO ck_checkpoints (steamid, mapname, cp, time, stage_time, stage_attempts, zonegroup) VALUES {} ON DUPLICATE KEY UPDATE time=VALUES(time), stage_time=VALUES(stage_time), stage_attempts=VALUES(stage_attempts);"
+sql_selectCheckpoints = PreparedQuery(
+    "SELECT zonegroup, cp, time FROM ck_checkpoints WHERE mapname=%(mapname)s AND steamid = %(steamid)s;",
+    mapname=str,
+    steamid=str,
+)
 sql_selectCheckpointsinZoneGroup = "SELECT cp, time FROM ck_checkpoints WHERE mapname='{}' AND steamid = '{}' AND zonegroup = {};"
 sql_selectRecordCheckpoints = "SELECT zonegroup, cp, `time` FROM ck_checkpoints WHERE steamid = '{}' AND mapname='{}' UNION SELECT a.zonegroup, b.cp, b.time FROM ck_bonus a LEFT JOIN ck_checkpoints b ON a.steamid = b.steamid AND a.zonegroup = b.zonegroup WHERE a.mapname = '{}' GROUP BY a.zonegroup;"
 sql_deleteCheckpoints = "DELETE FROM ck_checkpoints WHERE mapname = '{}'"
-sql_selectStageTimes = "SELECT cp, stage_time, stage_attempts, zonegroup FROM ck_checkpoints WHERE mapname = '{}' AND steamid = '{}' AND zonegroup = 0;"
+sql_selectStageTimes = PreparedQuery(
+    "SELECT cp, stage_time, stage_attempts, zonegroup FROM ck_checkpoints WHERE mapname = %(mapname)s AND steamid = %(steamid)s AND zonegroup = 0;",
+    mapname=str,
+    steamid=str,
+)
 sql_selectStageAttempts = "SELECT cp, stage_attempts FROM ck_checkpoints WHERE mapname = '{}' AND steamid = '{}';"  # merged with sql_selectStageTimes
-sql_selectCheckpointsData = "SELECT cp, time, stage_time, stage_attempts, zonegroup FROM ck_checkpoints WHERE mapname = '{}' AND steamid = '{}';"
+sql_selectCheckpointsData = PreparedQuery(
+    "SELECT cp, time, stage_time, stage_attempts, zonegroup FROM ck_checkpoints WHERE mapname = %(mapname)s AND steamid = %(steamid)s;",
+    mapname=str,
+    steamid=str,
+)
+sql_selectInitCheckpointsData = "SELECT steamid AS init_steamid, cp, time, stage_time, stage_attempts, zonegroup FROM ck_checkpoints WHERE mapname = %s AND steamid IN ({});"
 
 
 ## ck_latestrecords
@@ -69,11 +120,22 @@ sql_stray_viewMapnamePr = (
 )
 sql_stray_viewPlayerPrMapInfo = "SELECT mapname, (SELECT COUNT(1) FROM ck_zones WHERE zonetype = '3' AND mapname = '{}') AS stages, (SELECT COUNT(DISTINCT zonegroup) FROM ck_zones WHERE mapname = '{}' AND zonegroup > 0) AS bonuses FROM ck_maptier WHERE mapname = '{}';"
 sql_stray_selectMapcycle = "SELECT mapname, tier FROM ck_maptier ORDER BY mapname ASC"
+# `st-mapchooser` map list, `{}` is an optional `WHERE` on `z.mapname`
+sql_selectMapCatalog = "SELECT z.mapname, t.tier AS maptier, COUNT(CASE WHEN z.zonegroup = 0 AND z.zonetype IN (1, 3, 5) THEN 1 END) AS stages, MAX(z.zonegroup) AS bonuses FROM ck_zones z INNER JOIN ck_maptier t ON t.mapname = z.mapname {} GROUP BY z.mapname, t.tier HAVING stages > 0 ORDER BY z.mapname ASC;"
+# Completion index, start zones of every map and bonus and the ones finished by a player
+sql_selectCompletionZones = "SELECT a.mapname, a.zonegroup, MIN(a.zonename) AS zonename, d.tier FROM ck_zones a LEFT JOIN ck_maptier d ON d.mapname = a.mapname WHERE a.zonetype = 1 OR a.zonetype = 5 GROUP BY a.mapname, a.zonegroup, d.tier;"
+sql_selectPlayerCompletions = PreparedQuery(
+    "SELECT mapname, 0 AS zonegroup FROM ck_playertimes WHERE steamid = %(steamid)s AND style = %(style)s UNION ALL SELECT mapname, zonegroup FROM ck_bonus WHERE steamid = %(steamid)s AND style = %(style)s;",
+    steamid=str,
+    style=int,
+)
 
 ## ck_playeroptions2
 sql_createPlayerOptions = "CREATE TABLE IF NOT EXISTS `ck_playeroptions2` (`steamid` varchar(32) NOT NULL DEFAULT '', `timer` int(11) NOT NULL DEFAULT '1', `hide` int(11) NOT NULL DEFAULT '0', `sounds` int(11) NOT NULL DEFAULT '1', `chat` int(11) NOT NULL DEFAULT '0', `viewmodel` int(11) NOT NULL DEFAULT '1', `autobhop` int(11) NOT NULL DEFAULT '1', `checkpoints` int(11) NOT NULL DEFAULT '1', `gradient` int(11) NOT NULL DEFAULT '3', `speedmode` int(11) NOT NULL DEFAULT '0', `centrespeed` int(11) NOT NULL DEFAULT '0', `centrehud` int(11) NOT NULL DEFAULT '1', teleside int(11) NOT NULL DEFAULT '0', `module1c` int(11) NOT NULL DEFAULT '1', `module2c` int(11) NOT NULL DEFAULT '2', `module3c` int(11) NOT NULL DEFAULT '3', `module4c` int(11) NOT NULL DEFAULT '4', `module5c` int(11) NOT NULL DEFAULT '5', `module6c` int(11) NOT NULL DEFAULT '6', `sidehud` int(11) NOT NULL DEFAULT '1', `module1s` int(11) NOT NULL DEFAULT '5', `module2s` int(11) NOT NULL DEFAULT '0', `module3s` int(11) NOT NULL DEFAULT '0', `module4s` int(11) NOT NULL DEFAULT '0', `module5s` int(11) NOT NULL DEFAULT '0', prestrafe int(11) NOT NULL DEFAULT '0', cpmessages int(11) NOT NULL DEFAULT '1', wrcpmessages int(11) NOT NULL DEFAULT '1', hints int(11) NOT NULL DEFAULT '1', csd_update_rate int(11) NOT NULL DEFAULT '1' , csd_pos_x float(11) NOT NULL DEFAULT '0.5' , csd_pos_y float(11) NOT NULL DEFAULT '0.3' , csd_r int(11) NOT NULL DEFAULT '255', csd_g int(11) NOT NULL DEFAULT '255', csd_b int(11) NOT NULL DEFAULT '255', PRIMARY KEY (`steamid`)) DEFAULT CHARSET=utf8mb4;"
 sql_insertPlayerOptions = "INSERT INTO ck_playeroptions2 (steamid) VALUES ('{}');"
-sql_selectPlayerOptions = "SELECT timer, hide, sounds, chat, viewmodel, autobhop, checkpoints, gradient, speedmode, centrespeed, centrehud, teleside, module1c, module2c, module3c, module4c, module5c, module6c, sidehud, module1s, module2s, module3s, module4s, module5s, prestrafe, cpmessages, wrcpmessages, hints, csd_update_rate, csd_pos_x, csd_pos_y, csd_r, csd_g, csd_b, prespeedmode FROM ck_playeroptions2 where steamid = '{}';"
+# Text protocol, `csd_pos_x` and `csd_pos_y` are FLOAT columns which prepared statements return at single precision
+sql_selectPlayerOptions = "SELECT timer, hide, sounds, chat, viewmodel, autobhop, checkpoints, gradient, speedmode, centrespeed, centrehud, teleside, module1c, module2c, module3c, module4c, module5c, module6c, sidehud, module1s, module2s, module3s, module4s, module5s, prestrafe, cpmessages, wrcpmessages, hints, csd_update_rate, csd_pos_x, csd_pos_y, csd_r, csd_g, csd_b, prespeedmode FROM ck_playeroptions2 where steamid = %s;"
+sql_selectInitPlayerOptions = "SELECT steamid AS init_steamid, timer, hide, sounds, chat, viewmodel, autobhop, checkpoints, gradient, speedmode, centrespeed, centrehud, teleside, module1c, module2c, module3c, module4c, module5c, module6c, sidehud, module1s, module2s, module3s, module4s, module5s, prestrafe, cpmessages, wrcpmessages, hints, csd_update_rate, csd_pos_x, csd_pos_y, csd_r, csd_g, csd_b, prespeedmode FROM ck_playeroptions2 WHERE steamid IN ({});"
 sql_updatePlayerOptions = "UPDATE ck_playeroptions2 SET timer = {}, hide = {}, sounds = {}, chat = {}, viewmodel = {}, autobhop = {}, checkpoints = {}, gradient = {}, speedmode = {}, centrespeed = {}, centrehud = {}, teleside = {}, module1c = {}, module2c = {}, module3c = {}, module4c = {}, module5c = {}, module6c = {}, sidehud = {}, module1s = {}, module2s = {}, module3s = {}, module4s = {}, module5s = {}, prestrafe = {}, cpmessages = {}, wrcpmessages = {}, hints = {}, csd_update_rate = {}, csd_pos_x = {}, csd_pos_y = {}, csd_r= {}, csd_g = {}, csd_b = {}, prespeedmode = {} where steamid = '{}'"
 sql_stray_deleteWipePlayerOptions = (
     "DELETE FROM ck_playeroptions2 WHERE steamid = '{}';"
@@ -84,6 +146,24 @@ sql_createPlayerRank = "CREATE TABLE IF NOT EXISTS `ck_playerrank` (`steamid` va
 sql_insertPlayerRank = "INSERT INTO ck_playerrank (steamid, steamid64, name, country, countryCode, continentCode, joined, style) VALUES('{}', '{}', '{}', '{}', '{}', '{}', {}, {})"
 sql_updatePlayerRankPoints = "UPDATE ck_playerrank SET `name` ='{}', points ={}, wrpoints = {}, wrbpoints = {}, wrcppoints = {}, top10points = {}, groupspoints = {}, mappoints = {}, bonuspoints = {}, finishedmapspro={}, finishedbonuses = {}, finishedstages = {}, wrs = {}, wrbs = {}, wrcps = {}, top10s = {}, `groups` = {} where steamid='{}' AND style = {};"
 sql_updatePlayerRankPoints2 = "UPDATE ck_playerrank SET name ='{}', points ={}, wrpoints = {}, wrbpoints = {}, wrcppoints = {}, top10points = {}, groupspoints = {}, mappoints = {}, bonuspoints = {}, finishedmapspro={}, finishedbonuses = {}, finishedstages = {}, wrs = {}, wrbs = {}, wrcps = {}, top10s = {}, `groups` = {}, country = '{}', countryCode = '{}', continentCode = '{}' where steamid='{}' AND style = {};"
+# Rank index
+sql_selectRankIndexPlayers = PreparedQuery(
+    "SELECT steamid, name, points, country, continentCode FROM ck_playerrank WHERE style = %(style)s;",
+    style=int,
+)
+# Recalculation
+sql_selectRecalculationPlayers = PreparedQuery(
+    "SELECT steamid, name FROM ck_playerrank WHERE style = %(style)s;",
+    style=int,
+)
+# Bulk points update through a per connection staging table, `NULL` name/country columns keep the current value
+sql_createPlayerRankPointsStaging = "CREATE TEMPORARY TABLE IF NOT EXISTS tmp_playerrank_points (`steamid` varchar(32) NOT NULL, `style` int(11) NOT NULL, `name` varchar(64) DEFAULT NULL, `points` int(12) NOT NULL DEFAULT '0', `wrpoints` int(12) NOT NULL DEFAULT '0', `wrbpoints` int(12) NOT NULL DEFAULT '0', `wrcppoints` int(11) NOT NULL DEFAULT '0', `top10points` int(12) NOT NULL DEFAULT '0', `groupspoints` int(12) NOT NULL DEFAULT '0', `mappoints` int(11) NOT NULL DEFAULT '0', `bonuspoints` int(12) NOT NULL DEFAULT '0', `finishedmapspro` int(12) NOT NULL DEFAULT '0', `finishedbonuses` int(12) NOT NULL DEFAULT '0', `finishedstages` int(12) NOT NULL DEFAULT '0', `wrs` int(12) NOT NULL DEFAULT '0', `wrbs` int(12) NOT NULL DEFAULT '0', `wrcps` int(12) NOT NULL DEFAULT '0', `top10s` int(12) NOT NULL DEFAULT '0', `groups` int(12) NOT NULL DEFAULT '0', `country` varchar(32) DEFAULT NULL, `countryCode` varchar(3) DEFAULT NULL, `continentCode` varchar(3) DEFAULT NULL, PRIMARY KEY (`steamid`, `style`)) ENGINE=MEMORY;"
+sql_clearPlayerRankPointsStaging = "DELETE FROM tmp_playerrank_points;"
+sql_insertPlayerRankPointsStaging = "INSERT INTO tmp_playerrank_points (steamid, style, name, points, wrpoints, wrbpoints, wrcppoints, top10points, groupspoints, mappoints, bonuspoints, finishedmapspro, finishedbonuses, finishedstages, wrs, wrbs, wrcps, top10s, `groups`, country, countryCode, continentCode) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s);"
+sql_selectPlayerRankPointsStagingOutcome = "SELECT v.steamid, v.style, p.steamid IS NULL AS missing, (p.points <=> v.points AND p.wrpoints <=> v.wrpoints AND p.wrbpoints <=> v.wrbpoints AND p.wrcppoints <=> v.wrcppoints AND p.top10points <=> v.top10points AND p.groupspoints <=> v.groupspoints AND p.mappoints <=> v.mappoints AND p.bonuspoints <=> v.bonuspoints AND p.finishedmapspro <=> v.finishedmapspro AND p.finishedbonuses <=> v.finishedbonuses AND p.finishedstages <=> v.finishedstages AND p.wrs <=> v.wrs AND p.wrbs <=> v.wrbs AND p.wrcps <=> v.wrcps AND p.top10s <=> v.top10s AND p.`groups` <=> v.`groups` AND p.name <=> COALESCE(v.name, p.name) AND p.country <=> COALESCE(v.country, p.country) AND p.countryCode <=> COALESCE(v.countryCode, p.countryCode) AND p.continentCode <=> COALESCE(v.continentCode, p.continentCode)) AS unchanged FROM tmp_playerrank_points v LEFT JOIN ck_playerrank p ON p.steamid = v.steamid AND p.style = v.style;"
+sql_updatePlayerRankPointsStaging = "UPDATE ck_playerrank p INNER JOIN tmp_playerrank_points v ON p.steamid = v.steamid AND p.style = v.style SET p.name = COALESCE(v.name, p.name), p.points = v.points, p.wrpoints = v.wrpoints, p.wrbpoints = v.wrbpoints, p.wrcppoints = v.wrcppoints, p.top10points = v.top10points, p.groupspoints = v.groupspoints, p.mappoints = v.mappoints, p.bonuspoints = v.bonuspoints, p.finishedmapspro = v.finishedmapspro, p.finishedbonuses = v.finishedbonuses, p.finishedstages = v.finishedstages, p.wrs = v.wrs, p.wrbs = v.wrbs, p.wrcps = v.wrcps, p.top10s = v.top10s, p.`groups` = v.`groups`, p.country = COALESCE(v.country, p.country), p.countryCode = COALESCE(v.countryCode, p.countryCode), p.continentCode = COALESCE(v.continentCode, p.continentCode);"
+sql_selectPlayersRankPoints = "SELECT steamid, points, wrpoints, wrbpoints, wrcppoints, top10points, groupspoints, mappoints, bonuspoints, finishedmapspro, finishedbonuses, finishedstages, wrs, wrbs, wrcps, top10s, `groups` FROM ck_playerrank WHERE style = %s AND steamid IN ({});"
+sql_selectPlayersRankNames = "SELECT steamid, name FROM ck_playerrank WHERE style = %s AND steamid IN ({});"
 sql_updatePlayerRank = "UPDATE ck_playerrank SET finishedmaps ='{}', finishedmapspro='{}' where steamid='{}' AND style = '{}';"
 sql_selectPlayerName = "SELECT name FROM ck_playerrank where steamid = '{}'"
 sql_UpdateLastSeenMySQL = (
@@ -91,7 +171,11 @@ sql_UpdateLastSeenMySQL = (
 )
 sql_selectPlayerRankUnknown = "SELECT `steamid`, `name`, `points` FROM `ck_playerrank` WHERE `name` LIKE '%{}%' ORDER BY `points` DESC LIMIT 0, 1;"
 sql_selectTopPlayers = "SELECT name, points, finishedmapspro, steamid FROM ck_playerrank WHERE style = {} ORDER BY points DESC LIMIT 100"
-sql_selectRankedPlayer = "SELECT steamid, name, points, finishedmapspro, country, lastseen, timealive, timespec, connections, readchangelog, style, countryCode, continentCode from ck_playerrank where steamid='{}';"
+sql_selectRankedPlayer = PreparedQuery(
+    "SELECT steamid, name, points, finishedmapspro, country, lastseen, timealive, timespec, connections, readchangelog, style, countryCode, continentCode from ck_playerrank where steamid=%(steamid)s;",
+    steamid=str,
+)
+sql_selectInitRankedPlayers = "SELECT steamid, name, points, finishedmapspro, country, lastseen, timealive, timespec, connections, readchangelog, style, countryCode, continentCode FROM ck_playerrank WHERE steamid IN ({});"
 sql_selectRankedPlayersRank = "SELECT name FROM ck_playerrank WHERE style = {} AND points >= (SELECT points FROM ck_playerrank WHERE steamid = '{}' AND style = {}) ORDER BY points;"
 sql_selectPlayersStylesRank = "SELECT COUNT(steamid) FROM ck_playerrank WHERE style = {} AND points >= (SELECT points FROM ck_playerrank WHERE steamid = '{}' AND style = {}) ORDER BY points;"
 
@@ -150,6 +234,65 @@ sql_stray_point_calc_countFinishedBonus = "SELECT mapname, (SELECT count(1)+1 FR
 sql_stray_point_calc_finishedStages = "SELECT mapname, stage, (select count(1)+1 from ck_wrcps b where a.mapname=b.mapname and a.runtimepro > b.runtimepro and a.style = b.style and a.stage = b.stage) AS `rank` FROM ck_wrcps a where steamid = '{}' AND style = {};"
 sql_stray_point_calc_finishedMaps = "SELECT mapname, (select count(1)+1 from ck_playertimes b where a.mapname=b.mapname and a.runtimepro > b.runtimepro AND b.style = {}) AS `rank`, (SELECT count(1) FROM ck_playertimes b WHERE a.mapname = b.mapname AND b.style = {}) as total, (SELECT tier FROM `ck_maptier` b WHERE a.mapname = b.mapname) as tier FROM ck_playertimes a where steamid = '{}' AND style = {};"
 
+# point_calc ranks with window functions, one pass per map instead of a count(1) subquery per row (MySQL 8.0+)
+sql_selectPlayerMapRanks = PreparedQuery(
+    "SELECT r.mapname, r.`rank`, r.total, t.tier FROM (SELECT steamid, mapname, RANK() OVER (PARTITION BY mapname ORDER BY runtimepro) AS `rank`, COUNT(1) OVER (PARTITION BY mapname) AS total FROM ck_playertimes WHERE style = %(style)s AND mapname IN (SELECT mapname FROM ck_playertimes WHERE steamid = %(steamid)s AND style = %(style)s)) r LEFT JOIN ck_maptier t ON t.mapname = r.mapname WHERE r.steamid = %(steamid)s;",
+    steamid=str,
+    style=int,
+)
+sql_selectPlayerBonusRanks = PreparedQuery(
+    "SELECT r.mapname, r.`rank`, r.total FROM (SELECT steamid, mapname, RANK() OVER (PARTITION BY mapname, zonegroup ORDER BY runtime) AS `rank`, COUNT(1) OVER (PARTITION BY mapname, zonegroup) AS total FROM ck_bonus WHERE style = %(style)s AND mapname IN (SELECT mapname FROM ck_bonus WHERE steamid = %(steamid)s AND style = %(style)s)) r WHERE r.steamid = %(steamid)s;",
+    steamid=str,
+    style=int,
+)
+sql_selectPlayerStageRanks = PreparedQuery(
+    "SELECT r.mapname, r.stage, r.`rank` FROM (SELECT steamid, mapname, stage, RANK() OVER (PARTITION BY mapname, stage ORDER BY runtimepro) AS `rank` FROM ck_wrcps WHERE style = %(style)s AND mapname IN (SELECT mapname FROM ck_wrcps WHERE steamid = %(steamid)s AND style = %(style)s)) r WHERE r.steamid = %(steamid)s;",
+    steamid=str,
+    style=int,
+)
+sql_selectStyleMapRanks = PreparedQuery(
+    "SELECT r.steamid, r.mapname, r.`rank`, r.total, t.tier FROM (SELECT steamid, mapname, RANK() OVER (PARTITION BY mapname ORDER BY runtimepro) AS `rank`, COUNT(1) OVER (PARTITION BY mapname) AS total FROM ck_playertimes WHERE style = %(style)s) r LEFT JOIN ck_maptier t ON t.mapname = r.mapname;",
+    style=int,
+)
+sql_selectStyleBonusRanks = PreparedQuery(
+    "SELECT steamid, mapname, RANK() OVER (PARTITION BY mapname, zonegroup ORDER BY runtime) AS `rank`, COUNT(1) OVER (PARTITION BY mapname, zonegroup) AS total FROM ck_bonus WHERE style = %(style)s;",
+    style=int,
+)
+sql_selectStyleStageRanks = PreparedQuery(
+    "SELECT steamid, mapname, stage, RANK() OVER (PARTITION BY mapname, stage ORDER BY runtimepro) AS `rank` FROM ck_wrcps WHERE style = %(style)s;",
+    style=int,
+)
+# Players whose points depend on their rank on a map, bonus or stage
+sql_countMapTimes = PreparedQuery(
+    "SELECT COUNT(1) AS total FROM ck_playertimes WHERE mapname = %(mapname)s AND style = %(style)s;",
+    mapname=str,
+    style=int,
+)
+sql_selectMapRankedPlayers = PreparedQuery(
+    "SELECT steamid FROM (SELECT steamid, RANK() OVER (ORDER BY runtimepro) AS `rank` FROM ck_playertimes WHERE mapname = %(mapname)s AND style = %(style)s) r WHERE r.`rank` <= %(max_rank)s;",
+    mapname=str,
+    style=int,
+    max_rank=int,
+)
+sql_selectBonusRankedPlayers = PreparedQuery(
+    "SELECT steamid FROM (SELECT steamid, RANK() OVER (ORDER BY runtime) AS `rank` FROM ck_bonus WHERE mapname = %(mapname)s AND zonegroup = %(zonegroup)s AND style = %(style)s) r WHERE r.`rank` <= %(max_rank)s;",
+    mapname=str,
+    zonegroup=int,
+    style=int,
+    max_rank=int,
+)
+sql_selectStageRankedPlayers = PreparedQuery(
+    "SELECT steamid FROM (SELECT steamid, RANK() OVER (ORDER BY runtimepro) AS `rank` FROM ck_wrcps WHERE mapname = %(mapname)s AND stage = %(stage)s AND style = %(style)s) r WHERE r.`rank` <= %(max_rank)s;",
+    mapname=str,
+    stage=int,
+    style=int,
+    max_rank=int,
+)
+# Several players at once, `{}` is replaced by one `%s` per steamid
+sql_selectPlayersMapRanks = "SELECT r.steamid, r.mapname, r.`rank`, r.total, t.tier FROM (SELECT steamid, mapname, RANK() OVER (PARTITION BY mapname ORDER BY runtimepro) AS `rank`, COUNT(1) OVER (PARTITION BY mapname) AS total FROM ck_playertimes WHERE style = %s AND mapname IN (SELECT mapname FROM ck_playertimes WHERE style = %s AND steamid IN ({}))) r LEFT JOIN ck_maptier t ON t.mapname = r.mapname WHERE r.steamid IN ({});"
+sql_selectPlayersBonusRanks = "SELECT r.steamid, r.mapname, r.`rank`, r.total FROM (SELECT steamid, mapname, RANK() OVER (PARTITION BY mapname, zonegroup ORDER BY runtime) AS `rank`, COUNT(1) OVER (PARTITION BY mapname, zonegroup) AS total FROM ck_bonus WHERE style = %s AND mapname IN (SELECT mapname FROM ck_bonus WHERE style = %s AND steamid IN ({}))) r WHERE r.steamid IN ({});"
+sql_selectPlayersStageRanks = "SELECT r.steamid, r.mapname, r.stage, r.`rank` FROM (SELECT steamid, mapname, stage, RANK() OVER (PARTITION BY mapname, stage ORDER BY runtimepro) AS `rank` FROM ck_wrcps WHERE style = %s AND mapname IN (SELECT mapname FROM ck_wrcps WHERE style = %s AND steamid IN ({}))) r WHERE r.steamid IN ({});"
+
 ##################################################
 ## ALL below are NOT implemented in ST code yet ##
 ##################################################
@@ -223,6 +366,7 @@ sql_stray_PRinfoByName = "SELECT steamid, name, mapname, runtime, PRtimeinzone,
 ## ck_replays
 sql_createReplays = "CREATE TABLE IF NOT EXISTS ck_replays (mapname VARCHAR(32), cp int(12) NOT NULL DEFAULT '0', frame int(12) NOT NULL DEFAULT '0', style INT(12) NOT NULL DEFAULT '0', PRIMARY KEY(mapname, cp, style)) DEFAULT CHARSET=utf8mb4;"
 sql_selectReplayCPTicksAll = "SELECT cp, frame, style FROM ck_replays WHERE mapname = '{}' AND style = '{}' ORDER BY cp ASC;"
+sql_selectReplayCPTicksAllStyles = "SELECT cp, frame, style FROM ck_replays WHERE mapname = '{}' ORDER BY style ASC, cp ASC;"
 sql_insertReplayCPTicks = (
     "INSERT INTO ck_replays (mapname, cp, frame, style) VALUES ('{}', '{}', '{}', '{}')"
 )
@@ -0,0 +1,527 @@
+"""In-memory ranking of the players of each style by `ck_playerrank.points`\n
+Each style is loaded from the database on first use, then kept current by the `ck_playerrank` write endpoints which
+apply their change locally and send it to the other workers through Redis pub/sub (`REDIS.RANK_CHANNEL`).
+Rank, player at rank, next rank points and top N, in the whole style or within a country or continent, are answered
+with binary searches instead of counting rows in MySQL.\n
+With `REDIS.RANK_BACKEND` set to `"redis"` the rankings are Redis sorted sets shared by every worker instead
+(`RedisRankIndexes`), answered with `ZCOUNT`/`ZRANGE`"""
+
+import bisect, threading, redis
+import simplejson as json
+from cache import PubSubChannel
+from sql import selectPrepared, runAsync
+from globals import config, redis_client
+import surftimer.queries
+
+# Sorts after every steamid, so `(-points, LAST)` is past all the players with `points`
+LAST = "\U0010ffff"
+
+
+def _groups(country: str, continent: str):
+    """Country and continent rankings a player belongs to"""
+    groups = []
+    if country is not None:
+        groups.append(("country", country))
+    if continent is not None:
+        groups.append(("continent", continent))
+    return groups
+
+
+class RankIndex:
+    """Players of a single style sorted by points, highest first, with the same ranking per country and continent\n
+    Lookups are binary searches over the sorted `(-points, steamid)` lists, an update only moves
+    one entry in each of them"""
+
+    def __init__(self, rows: list[dict]):
+        self._players = {
+            row["steamid"]: (
+                row["points"] or 0,
+                row["name"],
+                row.get("country"),
+                row.get("continentCode"),
+            )
+            for row in rows
+        }
+        self._keys = sorted(
+            (-player[0], steamid) for steamid, player in self._players.items()
+        )
+        self._groups = {}
+        for steamid, (points, name, country, continent) in self._players.items():
+            for group in _groups(country, continent):
+                self._groups.setdefault(group, []).append((-points, steamid))
+        for keys in self._groups.values():
+            keys.sort()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._keys)
+
+    def _entry(self, key):
+        points, name = self._players[key[1]][:2]
+        return {"steamid": key[1], "name": name, "points": points}
+
+    def _delete(self, steamid32: str, player: tuple):
+        key = (-player[0], steamid32)
+        del self._keys[bisect.bisect_left(self._keys, key)]
+        for group in _groups(*player[2:]):
+            keys = self._groups[group]
+            del keys[bisect.bisect_left(keys, key)]
+
+    def update(
+        self,
+        steamid32: str,
+        points: int,
+        name: str = None,
+        country: str = None,
+        continent: str = None,
+    ):
+        """Adds the player or moves them to their new `points`, `name`, `country` and `continent` are kept when
+        `None`"""
+        points = points or 0
+        with self._lock:
+            current = self._players.get(steamid32)
+            if current is not None:
+                name = current[1] if name is None else name
+                country = current[2] if country is None else country
+                continent = current[3] if continent is None else continent
+                self._delete(steamid32, current)
+
+            bisect.insort(self._keys, (-points, steamid32))
+            for group in _groups(country, continent):
+                bisect.insort(self._groups.setdefault(group, []), (-points, steamid32))
+            self._players[steamid32] = (points, name, country, continent)
+
+    def remove(self, steamid32: str):
+        with self._lock:
+            current = self._players.pop(steamid32, None)
+            if current is not None:
+                self._delete(steamid32, current)
+
+    def remove_up_to(self, points: int):
+        """Removes every player with `points` or less"""
+        with self._lock:
+            start = bisect.bisect_left(self._keys, (-points, ""))
+            for key in self._keys[start:]:
+                del self._players[key[1]]
+            del self._keys[start:]
+            for keys in self._groups.values():
+                del keys[bisect.bisect_left(keys, (-points, "")) :]
+
+    def points(self, steamid32: str):
+        current = self._players.get(steamid32)
+        return None if current is None else current[0]
+
+    def player(self, steamid32: str):
+        """`steamid`, `name` and `points` of the player, `None` if the player is not ranked in this style"""
+        with self._lock:
+            if steamid32 not in self._players:
+                return None
+            return self._entry((None, steamid32))
+
+    def rank(self, steamid32: str):
+        """Number of players with at least as many points as the player (ties share the lowest rank), `None` if
+        the player is not ranked in this style"""
+        with self._lock:
+            current = self._players.get(steamid32)
+            if current is None:
+                return None
+
+            return bisect.bisect_right(self._keys, (-current[0], LAST))
+
+    def rank_for_points(self, points: int, country: str = None, continent: str = None):
+        """Rank a player with `points` would get in the style, or only among the players of `country` or
+        `continent`, one more than the number of players with more points"""
+        with self._lock:
+            if country is not None:
+                keys = self._groups.get(("country", country), [])
+            elif continent is not None:
+                keys = self._groups.get(("continent", continent), [])
+            else:
+                keys = self._keys
+            return bisect.bisect_left(keys, (-points, "")) + 1
+
+    def at(self, offset: int):
+        """Player at `offset` (0 is the player with the most points), `None` past the last player"""
+        with self._lock:
+            if offset < 0 or offset >= len(self._keys):
+                return None
+            return self._entry(self._keys[offset])
+
+    def top(self, limit: int):
+        with self._lock:
+            return [self._entry(key) for key in self._keys[:limit]]
+
+
+class RankIndexes(PubSubChannel):
+    """`RankIndex` of every style, loaded lazily and kept in sync between workers\n
+    Without Redis changes are only applied in the worker that made them"""
+
+    def __init__(self, client, channel: str):
+        super().__init__(client, channel)
+        self._indexes = {}
+        self._generation = 0
+        self._load_lock = threading.Lock()
+
+    def _sync(self):
+        return self.client is not None
+
+    def load(self, style: int):
+        """Returns the index of `style`, reading the players from the database the first time"""
+        if self._sync():
+            self.ensure_listening()
+
+        index = self._indexes.get(style)
+        if index is not None:
+            return index
+
+        with self._load_lock:
+            while style not in self._indexes:
+                # Reload if a change came in while reading, it may be missing from the rows
+                generation = self._generation
+                rows = selectPrepared(
+                    surftimer.queries.sql_selectRankIndexPlayers, style=style
+                )
+                if generation == self._generation:
+                    self._indexes[style] = RankIndex(rows)
+
+        return self._indexes[style]
+
+    async def get(self, style: int):
+        """`load` without blocking the event loop when the style still has to be read"""
+        index = self._indexes.get(style)
+        if index is not None:
+            if self._sync():
+                self.ensure_listening()
+            return index
+
+        return await runAsync(self.load, style)
+
+    def _apply(self, payload: dict):
+        op = payload["op"]
+        self._generation += 1
+
+        for style, index in list(self._indexes.items()):
+            if payload["style"] is not None and style != payload["style"]:
+                continue
+            if op == "reset":
+                del self._indexes[style]
+            elif op == "update":
+                for player in payload["players"]:
+                    index.update(*player)
+            elif op == "remove":
+                index.remove(payload["steamid"])
+            elif op == "remove_up_to":
+                index.remove_up_to(payload["points"])
+
+    def _publish(self, payload: dict):
+        self._apply(payload)
+        if self._sync():
+            self.send(payload)
+
+    def update(self, style: int, players: list[tuple]):
+        """Moves `(steamid32, points, name[, country, continent])` players of `style` to their new points, the other
+        values are kept when `None`"""
+        if players:
+            self._publish({"op": "update", "style": style, "players": players})
+
+    def remove(self, steamid32: str, style: int = None):
+        """Removes the player from `style` (every style by default)"""
+        self._publish({"op": "remove", "style": style, "steamid": steamid32})
+
+    def remove_up_to(self, points: int):
+        """Removes every player with `points` or less from every style"""
+        self._publish({"op": "remove_up_to", "style": None, "points": points})
+
+    def reset(self, style: int = None):
+        """Drops the index of `style` (every style by default), it is read again on next use"""
+        self._publish({"op": "reset", "style": style})
+
+    def handle(self, payload: dict):
+        self._apply(payload)
+
+    def disconnected(self):
+        # Changes may have been missed while disconnected
+        self._apply({"op": "reset", "style": None})
+
+
+class RedisRankIndex:
+    """`RankIndex` stored in Redis, sorted sets of steamids scored by `-points` (ties are ordered by steamid like
+    the in-memory one) for the style and for each country and continent, with the players kept in a hash
+    """
+
+    def __init__(self, client: redis.Redis, key: str):
+        self.client = client
+        self.key = key
+        self._players = f"{key}:players"
+
+    def __len__(self):
+        return self.client.zcard(self.key)
+
+    def _entries(self, steamids: list):
+        if not steamids:
+            return []
+
+        players = self.client.hmget(self._players, steamids)
+        return [
+            {"steamid": steamid.decode(), "name": player[1], "points": player[0]}
+            for steamid, player in zip(steamids, map(json.loads, players))
+        ]
+
+    def points(self, steamid32: str):
+        player = self.client.hget(self._players, steamid32)
+        return None if player is None else json.loads(player)[0]
+
+    def player(self, steamid32: str):
+        """`steamid`, `name` and `points` of the player, `None` if the player is not ranked in this style"""
+        player = self.client.hget(self._players, steamid32)
+        if player is None:
+            return None
+
+        points, name = json.loads(player)[:2]
+        return {"steamid": steamid32, "name": name, "points": points}
+
+    def rank(self, steamid32: str):
+        """Number of players with at least as many points as the player (ties share the lowest rank), `None` if
+        the player is not ranked in this style"""
+        score = self.client.zscore(self.key, steamid32)
+        if score is None:
+            return None
+
+        return self.client.zcount(self.key, "-inf", int(score))
+
+    def rank_for_points(self, points: int, country: str = None, continent: str = None):
+        """Rank a player with `points` would get in the style, or only among the players of `country` or
+        `continent`, one more than the number of players with more points"""
+        if country is not None:
+            key = f"{self.key}:country:{country}"
+        elif continent is not None:
+            key = f"{self.key}:continent:{continent}"
+        else:
+            key = self.key
+        return self.client.zcount(key, "-inf", f"({-points}") + 1
+
+    def at(self, offset: int):
+        """Player at `offset` (0 is the player with the most points), `None` past the last player"""
+        if offset < 0:
+            return None
+
+        entries = self._entries(self.client.zrange(self.key, offset, offset))
+        return entries[0] if entries else None
+
+    def top(self, limit: int):
+        if limit <= 0:
+            return []
+        return self._entries(self.client.zrange(self.key, 0, limit - 1))
+
+
+class RedisRankIndexes:
+    """`RankIndexes` backed by Redis sorted sets, each style is seeded from `ck_playerrank` by the first worker
+    using it and then shared by all of them\n
+    Every change bumps a version key of the style, a seed is only written if the version did not move while
+    reading the players from the database"""
+
+    # Applies `(steamid, points, has_name, name, country, continent)` groups to a seeded style, the name, country
+    # and continent (JSON, `null` keeps the current one) are stored with the points in the players hash
+    _update_script = """
+    redis.call('INCR', KEYS[3])
+    if redis.call('EXISTS', KEYS[2]) == 0 then
+        return 0
+    end
+    local players = KEYS[1] .. ':players'
+    for i = 1, #ARGV, 6 do
+        local steamid, points = ARGV[i], tonumber(ARGV[i + 1])
+        local current = redis.call('HGET', players, steamid)
+        local name, country, continent = cjson.null, cjson.null, cjson.null
+        if current then
+            current = cjson.decode(current)
+            name, country, continent = current[2], current[3], current[4]
+            if country ~= cjson.null then
+                redis.call('ZREM', KEYS[1] .. ':country:' .. country, steamid)
+            end
+            if continent ~= cjson.null then
+                redis.call('ZREM', KEYS[1] .. ':continent:' .. continent, steamid)
+            end
+        end
+        if ARGV[i + 2] == '1' then
+            name = cjson.decode(ARGV[i + 3])
+        end
+        if ARGV[i + 4] ~= 'null' then
+            country = cjson.decode(ARGV[i + 4])
+        end
+        if ARGV[i + 5] ~= 'null' then
+            continent = cjson.decode(ARGV[i + 5])
+        end
+
+        redis.call('ZADD', KEYS[1], -points, steamid)
+        if country ~= cjson.null then
+            redis.call('ZADD', KEYS[1] .. ':country:' .. country, -points, steamid)
+            redis.call('SADD', KEYS[1] .. ':groups', KEYS[1] .. ':country:' .. country)
+        end
+        if continent ~= cjson.null then
+            redis.call('ZADD', KEYS[1] .. ':continent:' .. continent, -points, steamid)
+            redis.call('SADD', KEYS[1] .. ':groups', KEYS[1] .. ':continent:' .. continent)
+        end
+        redis.call('HSET', players, steamid, cjson.encode({points, name, country, continent}))
+    end
+    return 1
+    """
+    # Removes the players with `ARGV[1]` points or less (all of them with `ARGV[2]`) of a seeded style
+    _remove_script = """
+    redis.call('INCR', KEYS[3])
+    if redis.call('EXISTS', KEYS[2]) == 0 then
+        return 0
+    end
+    local steamids
+    if ARGV[2] == '' then
+        steamids = redis.call('ZRANGEBYSCORE', KEYS[1], -tonumber(ARGV[1]), '+inf')
+    else
+        steamids = {ARGV[2]}
+    end
+    for _, steamid in ipairs(steamids) do
+        redis.call('ZREM', KEYS[1], steamid)
+        for _, group in ipairs(redis.call('SMEMBERS', KEYS[1] .. ':groups')) do
+            redis.call('ZREM', group, steamid)
+        end
+        redis.call('HDEL', KEYS[1] .. ':players', steamid)
+    end
+    return #steamids
+    """
+
+    def __init__(self, client: redis.Redis, prefix: str):
+        self.client = client
+        self.prefix = prefix
+        self._registry = f"{prefix}:styles"
+        # Bumped by the changes of every style, which may be seeding at the same time
+        self._version = f"{prefix}:version"
+        self._update = client.register_script(self._update_script)
+        self._remove = client.register_script(self._remove_script)
+
+    def _key(self, style: int):
+        return f"{self.prefix}:{style}"
+
+    def _drop(self, pipe, key: str):
+        groups = self.client.smembers(f"{key}:groups")
+        if groups:
+            pipe.delete(*groups)
+        pipe.delete(key, f"{key}:players", f"{key}:groups", f"{key}:loaded")
+
+    def load(self, style: int):
+        """Returns the index of `style`, seeding it from the database the first time"""
+        key = self._key(style)
+        loaded, version = f"{key}:loaded", f"{key}:version"
+
+        with self.client.pipeline() as pipe:
+            while not self.client.exists(loaded):
+                try:
+                    pipe.watch(version, self._version)
+                    rows = selectPrepared(
+                        surftimer.queries.sql_selectRankIndexPlayers, style=style
+                    )
+                    groups = {}
+                    for row in rows:
+                        for group in _groups(row["country"], row["continentCode"]):
+                            groups.setdefault(f"{key}:{group[0]}:{group[1]}", {})[
+                                row["steamid"]
+                            ] = -(row["points"] or 0)
+
+                    pipe.multi()
+                    self._drop(pipe, key)
+                    if rows:
+                        pipe.zadd(
+                            key, {row["steamid"]: -(row["points"] or 0) for row in rows}
+                        )
+                        pipe.hset(
+                            f"{key}:players",
+                            mapping={
+                                row["steamid"]: json.dumps(
+                                    [
+                                        row["points"] or 0,
+                                        row["name"],
+                                        row["country"],
+                                        row["continentCode"],
+                                    ]
+                                )
+                                for row in rows
+                            },
+                        )
+                    for group, members in groups.items():
+                        pipe.zadd(group, members)
+                    if groups:
+                        pipe.sadd(f"{key}:groups", *groups)
+                    pipe.set(loaded, 1)
+                    pipe.sadd(self._registry, style)
+                    # Raises `WatchError` if a change came in while reading, it may be missing from the rows
+                    pipe.execute()
+                except redis.WatchError:
+                    pipe.reset()
+
+        return RedisRankIndex(self.client, key)
+
+    async def get(self, style: int):
+        """`load` without blocking the event loop"""
+        return await runAsync(self.load, style)
+
+    def _keys(self, key: str):
+        return [key, f"{key}:loaded", f"{key}:version"]
+
+    def update(self, style: int, players: list[tuple]):
+        """Moves `(steamid32, points, name[, country, continent])` players of `style` to their new points, the other
+        values are kept when `None`"""
+        if not players:
+            return
+
+        args = []
+        for steamid32, points, name, *groups in players:
+            country, continent = (groups + [None, None])[:2]
+            args += [
+                steamid32,
+                points or 0,
+                0 if name is None else 1,
+                json.dumps(name),
+                json.dumps(country),
+                json.dumps(continent),
+            ]
+        self._update(keys=self._keys(self._key(style)), args=args)
+
+    def _styles(self, style: int = None):
+        if style is not None:
+            return [style]
+        return [int(style) for style in self.client.smembers(self._registry)]
+
+    def remove(self, steamid32: str, style: int = None):
+        """Removes the player from `style` (every style by default)"""
+        self.client.incr(self._version)
+        for style in self._styles(style):
+            self._remove(keys=self._keys(self._key(style)), args=[0, steamid32])
+
+    def remove_up_to(self, points: int):
+        """Removes every player with `points` or less from every style"""
+        self.client.incr(self._version)
+        for style in self._styles():
+            self._remove(keys=self._keys(self._key(style)), args=[points, ""])
+
+    def reset(self, style: int = None):
+        """Drops the index of `style` (every style by default), it is seeded again on next use"""
+        pipe = self.client.pipeline()
+        pipe.incr(self._version)
+        for style in self._styles(style):
+            key = self._key(style)
+            self._drop(pipe, key)
+            pipe.incr(f"{key}:version")
+            pipe.srem(self._registry, style)
+        pipe.execute()
+
+
+if (
+    config["REDIS"]["ENABLED"] == 1
+    and config["REDIS"].get("RANK_BACKEND", "memory") == "redis"
+):
+    rank_indexes = RedisRankIndexes(
+        redis_client,
+        prefix=config["REDIS"].get("RANK_PREFIX", "surftimer:rank"),
+    )
+else:
+    rank_indexes = RankIndexes(
+        redis_client if config["REDIS"]["ENABLED"] == 1 else None,
+        channel=config["REDIS"].get("RANK_CHANNEL", "surftimer:ranks"),
+    )
@@ -0,0 +1,245 @@
+"""Map, bonus and stage ranks used by the points calculation\n
+Ranks and totals come from `RANK()`/`COUNT()` window functions, so each map is sorted once instead of running a
+`count(1)` subquery for every time on it. Loading a single player only ranks the maps they completed, loading a whole
+style ranks every map once and splits the rows by player\n
+Calculated points are written to `ck_playerrank` with `updatePlayerRankPointsRows`"""
+
+from sql import selectPrepared, selectQuery, transaction
+from globals import invalidate_tags
+from surftimer.rank_index import rank_indexes
+from surftimer.points_engine import group_tops
+import surftimer.queries
+
+# Ranks after which the points of a bonus or stage do not change anymore
+BONUS_POINTS_MAX_RANK = 20
+STAGE_POINTS_MAX_RANK = 1
+
+
+def select_finished_maps(steamid32: str, style: int):
+    """`mapname`, `rank`, `total` and `tier` of every map the player completed in `style`"""
+    return selectPrepared(
+        surftimer.queries.sql_selectPlayerMapRanks, steamid=steamid32, style=style
+    )
+
+
+def select_finished_bonuses(steamid32: str, style: int):
+    """`mapname`, `rank` and `total` of every bonus the player completed in `style`"""
+    return selectPrepared(
+        surftimer.queries.sql_selectPlayerBonusRanks, steamid=steamid32, style=style
+    )
+
+
+def select_finished_stages(steamid32: str, style: int):
+    """`mapname`, `stage` and `rank` of every stage the player completed in `style`"""
+    return selectPrepared(
+        surftimer.queries.sql_selectPlayerStageRanks, steamid=steamid32, style=style
+    )
+
+
+def player_point_calc_data(steamid32: str, style: int):
+    """Completions of a single player in the format expected by `calculate_points`"""
+    return {
+        "maps": select_finished_maps(steamid32, style),
+        "stages": select_finished_stages(steamid32, style),
+        "bonuses": select_finished_bonuses(steamid32, style),
+    }
+
+
+def _split_by_player(completions):
+    """Groups `(key, rows)` pairs of ranked completions by their `steamid`"""
+    players = {}
+
+    for key, rows in completions:
+        for row in rows:
+            steamid32 = row.pop("steamid")
+            if steamid32 not in players:
+                players[steamid32] = {"maps": [], "stages": [], "bonuses": []}
+            players[steamid32][key].append(row)
+
+    return players
+
+
+def style_point_calc_data(style: int):
+    """Completions of every player in `style` keyed by `steamid`, each in the format expected by `calculate_points`\n
+    Every map, bonus and stage is ranked once for all players"""
+    return _split_by_player(
+        (key, selectPrepared(query, style=style))
+        for key, query in (
+            ("maps", surftimer.queries.sql_selectStyleMapRanks),
+            ("stages", surftimer.queries.sql_selectStyleStageRanks),
+            ("bonuses", surftimer.queries.sql_selectStyleBonusRanks),
+        )
+    )
+
+
+def players_point_calc_data(style: int, steamids: list[str]):
+    """Completions of several players in `style` keyed by `steamid`, each in the format expected by `calculate_points`\n
+    Only the maps completed by at least one of them are ranked"""
+    placeholders = ", ".join(["%s"] * len(steamids))
+    params = [style, style, *steamids, *steamids]
+
+    return _split_by_player(
+        (key, selectQuery(query.format(placeholders, placeholders), params))
+        for key, query in (
+            ("maps", surftimer.queries.sql_selectPlayersMapRanks),
+            ("stages", surftimer.queries.sql_selectPlayersStageRanks),
+            ("bonuses", surftimer.queries.sql_selectPlayersBonusRanks),
+        )
+    )
+
+
+def affected_players(
+    mapname: str, style: int, zonegroup: int = None, stage: int = None
+):
+    """Players whose points may have changed after a time was added or improved on a map, bonus (`zonegroup`) or
+    `stage`\n
+    Everyone's rank behind the new time moved down by one, so the affected players are the ones ranked where the
+    points still depend on the rank: the Top 10 and groups of a map (their size and WR points follow the number of
+    completions), the ranks with their own points on a bonus and the WRCP of a stage. One extra rank is included for
+    whoever was pushed out of it"""
+    if zonegroup is not None and zonegroup > 0:
+        rows = selectPrepared(
+            surftimer.queries.sql_selectBonusRankedPlayers,
+            mapname=mapname,
+            zonegroup=zonegroup,
+            style=style,
+            max_rank=BONUS_POINTS_MAX_RANK + 1,
+        )
+    elif stage is not None:
+        rows = selectPrepared(
+            surftimer.queries.sql_selectStageRankedPlayers,
+            mapname=mapname,
+            stage=stage,
+            style=style,
+            max_rank=STAGE_POINTS_MAX_RANK + 1,
+        )
+    else:
+        total = selectPrepared(
+            surftimer.queries.sql_countMapTimes, mapname=mapname, style=style
+        )[0]["total"]
+        rows = selectPrepared(
+            surftimer.queries.sql_selectMapRankedPlayers,
+            mapname=mapname,
+            style=style,
+            max_rank=int(group_tops([total])[-1][0]) + 1,
+        )
+
+    return [row["steamid"] for row in rows]
+
+
+# Points columns of `ck_playerrank`, in the order of `sql_insertPlayerRankPointsStaging`
+POINTS_COLUMNS = (
+    "points",
+    "wrpoints",
+    "wrbpoints",
+    "wrcppoints",
+    "top10points",
+    "groupspoints",
+    "mappoints",
+    "bonuspoints",
+    "finishedmapspro",
+    "finishedbonuses",
+    "finishedstages",
+    "wrs",
+    "wrbs",
+    "wrcps",
+    "top10s",
+    "groups",
+)
+
+
+def updatePlayerRankPointsRows(
+    rows: list[dict], chunk_size: int, invalidate: bool = True
+):
+    """Writes the points of many players through a staging table, one transaction per `chunk_size` rows\n
+    `rows` have `steamid32`, `style`, every `POINTS_COLUMNS` and optionally `name`, `country`, `countryCode` and
+    `continentCode` (left unchanged when missing or `None`). Every row gets an `updated`, `unchanged` or `missing`
+    outcome, `missing` players have no `ck_playerrank` entry for that style\n
+    Without `invalidate` stale rankings are left to `invalidate_style_points`"""
+    # Last entry wins if a player was sent more than once
+    rows = list({(row["steamid32"], row["style"]): row for row in rows}.values())
+    outcomes = []
+
+    for start in range(0, len(rows), chunk_size):
+        chunk = rows[start : start + chunk_size]
+        values = [
+            (
+                row["steamid32"],
+                row["style"],
+                row.get("name"),
+                *(row[column] for column in POINTS_COLUMNS),
+                row.get("country"),
+                row.get("countryCode"),
+                row.get("continentCode"),
+            )
+            for row in chunk
+        ]
+
+        with transaction() as mydb:
+            mycursor = mydb.cursor(dictionary=True)
+            mycursor.execute(surftimer.queries.sql_createPlayerRankPointsStaging)
+            mycursor.execute(surftimer.queries.sql_clearPlayerRankPointsStaging)
+            mycursor.executemany(
+                surftimer.queries.sql_insertPlayerRankPointsStaging, values
+            )
+
+            mycursor.execute(surftimer.queries.sql_selectPlayerRankPointsStagingOutcome)
+            for row in mycursor.fetchall():
+                if row["missing"]:
+                    outcome = "missing"
+                elif row["unchanged"]:
+                    outcome = "unchanged"
+                else:
+                    outcome = "updated"
+                outcomes.append(
+                    {
+                        "steamid32": row["steamid"],
+                        "style": row["style"],
+                        "outcome": outcome,
+                    }
+                )
+
+            mycursor.execute(surftimer.queries.sql_updatePlayerRankPointsStaging)
+            mycursor.execute(surftimer.queries.sql_clearPlayerRankPointsStaging)
+            mycursor.close()
+
+    if not invalidate:
+        return outcomes
+
+    # Cached ranks and points of the updated players are stale now
+    updated = [row for row in outcomes if row["outcome"] == "updated"]
+    sent = {(row["steamid32"], row["style"]): row for row in rows}
+    ranked = {}
+    for row in updated:
+        row = sent[(row["steamid32"], row["style"])]
+        ranked.setdefault(row["style"], []).append(
+            (
+                row["steamid32"],
+                row["points"],
+                row.get("name"),
+                row.get("country"),
+                row.get("continentCode"),
+            )
+        )
+    for style, players in ranked.items():
+        rank_indexes.update(style, players)
+    invalidate_tags(
+        *{f"player:{row['steamid32']}" for row in updated},
+        *{f"style:{row['style']}" for row in updated},
+        *(["players"] if updated else []),
+    )
+
+    return outcomes
+
+
+def invalidate_style_points(style: int, steamids: list[str]):
+    """Drops what the new points of `steamids` in `style` made stale, the rank index of the style is read again
+    from `ck_playerrank` instead of moving every player\n
+    Called once after the chunks of a style were written without `invalidate`"""
+    if not steamids:
+        return
+
+    rank_indexes.reset(style)
+    invalidate_tags(
+        *{f"player:{steamid32}" for steamid32 in steamids}, f"style:{style}", "players"
+    )
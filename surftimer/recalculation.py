@@ -0,0 +1,414 @@
+"""Background recalculation of the points of every player in `ck_playerrank`\n
+A job ranks every map of a style once (`surftimer.ranking`), splits the players in chunks that are calculated by a pool
+of worker processes (`surftimer.points_engine`) and writes each chunk in one transaction with `updatePlayerRankPointsRows`.
+With Redis the progress of the jobs, their cancellation and the lock letting a single job run at a time are shared by
+every API worker (under `RECALCULATION.PREFIX`), without it jobs only live in the worker process that started them
+"""
+
+import multiprocessing, threading, time, uuid, redis
+import simplejson as json
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from sql import selectPrepared, selectQuery
+from globals import config, all_styles, redis_client
+from surftimer.points_engine import calculate_points_batch
+from surftimer.ranking import (
+    POINTS_COLUMNS,
+    updatePlayerRankPointsRows,
+    invalidate_style_points,
+)
+import surftimer.queries, surftimer.ranking
+
+# Same as the single player calculation in `refactored`
+POINTS_FOR_WRCP = 0
+
+jobs = {}
+_jobs_lock = threading.Lock()
+
+store = redis_client if config["REDIS"]["ENABLED"] == 1 else None
+PREFIX = config["RECALCULATION"].get("PREFIX", "surftimer:recalculation")
+# The running job renews its lock every `HEARTBEAT` seconds, the lock of a worker that died is freed after `LOCK_TIMEOUT`
+HEARTBEAT = 1
+LOCK_TIMEOUT = config["RECALCULATION"].get("LOCK_TIMEOUT", 30)
+# Ended jobs can still be looked up for a day
+JOB_EXPIRY = 86400
+
+# Renews (`ARGV[2]` milliseconds) or deletes the lock only if it is still held by the job
+_renew_script = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('PEXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+_release_script = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+_renew = None if store is None else store.register_script(_renew_script)
+_release = None if store is None else store.register_script(_release_script)
+
+
+def _chunk_columns(players: list, data: dict):
+    """Columns of all the completions of `players` for `calculate_points_batch`"""
+    columns = {
+        "players": len(players),
+        "maps_player": [],
+        "maps_rank": [],
+        "maps_total": [],
+        "maps_tier": [],
+        "bonuses_player": [],
+        "bonuses_rank": [],
+        "stages_player": [],
+        "stages_rank": [],
+        "points_for_wrcp": POINTS_FOR_WRCP,
+    }
+    empty = {"maps": [], "stages": [], "bonuses": []}
+
+    for index, player in enumerate(players):
+        completions = data.get(player["steamid"], empty)
+        for row in completions["maps"]:
+            columns["maps_player"].append(index)
+            columns["maps_rank"].append(row["rank"])
+            columns["maps_total"].append(row["total"])
+            columns["maps_tier"].append(row["tier"])
+        for row in completions["bonuses"]:
+            columns["bonuses_player"].append(index)
+            columns["bonuses_rank"].append(row["rank"])
+        for row in completions["stages"]:
+            columns["stages_player"].append(index)
+            columns["stages_rank"].append(row["rank"])
+
+    return columns
+
+
+def _rank_row(points: dict, index: int):
+    """Values of `POINTS_COLUMNS` for the player at `index` of a calculated chunk"""
+    return (
+        points["total"][index],
+        points["map_wr_points"][index],
+        points["wrb_points"][index],
+        points["wrcp_points"][index],
+        points["top10_points"][index],
+        points["group_points"][index],
+        points["map_points"][index],
+        points["bonus_points"][index],
+        points["finished_maps"][index],
+        points["finished_bonuses"][index],
+        points["finished_stages"][index],
+        points["world_records"][index],
+        # `wrbs` of the calculation counts map WRs as well
+        points["wrbs"][index] - points["world_records"][index],
+        points["wrcps"][index],
+        points["top10s"][index],
+        points["groups"][index],
+    )
+
+
+def update_player_points(
+    style: int, players: list, points: dict, invalidate: bool = True
+):
+    """Writes the calculated `points` of `players` in a single transaction, returns the steamids of the changed rows\n
+    Without `invalidate` their cached rankings are left to the caller"""
+    rows = [
+        {
+            "steamid32": player["steamid"],
+            "style": style,
+            **dict(zip(POINTS_COLUMNS, map(int, _rank_row(points, index)))),
+        }
+        for index, player in enumerate(players)
+    ]
+    outcomes = updatePlayerRankPointsRows(rows, len(rows), invalidate=invalidate)
+
+    return [row["steamid32"] for row in outcomes if row["outcome"] == "updated"]
+
+
+def recalculate_players(style: int, steamids: list[str]):
+    """Recalculates the points of `steamids` in `style` and writes the rows that changed in one batch\n
+    Returns the `points` difference of every changed player"""
+    placeholders = ", ".join(["%s"] * len(steamids))
+    current = {
+        row.pop("steamid"): tuple(row[column] for column in POINTS_COLUMNS)
+        for row in selectQuery(
+            surftimer.queries.sql_selectPlayersRankPoints.format(placeholders),
+            [style, *steamids],
+        )
+    }
+    # Players without a `ck_playerrank` row cannot be updated
+    players = [{"steamid": steamid32} for steamid32 in steamids if steamid32 in current]
+    if not players:
+        return {}
+
+    data = surftimer.ranking.players_point_calc_data(
+        style, [player["steamid"] for player in players]
+    )
+    points = calculate_points_batch(**_chunk_columns(players, data))
+
+    changed = []
+    deltas = {}
+    for index, player in enumerate(players):
+        row = tuple(int(value) for value in _rank_row(points, index))
+        before = current[player["steamid"]]
+        if row != before:
+            changed.append(index)
+            deltas[player["steamid"]] = row[0] - (before[0] or 0)
+
+    if changed:
+        update_player_points(
+            style,
+            [players[index] for index in changed],
+            {key: values[changed] for key, values in points.items()},
+        )
+
+    return deltas
+
+
+def recalculate_change(
+    mapname: str,
+    style: int,
+    zonegroup: int = None,
+    stage: int = None,
+    steamid32: str = None,
+):
+    """Recalculates the players affected by a new or improved time on a map, bonus (`zonegroup`) or `stage`\n
+    `steamid32` is the player who set the time, their completion counts change even when they are not ranked
+    high enough to get rank points"""
+    tic = time.perf_counter()
+
+    steamids = surftimer.ranking.affected_players(mapname, style, zonegroup, stage)
+    if steamid32 is not None and steamid32 not in steamids:
+        steamids.append(steamid32)
+
+    deltas = recalculate_players(style, steamids) if steamids else {}
+
+    print(
+        f"[Recalculation] {mapname} ({all_styles[style]}): {len(deltas)}/{len(steamids)} players changed in {time.perf_counter() - tic:0.4f}s"
+    )
+    return {"affected": len(steamids), "changed": len(deltas), "deltas": deltas}
+
+
+class RecalculationJob:
+    """Recalculates the points of all players in `styles`, started with `start` and stopped with `cancel`"""
+
+    def __init__(self, styles: list[int], workers: int, chunk_size: int):
+        self.id = uuid.uuid4().hex
+        self.styles = styles
+        self.workers = workers
+        self.chunk_size = chunk_size
+
+        self.status = "queued"
+        self.error = None
+        self.created = time.time()
+        self.finished = None
+        self.progress = {
+            style: {"players": 0, "calculated": 0, "updated": 0} for style in styles
+        }
+
+        self._started = None
+        self._ended = None
+        self._cancel = threading.Event()
+        self._done = threading.Event()
+
+    def start(self):
+        threading.Thread(
+            target=self._run, name=f"recalculation-{self.id}", daemon=True
+        ).start()
+        if store is not None:
+            threading.Thread(
+                target=self._share, name=f"recalculation-{self.id}-share", daemon=True
+            ).start()
+
+    def cancel(self):
+        """Stops the job after the chunks being written, chunks already written are kept"""
+        self._cancel.set()
+
+    @property
+    def active(self):
+        return self.status in ("queued", "loading", "running")
+
+    def _run(self):
+        self._started = time.monotonic()
+        try:
+            self.status = "loading"
+            players = {}
+            for style in self.styles:
+                players[style] = selectPrepared(
+                    surftimer.queries.sql_selectRecalculationPlayers, style=style
+                )
+                self.progress[style]["players"] = len(players[style])
+
+            self.status = "running"
+            with ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            ) as executor:
+                for style in self.styles:
+                    if self._cancel.is_set():
+                        break
+                    self._run_style(executor, style, players[style])
+
+            self.status = "cancelled" if self._cancel.is_set() else "finished"
+        except Exception as err:
+            self.status = "failed"
+            self.error = repr(err)
+            print(f"[Recalculation] Job {self.id} failed: {err!r}")
+        finally:
+            self._ended = time.monotonic()
+            self.finished = time.time()
+            self._done.set()
+
+    def _save(self):
+        store.set(f"{PREFIX}:job:{self.id}", json.dumps(self.stats()), ex=JOB_EXPIRY)
+
+    def _share(self):
+        """Writes the progress to Redis and renews the lock until the job ended, picks up cancels of other workers"""
+        lock = f"{PREFIX}:lock"
+        while True:
+            ended = self._done.wait(HEARTBEAT)
+            try:
+                if store.exists(f"{PREFIX}:cancel:{self.id}"):
+                    self._cancel.set()
+                self._save()
+                if ended:
+                    _release(keys=[lock], args=[self.id])
+                    return
+                _renew(keys=[lock], args=[self.id, int(LOCK_TIMEOUT * 1000)])
+            except redis.RedisError as err:
+                print(f"[Recalculation] Could not share job {self.id}: {err!r}")
+                if ended:
+                    return
+
+    def _run_style(self, executor: ProcessPoolExecutor, style: int, players: list):
+        tic = time.perf_counter()
+        data = surftimer.ranking.style_point_calc_data(style)
+
+        chunks = {}
+        for start in range(0, len(players), self.chunk_size):
+            chunk = players[start : start + self.chunk_size]
+            future = executor.submit(
+                calculate_points_batch, **_chunk_columns(chunk, data)
+            )
+            chunks[future] = chunk
+        del data
+
+        # Cached rankings are dropped once for the style instead of after every chunk
+        changed = []
+        try:
+            for future in as_completed(chunks):
+                if self._cancel.is_set():
+                    for pending in chunks:
+                        pending.cancel()
+                    return
+
+                chunk = chunks[future]
+                updated = update_player_points(
+                    style, chunk, future.result(), invalidate=False
+                )
+                changed += updated
+                self.progress[style]["calculated"] += len(chunk)
+                self.progress[style]["updated"] += len(updated)
+        finally:
+            invalidate_style_points(style, changed)
+
+        print(
+            f"[Recalculation] {all_styles[style]}: {len(players)} players in {time.perf_counter() - tic:0.4f}s"
+        )
+
+    def stats(self):
+        """Progress of the job with an ETA based on the players calculated so far"""
+        total = sum(style["players"] for style in self.progress.values())
+        calculated = sum(style["calculated"] for style in self.progress.values())
+
+        elapsed = None
+        eta = None
+        if self._started is not None:
+            elapsed = (self._ended or time.monotonic()) - self._started
+            if self.status == "running" and calculated > 0:
+                eta = elapsed / calculated * (total - calculated)
+
+        return {
+            "id": self.id,
+            "status": self.status,
+            "error": self.error,
+            "created": self.created,
+            "finished": self.finished,
+            "elapsed": elapsed,
+            "eta": eta,
+            "players": total,
+            "calculated": calculated,
+            "percent": round(calculated / total * 100, 2) if total else 0.0,
+            "styles": {
+                all_styles[style]: progress for style, progress in self.progress.items()
+            },
+        }
+
+
+def start_job(styles: list[int] = None):
+    """Starts a recalculation of `styles` (all of them by default)\n
+    Returns `None` if a job is already running, in any worker when Redis is enabled"""
+    with _jobs_lock:
+        if any(job.active for job in jobs.values()):
+            return None
+
+        job = RecalculationJob(
+            styles if styles is not None else list(range(len(all_styles))),
+            workers=config["RECALCULATION"]["WORKERS"],
+            chunk_size=config["RECALCULATION"]["CHUNK_SIZE"],
+        )
+        if store is not None:
+            if not store.set(
+                f"{PREFIX}:lock", job.id, nx=True, px=int(LOCK_TIMEOUT * 1000)
+            ):
+                return None
+            job._save()
+            store.set(f"{PREFIX}:latest", job.id, ex=JOB_EXPIRY)
+        jobs[job.id] = job
+
+    job.start()
+    return job
+
+
+def job_stats(job_id: str = None):
+    """`stats` of the job `job_id` (the latest one by default), `None` if it is unknown\n
+    Jobs of other workers are read from their last progress written to Redis"""
+    if store is None:
+        job = jobs.get(job_id) if job_id else next(reversed(jobs.values()), None)
+        return None if job is None else job.stats()
+
+    if job_id is None:
+        job_id = store.get(f"{PREFIX}:latest")
+        if job_id is None:
+            return None
+        job_id = job_id.decode("utf-8")
+
+    job = jobs.get(job_id)
+    if job is not None:
+        return job.stats()
+
+    stats = store.get(f"{PREFIX}:job:{job_id}")
+    return None if stats is None else json.loads(stats)
+
+
+def running_job():
+    """`stats` of the job currently running, `None` if there is none"""
+    job = next((job for job in list(jobs.values()) if job.active), None)
+    if job is not None:
+        return job.stats()
+    if store is None:
+        return None
+
+    job_id = store.get(f"{PREFIX}:lock")
+    return None if job_id is None else job_stats(job_id.decode("utf-8"))
+
+
+def cancel_job(job_id: str):
+    """Stops the job `job_id` in the worker running it, returns its `stats` or `None` if it is unknown"""
+    job = jobs.get(job_id)
+    if job is not None:
+        job.cancel()
+    elif store is not None and store.exists(f"{PREFIX}:job:{job_id}"):
+        store.set(f"{PREFIX}:cancel:{job_id}", 1, ex=JOB_EXPIRY)
+    else:
+        return None
+
+    return job_stats(job_id)
@@ -3,9 +3,19 @@ from fastapi.responses import JSONResponse
 from pydantic import BaseModel
 from decimal import Decimal
 import simplejson as json
-from sql import selectQuery, insertQuery
-from globals import set_cache, get_cache, all_styles
-import time, surftimer.queries, math
+from sql import selectQuery, insertQuery, selectQueryAsync, runAsync
+from globals import (
+    set_cache,
+    get_cache,
+    get_cache_stale,
+    cached_response,
+    singleflight,
+    revalidate,
+    all_styles,
+    config,
+)
+import asyncio, hashlib, time, surftimer.queries, surftimer.ranking, surftimer.recalculation
+from surftimer.points_engine import calculate_player_points
 
 
 class PlayerMapDataModel(BaseModel):
@@ -17,15 +27,108 @@ class PlayerMapDataModel(BaseModel):
     checkpoints_data: list  # `Checkpoints = Stages` for Personal Map Run Stage times on *Staged* maps
 
 
+class PlayersInitData(BaseModel):
+    """Body for loading the map data of every player on a server at once"""
+
+    mapname: str
+    steamids: list[str]
+
+
 router = APIRouter()
 
 
+async def _timed(timings: dict, section: str, awaitable):
+    """Awaits `awaitable` recording how long it took in `timings[section]`"""
+    tic = time.perf_counter()
+    result = await awaitable
+    timings[section] = time.perf_counter() - tic
+    return result
+
+
+async def _timed_select_in(timings: dict, section: str, query: str, params: list, steamids: list):
+    """Runs a `{}` template with an `IN` list of `steamids` after `params`, recording how long it took"""
+    sql = query.format(", ".join(["%s"] * len(steamids)))
+    return await _timed(timings, section, runAsync(selectQuery, sql, [*params, *steamids]))
+
+
+def _player_map_data(options_data: dict, points_data: list, bonus_data: list, bonus_ranks: list, checkpoints_data: list):
+    """Init data of a single player, `bonus_ranks` are the `zonegroup`/`rank` rows of `sql_selectInitBonusRankCounts`"""
+    # Ranks are the ones of the normal style, 0 when the player has no time in it
+    ranks = {row["zonegroup"]: row["rank"] for row in bonus_ranks}
+    for completion in bonus_data:
+        completion["rank"] = ranks.get(completion["zonegroup"], 0)
+
+    return {
+        "options_data": options_data,
+        "points_data": points_data,
+        "bonus_data": bonus_data,
+        "checkpoints_data": checkpoints_data,  # counts as personal map run stages for *Staged* maps - WRCP is different
+    }
+
+
+def _player_init_tags(steamid32: str, mapname: str):
+    return [
+        f"player:{steamid32}",
+        f"map:{mapname}",
+        "table:ck_playeroptions2",
+        "table:ck_playerrank",
+        "table:ck_bonus",
+        "table:ck_checkpoints",
+    ]
+
+
+def _group_by_steamid(rows: list, steamids: list, key: str = "steamid"):
+    """Splits `rows` by their `key` column, removed from the rows unless it is `steamid` (`points_data` keeps it)"""
+    grouped = {steamid32: [] for steamid32 in steamids}
+    for row in rows:
+        steamid32 = row[key] if key == "steamid" else row.pop(key)
+        grouped.setdefault(steamid32, []).append(row)
+
+    return grouped
+
+
+async def _select_players_init_data(timings: dict, steamids: list, mapname: str):
+    """Init data of every player of `steamids` with options, keyed by steamid\n
+    Loaded with a single `IN (...)` query per section for both `getPlayerInitData` and `getPlayersInitData`, so the
+    payload cached under a player's key is the same whichever endpoint filled it"""
+    options_data, points_data, bonus_data, bonus_ranks, checkpoints_data = await asyncio.gather(
+        _timed_select_in(timings, "options", surftimer.queries.sql_selectInitPlayerOptions, [], steamids),
+        _timed_select_in(timings, "points", surftimer.queries.sql_selectInitRankedPlayers, [], steamids),
+        _timed_select_in(timings, "bonus", surftimer.queries.sql_selectInitBonusRecords, [mapname], steamids),
+        _timed_select_in(timings, "bonus_ranks", surftimer.queries.sql_selectInitBonusRankCounts, [mapname], steamids),
+        _timed_select_in(timings, "checkpoints", surftimer.queries.sql_selectInitCheckpointsData, [mapname], steamids),
+    )
+
+    options_data = {row.pop("init_steamid"): row for row in options_data}
+    points_data = _group_by_steamid(points_data, steamids)
+    bonus_data = _group_by_steamid(bonus_data, steamids, key="init_steamid")
+    bonus_ranks = _group_by_steamid(bonus_ranks, steamids, key="init_steamid")
+    checkpoints_data = _group_by_steamid(checkpoints_data, steamids, key="init_steamid")
+
+    return {
+        steamid32: _player_map_data(
+            options_data[steamid32],
+            points_data[steamid32],
+            bonus_data[steamid32],
+            bonus_ranks[steamid32],
+            checkpoints_data[steamid32],
+        )
+        for steamid32 in steamids
+        if steamid32 in options_data
+    }
+
+
+def _server_timing(timings: dict):
+    """`Server-Timing` header value for `timings` in seconds"""
+    return ", ".join(f"{section};dur={duration * 1000:0.2f}" for section, duration in timings.items())
+
+
 @router.get(
     "/surftimer/getPlayerInitData",
     name="Player map data",
     tags=["Refactored"],
 )
-def getPlayerInitData(
+async def getPlayerInitData(
     request: Request,
     response: Response,
     steamid32: str,
@@ -38,68 +141,100 @@ def getPlayerInitData(
     ```char sql_selectPlayerRankBonusCount[] = ....```\n
     ```char sql_selectStageTimes[] = ....```\n
     ```char sql_selectStageAttempts[] = ....```\n
-    and maybe more to output a single object with player data"""
+    and maybe more to output a single object with player data\n
+    The queries run concurrently and the ranks of every bonus come from a single query, the time taken by each
+    one is sent in the `Server-Timing` header"""
     tic = time.perf_counter()
+    timings = {}
 
     # Check if data is cached in Redis
     cache_key = f"getPlayerInitData:{steamid32}-{mapname}"
     cached_data = get_cache(cache_key)
 
     if cached_data is not None:
-        print(f"[Redis] Loaded '{cache_key}' ({time.perf_counter() - tic:0.4f}s)")
-        response.headers["content-type"] = "application/json"
-        response.status_code = status.HTTP_200_OK
-        response.body = json.loads(cached_data, use_decimal=True, parse_nan=True)
+        timings["cache"] = time.perf_counter() - tic
+        print(f"[Redis] Loaded '{cache_key}' ({timings['cache']:0.4f}s)")
+        response = cached_response(cached_data)
+        response.headers["Server-Timing"] = _server_timing(timings)
         return response
 
-    options_data = selectQuery(
-        surftimer.queries.sql_selectPlayerOptions.format(steamid32)
-    )
+    PlayerMapData = (await _select_players_init_data(timings, [steamid32], mapname)).get(steamid32)
 
-    if not options_data:
+    if PlayerMapData is None:
         response.headers["content-type"] = "application/json"
+        response.headers["Server-Timing"] = _server_timing(timings)
         response.status_code = status.HTTP_204_NO_CONTENT
         return response
 
-    points_data = selectQuery(
-        surftimer.queries.sql_selectRankedPlayer.format(steamid32)
-    )
-
-    bonus_data = selectQuery(
-        surftimer.queries.sql_selectPersonalBonusRecords.format(steamid32, mapname)
-    )
+    toc = time.perf_counter()
+    timings["total"] = toc - tic
+    print(f"Execution time {toc - tic:0.4f} ({_server_timing(timings)})")
 
-    for completion in bonus_data:
-        zonegroup = completion["zonegroup"]
-        rank_query = selectQuery(
-            surftimer.queries.sql_selectPlayerRankBonusCount.format(
-                steamid32,
-                mapname,
-                zonegroup,
-                mapname,
-                zonegroup,
-            )
-        )
-        completion["rank"] = rank_query.pop()["COUNT(steamid)"]
+    # Cache the data in Redis
+    cached_data = set_cache(cache_key, PlayerMapData, tags=_player_init_tags(steamid32, mapname))
 
-    checkpoints_data = selectQuery(
-        surftimer.queries.sql_selectCheckpointsData.format(mapname, steamid32)
-    )
+    response = cached_response(cached_data)
+    response.headers["Server-Timing"] = _server_timing(timings)
+    return response
 
-    toc = time.perf_counter()
-    print(f"Execution time {toc - tic:0.4f}")
 
-    PlayerMapData = {
-        "options_data": options_data.pop(),
-        "points_data": points_data,
-        "bonus_data": bonus_data,
-        "checkpoints_data": checkpoints_data,  # counts as personal map run stages for *Staged* maps - WRCP is different
-    }
+@router.post(
+    "/surftimer/getPlayersInitData",
+    name="Players map data",
+    tags=["Refactored"],
+)
+async def getPlayersInitData(
+    request: Request,
+    response: Response,
+    data: PlayersInitData,
+):
+    """`getPlayerInitData` for every player of a server at once, used on map change\n
+    Players that are not cached are loaded with a single `IN (...)` query per section and cached one by one under
+    the same keys as `getPlayerInitData`. Returns `players` keyed by steamid and the `missing` players without
+    options"""
+    tic = time.perf_counter()
+    timings = {}
+    steamids = list(dict.fromkeys(data.steamids))
+
+    # Cached players are sent as they are, their payload is never decoded
+    cached = {}
+    for steamid32 in steamids:
+        cached_data = get_cache(f"getPlayerInitData:{steamid32}-{data.mapname}")
+        if cached_data is not None:
+            cached[steamid32] = cached_data
+    timings["cache"] = time.perf_counter() - tic
+
+    missing = []
+    uncached = [steamid32 for steamid32 in steamids if steamid32 not in cached]
+    if uncached:
+        players = await _select_players_init_data(timings, uncached, data.mapname)
+        for steamid32 in uncached:
+            if steamid32 not in players:
+                missing.append(steamid32)
+                continue
+
+            cached[steamid32] = set_cache(
+                f"getPlayerInitData:{steamid32}-{data.mapname}",
+                players[steamid32],
+                tags=_player_init_tags(steamid32, data.mapname),
+            )
 
-    # Cache the data in Redis
-    set_cache(cache_key, PlayerMapData)
+    toc = time.perf_counter()
+    timings["total"] = toc - tic
+    print(
+        f"Execution time {toc - tic:0.4f} ({len(steamids) - len(uncached)}/{len(steamids)} cached, {_server_timing(timings)})"
+    )
 
-    return PlayerMapData
+    players = b", ".join(
+        json.dumps(steamid32).encode("utf-8") + b": " + cached[steamid32]
+        for steamid32 in steamids
+        if steamid32 in cached
+    )
+    response = cached_response(
+        b'{"players": {' + players + b'}, "missing": ' + json.dumps(missing).encode("utf-8") + b"}"
+    )
+    response.headers["Server-Timing"] = _server_timing(timings)
+    return response
 
 
 @router.get(
@@ -107,62 +242,179 @@ def getPlayerInitData(
     name="Map data",
     tags=["Refactored"],
 )
-def getMapInitData(
+async def getMapInitData(
     request: Request,
     response: Response,
     mapname: str,
 ):
     """combines the following:\n
     ```char sql_selectMapRecord[] = ....```\n
-    and maybe more to output a single object with **map** data"""
+    and maybe more to output a single object with **map** data\n
+    Identical requests arriving while it is not cached wait for the first one instead of querying as well, once
+    expired it is still sent up to `REDIS.STALE_EXPIRY` while it is refreshed in the background"""
     tic = time.perf_counter()
 
-    # Check if data is cached in Redis
     cache_key = f"getMapInitData:{mapname}"
-    cached_data = get_cache(cache_key)
 
-    if cached_data is not None:
-        print(f"[Redis] Loaded '{cache_key}' ({time.perf_counter() - tic:0.4f}s)")
-        response.headers["content-type"] = "application/json"
-        response.status_code = status.HTTP_200_OK
-        response.body = json.loads(cached_data, use_decimal=True, parse_nan=True)
-        return response
+    async def compute():
+        map_record_runs_data = await selectQueryAsync(
+            surftimer.queries.sql_selectMapRecordsNew.format(mapname, mapname)
+        )
 
-    map_record_runs_data = selectQuery(
-        surftimer.queries.sql_selectMapRecordsNew.format(mapname, mapname)
-    )
+        # if not map_record_runs_data:
+        #     response.headers["content-type"] = "application/json"
+        #     response.status_code = status.HTTP_204_NO_CONTENT
+        #     return response
+        # total_bonuses = surftimer.queries.sql_selectBonusCount.format(mapname)
+        map_bonus_data = await selectQueryAsync(
+            surftimer.queries.sql_selectBonusData.format(mapname, mapname)
+        )
 
-    # if not map_record_runs_data:
-    #     response.headers["content-type"] = "application/json"
-    #     response.status_code = status.HTTP_204_NO_CONTENT
-    #     return response
-    # total_bonuses = surftimer.queries.sql_selectBonusCount.format(mapname)
-    map_bonus_data = selectQuery(
-        surftimer.queries.sql_selectBonusData.format(mapname, mapname)
-    )
+        # bonus_data = selectPrepared(
+        #     surftimer.queries.sql_selectPersonalBonusRecords,
+        #     steamid=steamid32,
+        #     mapname=mapname,
+        # )
+
+        # checkpoints_data = selectPrepared(
+        #     surftimer.queries.sql_selectCheckpointsData,
+        #     mapname=mapname,
+        #     steamid=steamid32,
+        # )
+
+        MapData = {
+            "map_record_runs_data": map_record_runs_data,
+            "map_bonus_data": map_bonus_data,
+            # "bonus_data": bonus_data,
+            # "checkpoints_data": checkpoints_data,  # counts as personal map run stages for *Staged* maps
+        }
+
+        # Cache the data in Redis
+        return set_cache(
+            cache_key,
+            MapData,
+            tags=[f"map:{mapname}", "table:ck_bonus"],
+            expiry=config["REDIS"]["EXPIRY"],
+            stale_after=config["REDIS"]["EXPIRY"],
+        )
 
-    # bonus_data = selectQuery(
-    #     surftimer.queries.sql_selectPersonalBonusRecords.format(steamid32, mapname)
-    # )
+    # Check if data is cached in Redis, stale data is sent while it is refreshed in the background
+    cached_data, fresh = get_cache_stale(cache_key)
 
-    # checkpoints_data = selectQuery(
-    #     surftimer.queries.sql_selectCheckpointsData.format(mapname, steamid32)
-    # )
+    if cached_data is not None:
+        if not fresh:
+            revalidate(cache_key, compute)
+        print(f"[Redis] Loaded '{cache_key}' ({time.perf_counter() - tic:0.4f}s)")
+        return cached_response(cached_data)
+
+    # Servers loading the same map share a single set of queries
+    cached_data = await singleflight(cache_key, compute)
 
     toc = time.perf_counter()
     print(f"Execution time {toc - tic:0.4f}")
 
-    MapData = {
-        "map_record_runs_data": map_record_runs_data,
-        "map_bonus_data": map_bonus_data,
-        # "bonus_data": bonus_data,
-        # "checkpoints_data": checkpoints_data,  # counts as personal map run stages for *Staged* maps
-    }
+    return cached_response(cached_data)
 
-    # Cache the data in Redis
-    set_cache(cache_key, MapData)
 
-    return MapData
+@router.get(
+    "/surftimer/getMapBundle",
+    name="Map bundle",
+    tags=["Refactored"],
+)
+async def getMapBundle(
+    request: Request,
+    response: Response,
+    mapname: str,
+):
+    """Everything a server loads on map change in 1 response:\n
+    ```char sql_selectMapZones[] = ....```\n
+    ```char sql_selectSpawnLocations[] = ....```\n
+    ```char sql_selectMapTier[] = ....```\n
+    ```char sql_selectMapRecord[] = ....```\n
+    ```char sql_selectBonusCount[] = ....```\n
+    ```char sql_selectReplayCPTicksAll[] = ....``` for all styles\n
+    Cached per map and rebuilt on the next request after any of those tables change for the map, once expired it is
+    still sent up to `REDIS.STALE_EXPIRY` while it is refreshed in the background. The `ETag` is a hash of the
+    bundle, a matching `If-None-Match` gets an empty `304`"""
+    tic = time.perf_counter()
+    timings = {}
+
+    cache_key = f"getMapBundle:{mapname}"
+
+    async def compute():
+        zones, spawn_locations, tier, record_runs, bonus_count, bonus_data, replay_cp_ticks = await asyncio.gather(
+            _timed(timings, "zones", selectQueryAsync(surftimer.queries.sql_selectMapZones.format(mapname))),
+            _timed(
+                timings,
+                "spawn_locations",
+                selectQueryAsync(surftimer.queries.sql_selectSpawnLocations.format(mapname)),
+            ),
+            _timed(timings, "tier", selectQueryAsync(surftimer.queries.sql_selectMapTier.format(mapname))),
+            _timed(
+                timings,
+                "record_runs",
+                selectQueryAsync(surftimer.queries.sql_selectMapRecordsNew.format(mapname, mapname)),
+            ),
+            _timed(
+                timings, "bonus_count", selectQueryAsync(surftimer.queries.sql_selectBonusCount.format(mapname))
+            ),
+            _timed(
+                timings,
+                "bonus_data",
+                selectQueryAsync(surftimer.queries.sql_selectBonusData.format(mapname, mapname)),
+            ),
+            _timed(
+                timings,
+                "replay_cp_ticks",
+                selectQueryAsync(surftimer.queries.sql_selectReplayCPTicksAllStyles.format(mapname)),
+            ),
+        )
+
+        MapBundle = {
+            "mapname": mapname,
+            "zones": zones,
+            "spawn_locations": spawn_locations,
+            "tier": tier[0] if tier else None,  # tier, ranked and mapper
+            "map_record_runs_data": record_runs,
+            "bonus_count": bonus_count,
+            "map_bonus_data": bonus_data,
+            "replay_cp_ticks": replay_cp_ticks,  # every style, ordered by style and cp
+        }
+
+        # Record runs come from `ck_playertimes` which the API does not write to, so the bundle still expires
+        return set_cache(
+            cache_key,
+            MapBundle,
+            tags=[f"map:{mapname}", "table:ck_bonus"],
+            expiry=config["REDIS"]["EXPIRY"],
+            stale_after=config["REDIS"]["EXPIRY"],
+        )
+
+    # Check if data is cached in Redis, stale data is sent while it is refreshed in the background
+    cached_data, fresh = get_cache_stale(cache_key)
+
+    if cached_data is not None:
+        if not fresh:
+            revalidate(cache_key, compute)
+        timings["cache"] = time.perf_counter() - tic
+        print(f"[Redis] Loaded '{cache_key}' ({timings['cache']:0.4f}s)")
+    else:
+        # Servers loading the same map share a single set of queries
+        cached_data = await singleflight(cache_key, compute)
+
+    etag = f'"{hashlib.blake2b(cached_data, digest_size=16).hexdigest()}"'
+
+    toc = time.perf_counter()
+    timings["total"] = toc - tic
+    print(f"Execution time {toc - tic:0.4f} ({_server_timing(timings)})")
+
+    if etag in request.headers.get("if-none-match", ""):
+        response = Response(status_code=status.HTTP_304_NOT_MODIFIED)
+    else:
+        response = cached_response(cached_data)
+    response.headers["ETag"] = etag
+    response.headers["Server-Timing"] = _server_timing(timings)
+    return response
 
 
 @router.get(
@@ -173,52 +425,71 @@ def getMapInitData(
 def internalRecalculation(
     request: Request,
     response: Response,
+    style: int = None,
 ):
-    """combines all the logic and queries used for player points calculation inside API:\n
+    """Starts a background job recalculating the points of every player in `ck_playerrank` for all styles (or only `style`)\n
+    Replaces the calculation done with:\n
     ```char sql_selectRankedPlayers[] = ....```\n
     ```char sql_stray_point_calc_playerRankName[] = ....```\n
-    and maybe more to output a single object with **map** data"""
+    Progress can be followed with `recalculationStatus`, only one job can run at a time"""
     tic = time.perf_counter()
 
-    initiate_points_calculation(0)
+    if style is not None and not 0 <= style < len(all_styles):
+        response.status_code = status.HTTP_422_UNPROCESSABLE_ENTITY
+        return {"message": "Invalid style"}
+
+    job = surftimer.recalculation.start_job(None if style is None else [style])
+    if job is None:
+        response.status_code = status.HTTP_409_CONFLICT
+        # The running job may have ended in between
+        return surftimer.recalculation.running_job() or {"message": "A recalculation job is already running"}
 
     toc = time.perf_counter()
     print(f"Execution time {toc - tic:0.4f}")
-    return {"data": "Started recalculation"}
-
-
-def initiate_points_calculation(style: int):
-    top_list = selectQuery(surftimer.queries.sql_selectRankedPlayers)
-    idx = 0
-    # with open("_recalc.json") as r:
-    #     calc_log = json.load(r)
-
-    for player in top_list:
-        if idx == 1:
-            break
-
-        if style != 0:
-            # Player Name for the selected Style
-            select_name_query = selectQuery(
-                surftimer.queries.sql_stray_point_calc_playerRankName.format(
-                    steamid32, style
-                )
-            ).pop()
-            name = select_name_query.pop() if select_name_query else name
-        else:
-            name = player["name"]
 
-        steamid32 = player["steamid"]
-        print(f"{name} - {steamid32}")
-        player["calc_data"] = get_player_data_for_calculation(steamid32, style, name)
+    response.status_code = status.HTTP_202_ACCEPTED
+    return job.stats()
 
-        idx = idx + 1
 
-        # # Calculation Log
-        # calc_log.append(player)
+@router.get(
+    "/surftimer/recalculationStatus",
+    name="Recalculation status",
+    tags=["Refactored", "Points Calculation"],
+)
+def recalculationStatus(
+    request: Request,
+    response: Response,
+    job_id: str = None,
+):
+    """Progress and ETA of a recalculation job (the latest one by default), started by any worker"""
+    stats = surftimer.recalculation.job_stats(job_id)
+
+    if stats is None:
+        response.status_code = status.HTTP_404_NOT_FOUND
+        return {"message": "Job not found"}
+
+    return stats
+
+
+@router.delete(
+    "/surftimer/cancelRecalculation",
+    name="Cancel recalculation",
+    tags=["Refactored", "Points Calculation"],
+)
+def cancelRecalculation(
+    request: Request,
+    response: Response,
+    job_id: str,
+):
+    """Stops a running recalculation job, players already written keep their new points\n
+    A job running in another worker stops within a second"""
+    stats = surftimer.recalculation.cancel_job(job_id)
+
+    if stats is None:
+        response.status_code = status.HTTP_404_NOT_FOUND
+        return {"message": "Job not found"}
 
-        # with open("_recalc.json", "w") as json_file:
-        #     json.dump(calc_log, json_file, indent=4, separators=(",", ": "))
+    return stats
 
 
 def get_player_data_for_calculation(steamid32: str, style: int, name: str):
@@ -238,32 +509,11 @@ def get_player_data_for_calculation(steamid32: str, style: int, name: str):
         else:
             name = player_name_query.pop()["name"]
 
-    ## Bonuses
-    finished_bonuses_query = selectQuery(
-        surftimer.queries.sql_stray_point_calc_countFinishedBonus.format(
-            style, style, steamid32, style
-        )
-    )
-
-    ## Stages
-    finished_stages_query = selectQuery(
-        surftimer.queries.sql_stray_point_calc_finishedStages.format(steamid32, style)
-    )
-
-    ## Maps
-    finished_maps_query = selectQuery(
-        surftimer.queries.sql_stray_point_calc_finishedMaps.format(
-            style, style, steamid32, style
-        )
-    )
-
-    # Create the JSON output
+    # Maps, stages and bonuses with their ranks
     output = {
         # **player_name_query,  # Replace with your desired name
         "name": name,
-        "maps": finished_maps_query,
-        "stages": finished_stages_query,
-        "bonuses": finished_bonuses_query,
+        **surftimer.ranking.player_point_calc_data(steamid32, style),
     }
     output["calculated"] = calculate_points(output, 0)
 
@@ -274,301 +524,9 @@ def get_player_data_for_calculation(steamid32: str, style: int, name: str):
 
 
 def calculate_points(player_data: dict[str, list], points_for_wrcp: int):
-    # print("hi")
-    total_points = 0
-    top_10_maps = 0
-    g_GroupMaps = 0
-    world_records = 0
-    wrcps = 0
-    wrbs = 0
-    wrb_points = 0
-    wrcp_points = 0
-    wr_points = 0
-
-    finished_stages = len(player_data["stages"])
-    wrcps = 0
-    # Calculate points from stages - World Record Stage Times
-    for stage_completion in player_data["stages"]:
-        if stage_completion["rank"] == 1:
-            wrcps += 1
-            total_points += points_for_wrcp
-    wrcp_points = total_points
-
-    finished_bonuses = len(player_data["bonuses"])
-    wrbs = 0
-    # Calculate points from Bonuses
-    for bonus_completion in player_data["bonuses"]:
-        if bonus_completion["rank"] == 1:
-            wrbs = wrbs + 1
-            total_points = total_points + 250
-            wrb_points += 250
-        elif bonus_completion["rank"] == 2:
-            total_points = total_points + 235
-        elif bonus_completion["rank"] == 3:
-            total_points = total_points + 220
-        elif bonus_completion["rank"] == 4:
-            total_points = total_points + 205
-        elif bonus_completion["rank"] == 5:
-            total_points = total_points + 190
-        elif bonus_completion["rank"] == 6:
-            total_points = total_points + 175
-        elif bonus_completion["rank"] == 7:
-            total_points = total_points + 160
-        elif bonus_completion["rank"] == 8:
-            total_points = total_points + 145
-        elif bonus_completion["rank"] == 9:
-            total_points = total_points + 130
-        elif bonus_completion["rank"] == 10:
-            total_points = total_points + 100
-        elif bonus_completion["rank"] == 11:
-            total_points = total_points + 95
-        elif bonus_completion["rank"] == 12:
-            total_points = total_points + 90
-        elif bonus_completion["rank"] == 13:
-            total_points = total_points + 80
-        elif bonus_completion["rank"] == 14:
-            total_points = total_points + 70
-        elif bonus_completion["rank"] == 15:
-            total_points = total_points + 60
-        elif bonus_completion["rank"] == 16:
-            total_points = total_points + 50
-        elif bonus_completion["rank"] == 17:
-            total_points = total_points + 40
-        elif bonus_completion["rank"] == 18:
-            total_points = total_points + 30
-        elif bonus_completion["rank"] == 19:
-            total_points = total_points + 20
-        elif bonus_completion["rank"] == 20:
-            total_points = total_points + 10
-        elif bonus_completion["rank"] > 20:
-            total_points = total_points + 5
-
-    finished_maps = len(player_data["maps"])
-    # ----------  KSF Points System  ----------#
-    g_Group1Pc = 0.03125
-    g_Group2Pc = 0.0625
-    g_Group3Pc = 0.125
-    g_Group4Pc = 0.25
-    g_Group5Pc = 0.5
-    g1bot = 11
-    # Calculate points from Maps
-    for maps_completion in player_data["maps"]:
-        totalplayers = maps_completion["total"]
-        rank = maps_completion["rank"]
-        tier = maps_completion["tier"]
-
-        if maps_completion["rank"] == 1:
-            wrbs = wrbs + 1
-
-        # Group 1
-        fG1top = float(totalplayers) * g_Group1Pc
-        fG1top += 11.0
-        g1top = math.ceil(fG1top)
-
-        g1difference = g1top - g1bot
-        if g1difference < 4:
-            g1top = g1bot + 4
-
-        # Group 2
-        g2bot = g1top + 1
-        fG2top = float(totalplayers) * g_Group2Pc
-        fG2top += 11.0
-        g2top = math.ceil(fG2top)
-
-        g2difference = g2top - g2bot
-        if g2difference < 4:
-            g2top = g2bot + 4
-
-        # Group 3
-        g3bot = g2top + 1
-        fG3top = float(totalplayers) * g_Group3Pc
-        fG3top += 11.0
-        g3top = math.ceil(fG3top)
-
-        g3difference = g3top - g3bot
-        if g3difference < 4:
-            g3top = g3bot + 4
-
-        # Group 4
-        g4bot = g3top + 1
-        fG4top = float(totalplayers) * g_Group4Pc
-        fG4top += 11.0
-        g4top = math.ceil(fG4top)
-
-        g4difference = g4top - g4bot
-        if g4difference < 4:
-            g4top = g4bot + 4
-
-        # Group 5
-        g5bot = g4top + 1
-        fG5top = float(totalplayers) * g_Group5Pc
-        fG5top += 11.0
-        g5top = math.ceil(fG5top)
-
-        g5difference = g5top - g5bot
-        if g5difference < 4:
-            g5top = g5bot + 4
-
-        if tier == 1:
-            wr_points = (float(totalplayers) * 1.75) / 6
-            wr_points += 58.5
-            if wr_points < 250.0:
-                wr_points = 250.0
-        elif tier == 2:
-            wr_points = (float(totalplayers) * 2.8) / 5
-            wr_points += 82.15
-            if wr_points < 500.0:
-                wr_points = 500.0
-        elif tier == 3:
-            wr_points = (float(totalplayers) * 3.5) / 4
-            if wr_points < 750.0:
-                wr_points = 750.0
-            else:
-                wr_points += 117
-        elif tier == 4:
-            wr_points = (float(totalplayers) * 5.74) / 4
-            if wr_points < 1000.0:
-                wr_points = 1000.0
-            else:
-                wr_points += 164.25
-        elif tier == 5:
-            wr_points = (float(totalplayers) * 7) / 4
-            if wr_points < 1250.0:
-                wr_points = 1250.0
-            else:
-                wr_points += 234
-        elif tier == 6:
-            wr_points = (float(totalplayers) * 14) / 4
-            if wr_points < 1500.0:
-                wr_points = 1500.0
-            else:
-                wr_points += 328
-        elif tier == 7:
-            wr_points = (float(totalplayers) * 21) / 4
-            if wr_points < 1750.0:
-                wr_points = 1750.0
-            else:
-                wr_points += 420
-        elif tier == 8:
-            wr_points = (float(totalplayers) * 30) / 4
-            if wr_points < 2000.0:
-                wr_points = 2000.0
-            else:
-                wr_points += 560
-        else:  # no tier set
-            wr_points = 25.0
-
-        iwrpoints = math.ceil(wr_points)
-
-        # Top 10 Points
-        if rank < 11:
-            top_10_maps += 1
-            if rank == 1:
-                total_points += iwrpoints
-                world_records += 1
-            elif rank == 2:
-                points = 0.80 * iwrpoints
-                total_points += math.ceil(points)
-            elif rank == 3:
-                points = 0.75 * iwrpoints
-                total_points += math.ceil(points)
-            elif rank == 4:
-                points = 0.70 * iwrpoints
-                total_points += math.ceil(points)
-            elif rank == 5:
-                points = 0.65 * iwrpoints
-                total_points += math.ceil(points)
-            elif rank == 6:
-                points = 0.60 * iwrpoints
-                total_points += math.ceil(points)
-            elif rank == 7:
-                points = 0.55 * iwrpoints
-                total_points += math.ceil(points)
-            elif rank == 8:
-                points = 0.50 * iwrpoints
-                total_points += math.ceil(points)
-            elif rank == 9:
-                points = 0.45 * iwrpoints
-                total_points += math.ceil(points)
-            elif rank == 10:
-                points = 0.40 * iwrpoints
-                total_points += math.ceil(points)
-        elif rank > 10 and rank <= g5top:
-            # Group 1-5 Points
-            g_GroupMaps += 1
-
-            # Calculate Group Points
-            g1points = iwrpoints * 0.25
-            g2points = g1points / 1.5
-            g3points = g2points / 1.5
-            g4points = g3points / 1.5
-            g5points = g4points / 1.5
-
-            if rank >= g1bot and rank <= g1top:  # Group 1
-                total_points += math.ceil(g1points)
-                # g_Points[client][style][2] += math.ceil(g1points)
-            elif rank >= g2bot and rank <= g2top:  # Group 2
-                total_points += math.ceil(g2points)
-                # g_Points[client][style][2] += math.ceil(g2points)
-            elif rank >= g3bot and rank <= g3top:  # Group 3
-                total_points += math.ceil(g3points)
-                # g_Points[client][style][2] += math.ceil(g3points)
-            elif rank >= g4bot and rank <= g4top:  # Group 4
-                total_points += math.ceil(g4points)
-                # g_Points[client][style][2] += math.ceil(g4points)
-            elif rank >= g5bot and rank <= g5top:  # Group 5
-                total_points += math.ceil(g5points)
-                # g_Points[client][style][2] += math.ceil(g5points)
-
-        if tier == 1:
-            total_points += 25
-            # g_Points[client][style][0] += 25
-        elif tier == 2:
-            total_points += 50
-            # g_Points[client][style][0] += 50
-        elif tier == 3:
-            total_points += 100
-            # g_Points[client][style][0] += 100
-        elif tier == 4:
-            total_points += 200
-            # g_Points[client][style][0] += 200
-        elif tier == 5:
-            total_points += 400
-            # g_Points[client][style][0] += 400
-        elif tier == 6:
-            total_points += 600
-            # g_Points[client][style][0] += 600
-        elif tier == 7:
-            total_points += 800
-            # g_Points[client][style][0] += 800
-        elif tier == 8:
-            total_points += 1000
-            # g_Points[client][style][0] += 1000
-        else:  # no tier
-            total_points += 13
-            # g_Points[client][style][0] += 13
-
-    output = {
-        "total": total_points,
-        "finished_stages": finished_stages,
-        "finished_maps": finished_maps,
-        "finished_bonuses": finished_bonuses,
-        "wrb_points": wrb_points,
-        "wrbs": wrbs,
-        "wrcp_points": wrcp_points,
-        "wrcps": wrcps,
-        "wr_points": wr_points,
-        "world_records": world_records,
-        "g1points": g1points,
-        "g2points": g2points,
-        "g3points": g3points,
-        "g4points": g4points,
-        "g5points": g5points,
-    }
+    """Calculates the points of a player from their `maps`, `bonuses` and `stages` completions\n
+    Done in `surftimer.points_engine` which can also process many players in a single batch"""
+    output = calculate_player_points(player_data, points_for_wrcp)
 
     print(output)
-    # print(
-    #     f"total: {total_points} | bonuses comp: {finished_bonuses} | wrbpoints: {wrb_points} | wrbs: {wrbs} | stages comp: {finished_stages} | wrcppoints: {wrcp_points} | wrcps: {wrcps} | maps comp: {finished_maps} | wrpoints: {wr_points} | world records: {world_records} | g1: {g1points}  | g2: {g2points} | g3: {g3points} | g4: {g4points} | g5: {g5points}"
-    # )
-
     return output
@@ -0,0 +1,90 @@
+"""`surftimer.points_engine` has to give exactly the points of the scalar loop it replaced, number types included"""
+
+import random
+
+import numpy as np
+
+from surftimer.points_engine import calculate_player_points, calculate_points_batch
+from tests.points_reference import calculate_points
+
+PLAYERS = 2000
+POINTS_FOR_WRCP = 700
+# Tiers outside 1-8 (and `NULL`) get the "no tier" points
+TIERS = [None, 0, 1, 2, 3, 4, 5, 6, 7, 8, 9]
+
+
+def random_map(rng: random.Random, rank: int = None):
+    total = rng.choice([1, 5, 20, 100, 1000]) + rng.randrange(0, 5000)
+    return {
+        "rank": rank if rank is not None else rng.randint(1, total),
+        "total": total,
+        "tier": rng.choice(TIERS),
+    }
+
+
+def random_player(rng: random.Random):
+    maps = [random_map(rng) for _ in range(rng.randrange(0, 60))]
+    # The loop only sets `g*points` after a group completion, every player needs one
+    maps.insert(
+        rng.randrange(0, len(maps) + 1), random_map(rng, rank=rng.randint(11, 15))
+    )
+    return {
+        "maps": maps,
+        "bonuses": [{"rank": rng.randint(1, 40)} for _ in range(rng.randrange(0, 20))],
+        "stages": [{"rank": rng.randint(1, 10)} for _ in range(rng.randrange(0, 30))],
+    }
+
+
+def assert_identical(expected: dict, output: dict):
+    for key, value in expected.items():
+        assert output[key] == value, key
+        assert type(output[key]) is type(value), key
+
+
+def test_single_player_matches_loop():
+    rng = random.Random(9)
+    for _ in range(PLAYERS):
+        player = random_player(rng)
+        assert_identical(
+            calculate_points(player, POINTS_FOR_WRCP),
+            calculate_player_points(player, POINTS_FOR_WRCP),
+        )
+
+
+def test_batch_matches_loop():
+    rng = random.Random(10)
+    players = [random_player(rng) for _ in range(PLAYERS)]
+
+    columns = {"maps": ([], []), "bonuses": ([], []), "stages": ([], [])}
+    for index, player in enumerate(players):
+        for kind, (owner, rows) in columns.items():
+            owner += [index] * len(player[kind])
+            rows += player[kind]
+
+    batch = calculate_points_batch(
+        players=len(players),
+        maps_player=columns["maps"][0],
+        maps_rank=[row["rank"] for row in columns["maps"][1]],
+        maps_total=[row["total"] for row in columns["maps"][1]],
+        maps_tier=[row["tier"] for row in columns["maps"][1]],
+        bonuses_player=columns["bonuses"][0],
+        bonuses_rank=[row["rank"] for row in columns["bonuses"][1]],
+        stages_player=columns["stages"][0],
+        stages_rank=[row["rank"] for row in columns["stages"][1]],
+        points_for_wrcp=POINTS_FOR_WRCP,
+    )
+
+    for index, player in enumerate(players):
+        expected = calculate_points(player, POINTS_FOR_WRCP)
+        for key, value in expected.items():
+            assert isinstance(batch[key], np.ndarray), key
+            assert batch[key][index].item() == value, (index, key)
+            assert type(batch[key][index].item()) is type(value), (index, key)
+
+
+def test_no_maps_keeps_initial_wr_points():
+    rng = random.Random(11)
+    player = random_player(rng)
+    player["maps"] = []
+    output = calculate_player_points(player, POINTS_FOR_WRCP)
+    assert output["wr_points"] == 0 and type(output["wr_points"]) is int